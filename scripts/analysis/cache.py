@@ -0,0 +1,154 @@
+"""
+On-disk cache of log analyses.
+
+Analysing a log means reading, collecting tests and classifying every
+line, which is by far the most expensive part of building a report.
+As most artefacts included in a report were already analysed for
+previous reports, an AnalysisCache keeps their (stripped) analyses in
+a directory, keyed by the artefact and a hash of the classifiers
+(see classifiers.registry_hash). Entries get invalidated
+automatically when either changes, and can be evicted by age or
+total size.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+
+from analysis import classifiers
+
+CACHE_SUFFIX = ".pickle"
+
+
+def artefact_id(fname, revision=None):
+    """Identifies an artefact for caching
+
+    URIs are assumed to be immutable (as GitLab job artefacts are).
+    Local files get identified by their path, size and modification
+    time.
+
+    :param fname: Name of file or URI
+    :param revision: Git revision associated with the artefact
+    :returns: String identifying the artefact
+    """
+
+    if fname.startswith("http://") or fname.startswith("https://"):
+        return f"{fname} {revision}"
+    stat = os.stat(fname)
+    return f"{os.path.abspath(fname)} {stat.st_size} {stat.st_mtime_ns} {revision}"
+
+
+class AnalysisCache:
+    """Directory of cached log analyses
+
+    :param directory: Directory to store cache entries in (created if
+       it does not exist)
+    :param verbosity: Whether to show status messages
+    """
+
+    def __init__(self, directory, verbosity=0):
+        self.directory = directory
+        self.verbosity = verbosity
+        self.hits = 0
+        self.misses = 0
+        self._classifier_hash = classifiers.registry_hash()
+        os.makedirs(directory, exist_ok=True)
+
+    def _key(self, fname, revision):
+        return json.dumps([artefact_id(fname, revision), self._classifier_hash])
+
+    def _path(self, key):
+        return os.path.join(
+            self.directory, hashlib.sha256(key.encode()).hexdigest() + CACHE_SUFFIX
+        )
+
+    def get(self, fname, revision=None):
+        """Looks up the analyses of an artefact
+
+        :param fname: Name of file or URI
+        :param revision: Git revision associated with the artefact
+        :returns: List of (name, source, origin, analysis) tuples as
+           returned by report.analyse_file(), or None if not cached
+        """
+
+        try:
+            key = self._key(fname, revision)
+            path = self._path(key)
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            if entry["key"] != key:
+                raise ValueError("key mismatch")
+        except (OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        # Note use for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        if self.verbosity > 0:
+            print(f"Using cached analysis of {fname}", flush=True)
+        return entry["results"]
+
+    def put(self, fname, results, revision=None):
+        """Stores the analyses of an artefact
+
+        :param fname: Name of file or URI
+        :param results: List of (name, source, origin, analysis) tuples,
+           see get()
+        :param revision: Git revision associated with the artefact
+        """
+
+        try:
+            key = self._key(fname, revision)
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(
+                    dict(key=key, revision=revision, results=results),
+                    f,
+                    pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not cache analysis of {fname}: {e}")
+
+    def evict(self, max_age=None, max_size=None):
+        """Removes cache entries
+
+        Entries are removed if they were not used for longer than the
+        given age, then least recently used entries until the cache
+        fits the given size.
+
+        :param max_age: Maximum time since last use (in seconds)
+        :param max_size: Maximum total size of entries (in bytes)
+        :returns: Number of entries removed
+        """
+
+        entries = []
+        for fname in os.listdir(self.directory):
+            if fname.endswith(CACHE_SUFFIX):
+                path = os.path.join(self.directory, fname)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        now = time.time()
+        total_size = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if (max_age is None or now - mtime <= max_age) and (
+                max_size is None or total_size <= max_size
+            ):
+                continue
+            os.remove(path)
+            total_size -= size
+            removed += 1
+
+        if self.verbosity > 0 and removed:
+            print(f"Evicted {removed} analyses from cache ({total_size} bytes left)")
+        return removed
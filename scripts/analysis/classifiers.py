@@ -4,14 +4,33 @@ Classification of test results as produced by collect_tests()
 The general approach here is that each classifier runs on the results
 of certain test, and matches lines in the different log sections. This
 can be used for automatically scanning for events.
+
+Whether the tests classifiers refer to still exist gets checked by
+scripts/lint_classifiers.py (see lint_classifiers). Tests found in
+files that have moved get recorded in classifiers-registry.json next
+to this module, and registered under their new path as well when the
+module gets imported. The file is only valid for the version of this
+module it was created for, so re-run the lint after changing it.
 """
 
+import bisect
+import concurrent.futures
 import datetime
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
 import pathlib
 import re
+import threading
 import time
 
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
 __all__ = ["classifiers", "classify_by_test"]
 
 
@@ -73,6 +92,277 @@ ATTR_EQUIVALENTS = {
 
 QUICKSCAN_TAGS = ["container", "pod", "level", "source", "thread", "msg"]
 
+# Default time (in s) a classifier may take on a single test (see ClassifierProfile)
+COST_BUDGET = 0.5
+
+
+class ScanCounter:
+    """Counts lines scanned and regular expressions evaluated by predicates"""
+
+    __slots__ = ("lines", "regex_calls")
+
+    def __init__(self):
+        self.lines = 0
+        self.regex_calls = 0
+
+
+scan_counter = ScanCounter()
+
+
+class ClassifierProfile:
+    """Cost statistics of classifiers
+
+    Filled in by classify_test_results(). Statistics are kept per SKB
+    code as plain dictionaries, so they can be sent between processes
+    and merged.
+
+    :param budget: Time (in s) a classifier may take on a single test
+       before we warn about it (default COST_BUDGET)
+    """
+
+    FIELDS = ["time", "max_time", "tests", "evaluated", "hits", "lines", "regex_calls"]
+
+    def __init__(self, budget=None):
+        self.budget = COST_BUDGET if budget is None else budget
+        self.stats = {}
+        self.over_budget = set()
+
+    def _get(self, skb):
+        stats = self.stats.get(skb)
+        if stats is None:
+            stats = self.stats[skb] = {field: 0 for field in self.FIELDS}
+        return stats
+
+    def skip(self, cfr):
+        """Records that a classifier was skipped for a test"""
+        self._get(cfr.skb)["tests"] += 1
+
+    def record(self, cfr, test, t, hit, lines, regex_calls):
+        """Records a classifier evaluation
+
+        :param cfr: Classifier
+        :param test: Test dictionary it was evaluated on
+        :param t: Time taken (in s)
+        :param hit: Whether the classifier matched
+        :param lines: Number of lines scanned
+        :param regex_calls: Number of regular expression evaluations
+        """
+
+        stats = self._get(cfr.skb)
+        stats["time"] += t
+        stats["max_time"] = max(stats["max_time"], t)
+        stats["tests"] += 1
+        stats["evaluated"] += 1
+        stats["hits"] += 1 if hit else 0
+        stats["lines"] += lines
+        stats["regex_calls"] += regex_calls
+
+        if t > self.budget and cfr.skb not in self.over_budget:
+            self.over_budget.add(cfr.skb)
+            print(
+                f"Classifier {cfr.skb} took {t:.2f} s on {test['file']} {test['name']} "
+                f"(budget {self.budget:g} s) - check for slow regular expressions!",
+                flush=True,
+            )
+
+    def merge(self, stats):
+        """Adds statistics from another profile (see stats)"""
+
+        for skb, other in stats.items():
+            mine = self._get(skb)
+            for field in self.FIELDS:
+                if field == "max_time":
+                    mine[field] = max(mine[field], other[field])
+                else:
+                    mine[field] += other[field]
+            if mine["max_time"] > self.budget:
+                self.over_budget.add(skb)
+
+    def to_json(self):
+        """Returns statistics with hit rates, sorted by time"""
+
+        return {
+            "budget": self.budget,
+            "classifiers": {
+                skb: {
+                    **stats,
+                    "hit_rate": stats["hits"] / stats["tests"] if stats["tests"] else 0,
+                }
+                for skb, stats in sorted(
+                    self.stats.items(), key=lambda skb_stats: -skb_stats[1]["time"]
+                )
+            },
+        }
+
+
+class QuickScanText:
+    """Messages of a test as a single string for quick scans (see match_msg)
+
+    Every message becomes a line with its index, followed by one line
+    per tag. The string only gets built once it is needed.
+
+    :param msgs: Log lines
+    :param tags: Tags to include, in QUICKSCAN_TAGS order
+    """
+
+    __slots__ = ("msgs", "tags", "_text")
+
+    def __init__(self, msgs, tags=QUICKSCAN_TAGS):
+        self.msgs = msgs
+        self.tags = tuple(tags)
+        self._text = None
+
+    def covers(self, tags):
+        return all(k in self.tags for k in tags)
+
+    def __str__(self):
+        if self._text is None:
+            self._text = "\n\n\n".join(
+                "\n".join([f"\n\n#{i}"] + [msg.get(k, "") for k in self.tags])
+                for i, msg in enumerate(self.msgs)
+            )
+        return self._text
+
+
+class SectionIndex:
+    """Indices for the lines of a test section
+
+    Has an inverted index from attribute values to lines, as well as
+    the time stamps of the lines. Both get built on first use. Missing
+    attributes are indexed as empty strings (as checked by match_msg).
+
+    :param lines: Log lines
+    """
+
+    __slots__ = ("lines", "_index", "_times")
+
+    def __init__(self, lines):
+        self.lines = lines
+        self._index = {}
+        self._times = False
+
+    def find(self, attrs):
+        """Finds lines with given attribute values
+
+        :param attrs: Dictionary of attribute names to sets of values
+        :returns: Sorted list of line indices
+        """
+
+        result = None
+        for attr, values in attrs.items():
+            index = self._index.get(attr)
+            if index is None:
+                index = self._index[attr] = {}
+                for i, l in enumerate(self.lines):
+                    index.setdefault(l.get(attr, ""), []).append(i)
+            found = set()
+            for v in values:
+                found.update(index.get(v, ()))
+            result = found if result is None else result & found
+            if not result:
+                return []
+        return sorted(result)
+
+    def times(self):
+        """Time stamps of all lines, for bisection
+
+        :returns: List of time stamps, or None if some line has no
+           time stamp or they are not sorted
+        """
+
+        if self._times is False:
+            times = [l.get("time") for l in self.lines]
+            if None in times or any(
+                times[i] > times[i + 1] for i in range(len(times) - 1)
+            ):
+                times = None
+            self._times = times
+        return self._times
+
+
+def _section_index(test, section, lines):
+    """Gets index for a test section, cached while classifying"""
+
+    indices = test.get("section_index")
+    if indices is None:
+        return SectionIndex(lines)
+    index = indices.get(section)
+    if index is None:
+        index = indices[section] = SectionIndex(lines)
+    return index
+
+
+def _get_section(test, section):
+    """Traverses test dictionary to get element containing lines (or None)"""
+
+    elem = test
+    for key in section.split("/"):
+        if key not in elem:
+            return None
+        elem = elem[key]
+    return elem
+
+
+def _expand_attrs(attrs):
+    """Converts attributes to sets (if not already), applying equivalences"""
+
+    expanded = {}
+    for k, vals in attrs.items():
+        vals_new = set()
+        for v in vals if isinstance(vals, set) else [vals]:
+            vals_new.add(v)
+            if v in ATTR_EQUIVALENTS:
+                vals_new |= ATTR_EQUIVALENTS[v]
+        expanded[k] = vals_new
+    return expanded
+
+
+# Shortest literal worth using for pre-filtering (see required_literal)
+MIN_LITERAL = 3
+
+
+def _literal_runs(pattern, runs):
+    """Collects runs of literal characters that every match contains"""
+
+    run = ""
+    for op, av in pattern:
+        if op is sre_parse.LITERAL:
+            run += chr(av)
+            continue
+        runs.append(run)
+        run = ""
+        # Groups must match as well
+        if op is sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, sub_pattern = av
+            if not add_flags & re.IGNORECASE:
+                _literal_runs(sub_pattern, runs)
+        # ... as do repeats that cannot be skipped
+        elif op is sre_parse.MAX_REPEAT or op is sre_parse.MIN_REPEAT:
+            min_count, max_count, sub_pattern = av
+            if min_count >= 1:
+                _literal_runs(sub_pattern, runs)
+    runs.append(run)
+
+
+def required_literal(regex):
+    """Finds a literal string that every match of a regular expression contains
+
+    :param regex: Regular expression (string)
+    :returns: Longest literal found, or None if there is none
+    """
+
+    try:
+        pattern = sre_parse.parse(regex)
+    except re.error:
+        return None
+    if pattern.state.flags & re.IGNORECASE:
+        return None
+    runs = []
+    _literal_runs(pattern, runs)
+    literal = max(runs, key=len)
+    return literal if len(literal) >= MIN_LITERAL else None
+
+
 # Message match predictate
 def match_msg(
     msg_r,
@@ -91,91 +381,90 @@ def match_msg(
     :param section: Section to search for message
     :param missing: Inverse predicate - trigger if message does *not* appear
     :param max_time: Must appear within given number of seconds from first message
-    :param max_count: Must appear within given number of lines
+    :param max_count: Must appear within given number of lines from first message
     :param matched: Output parameter for lines matched
     """
 
     # Compile regular expressions
     msg_rc = re.compile(msg_r)
+
+    # Literal that must appear in the section for a match (see ClassifierSet)
+    literal = None if missing else required_literal(msg_r)
+    required = [] if literal is None else [(section, literal)]
     after_msg_rc = None if after_msg_r is None else re.compile(after_msg_r)
 
     # Convert attributes to sets (if not already), applying equivalences
-    msg_attrs = dict(kwargs)
-    for attrs in [msg_attrs, after_msg_attrs]:
-        for k, vals in attrs.items():
-            vals_new = set()
-            for v in vals if isinstance(vals, set) else [vals]:
-                vals_new.add(v)
-                if v in ATTR_EQUIVALENTS:
-                    vals_new |= ATTR_EQUIVALENTS[v]
-            attrs[k] = vals_new
-
-    # Optimised version if we scanning for something in "msgs" with given attributes
+    msg_attrs = _expand_attrs(kwargs)
+    after_msg_attrs = _expand_attrs(after_msg_attrs)
+
+    # Optimised version if we scanning for something in "msgs"
     if (
         section == "msgs"
+        and not msg_attrs
         and after_msg_r is None
         and max_time is None
         and max_count is None
     ):
 
-        # Make a composed regular expression for quickly scanning the entire text
-        t = "\n\n#(?P<line>\d*)\n"
+        # Make a composed regular expression for quickly scanning the
+        # entire text. Compiled once per layout of the text.
+        quickscan_tags = ("msg",)
+        t_rcs = {}
 
-        def attr_match(k):
-            if k == "msg":
-                return msg_r
-            if k not in msg_attrs:
-                return ".*"
-            if len(msg_attrs[k]) == 1:
-                return re.escape(next(iter(msg_attrs[k])))
-            return "(" + "|".join(re.escape(v) for v in msg_attrs[k]) + ")"
-
-        t += "\n".join(attr_match(k) for k in QUICKSCAN_TAGS)
-        t_rc = re.compile(t)
-
-        # Scan
         def check(test, matched):
+            text = test.get("msgs_t")
+            if not isinstance(text, QuickScanText) or not text.covers(quickscan_tags):
+                text = QuickScanText(test["msgs"], quickscan_tags)
+            t_rc = t_rcs.get(text.tags)
+            if t_rc is None:
+                t = "\n\n#(?P<line>\d*)\n"
+                t += "\n".join(msg_r if k == "msg" else ".*" for k in text.tags)
+                t_rc = t_rcs[text.tags] = re.compile(t)
             i = 0
-            for match in t_rc.finditer(test["msgs_t"]):
+            calls = 1
+            for match in t_rc.finditer(str(text)):
                 l = test["msgs"][int(match["line"])]
-                # Recheck, just to make sure (we might be checking extra attributes)
-                if all(
-                    l.get(k, "") in v_set for k, v_set in msg_attrs.items()
-                ) and msg_rc.match(l["msg"]):
+                # Recheck, just to make sure
+                calls += 1
+                if msg_rc.match(l["msg"]):
                     i += 1
                     if matched is not None:
                         matched.append(l)
+            scan_counter.lines += len(text.msgs)
+            scan_counter.regex_calls += calls
             if missing:
                 return 0 if i > 0 else 1
             else:
                 return i
 
+        check.quickscan_tags = quickscan_tags
+        check.required = required
         return check
 
-    def check(test, matched):
-        # Traverse dictionary to get element containing lines
-        elem = test
-        for key in section.split("/"):
-            if key not in elem:
-                return missing
-            elem = elem[key]
-        i = 0
+    def check_lines(elem, matched):
         # Go through lines in section
+        i = 0
         end_time = None
         found_after = after_msg_r is None
-        for l in elem:
+        first = 0
+        for count, l in enumerate(elem):
             # Didn't find initial line yet?
             if not found_after:
                 if any(
                     l.get(k, "") not in v_set for k, v_set in after_msg_attrs.items()
                 ):
                     continue
+                scan_counter.regex_calls += 1
                 if not after_msg_rc.match(l["msg"]):
                     continue
                 found_after = True
+                first = count + 1
                 if max_time is not None and l.get("time"):
                     end_time = l["time"] + datetime.timedelta(seconds=max_time)
                 continue
+            # Stop after given number of lines
+            if max_count is not None and count >= first + max_count:
+                break
             # Note time of first message
             if max_time is not None and end_time is None and l.get("time"):
                 end_time = l["time"] + datetime.timedelta(seconds=max_time)
@@ -183,12 +472,13 @@ def match_msg(
             if max_time is not None and "time" in l and l["time"] > end_time:
                 break
             # Check whether attributes and message match
-            if all(
-                l.get(k, "") in v_set for k, v_set in msg_attrs.items()
-            ) and msg_rc.match(l["msg"]):
-                i += 1
-                if matched is not None:
-                    matched.append(l)
+            if all(l.get(k, "") in v_set for k, v_set in msg_attrs.items()):
+                scan_counter.regex_calls += 1
+                if msg_rc.match(l["msg"]):
+                    i += 1
+                    if matched is not None:
+                        matched.append(l)
+        scan_counter.lines += count + 1 if elem else 0
 
         if missing:
             # Do not trigger if "after" message was not found
@@ -197,6 +487,70 @@ def match_msg(
             return not i
         return i
 
+    def check(test, matched):
+        elem = _get_section(test, section)
+        if elem is None:
+            return missing
+        index = _section_index(test, section, elem)
+
+        # Time windows need sorted time stamps for bisection. Fall back
+        # to walking through the lines otherwise.
+        times = None
+        if max_time is not None:
+            times = index.times()
+            if times is None:
+                return check_lines(elem, matched)
+
+        # Find first "after" message
+        start = 0
+        if after_msg_r is not None:
+            anchors = index.find(after_msg_attrs) if after_msg_attrs else range(len(elem))
+            for count, start in enumerate(anchors):
+                if after_msg_rc.match(elem[start]["msg"]):
+                    break
+            else:
+                scan_counter.lines += len(anchors)
+                scan_counter.regex_calls += len(anchors)
+                return 0
+            scan_counter.lines += count + 1
+            scan_counter.regex_calls += count + 1
+            start += 1
+
+        # Determine end of time window (from "after" message, or from
+        # first message if there is none)
+        stop = len(elem)
+        if max_time is not None and start < len(elem):
+            end_time = times[start - 1 if after_msg_r is not None else 0]
+            end_time += datetime.timedelta(seconds=max_time)
+            stop = bisect.bisect_right(times, end_time, start)
+        if max_count is not None:
+            stop = min(stop, start + max_count)
+
+        # Check lines in window
+        if msg_attrs:
+            candidates = index.find(msg_attrs)
+            window = candidates[
+                bisect.bisect_left(candidates, start) : bisect.bisect_left(
+                    candidates, stop
+                )
+            ]
+        else:
+            window = range(start, stop)
+        i = 0
+        for j in window:
+            l = elem[j]
+            if msg_rc.match(l["msg"]):
+                i += 1
+                if matched is not None:
+                    matched.append(l)
+        scan_counter.lines += len(window)
+        scan_counter.regex_calls += len(window)
+
+        if missing:
+            return not i
+        return i
+
+    check.required = required
     return check
 
 
@@ -211,15 +565,202 @@ def match_and(*predicates):
                 return False
         return True
 
+    check.required = [req for p in predicates for req in getattr(p, "required", [])]
+    check.quickscan_tags = tuple(
+        k for p in predicates for k in getattr(p, "quickscan_tags", ())
+    )
     return check
 
 
+class ClassifierSet:
+    """Pre-filter for running many classifiers on a test
+
+    Predicates created by match_msg know a literal that a section of
+    the test must contain for them to match (see required_literal).
+    The literals of all classifiers get combined into a single regular
+    expression per section, so one scan per section finds all literals
+    present. Classifiers with no chance of matching can then be
+    skipped.
+
+    :param classifiers: Classifiers to check
+    """
+
+    def __init__(self, classifiers):
+        # Requirements for every predicate of every classifier (we
+        # can only skip classifiers if every predicate has some)
+        self._required = {}
+        self._sections = {}
+        self._quickscan_tags = {}
+        literals = {}
+        for cfr in classifiers:
+            self._quickscan_tags[cfr] = {
+                k for p in cfr.predicates for k in getattr(p, "quickscan_tags", ())
+            }
+            options = [getattr(p, "required", []) for p in cfr.predicates]
+            if not all(options):
+                continue
+            self._required[cfr] = [frozenset(option) for option in options]
+            self._sections[cfr] = {section for section, _ in itertools.chain(*options)}
+            for section, literal in itertools.chain(*options):
+                literals.setdefault(section, set()).add(literal)
+
+        # Longer literals first, so the longest literal starting at a
+        # position gets found. All literals that are prefixes of it
+        # must be present as well.
+        self._scanners = {}
+        for section, section_literals in literals.items():
+            ordered = sorted(section_literals, key=len, reverse=True)
+            regex = re.compile("|".join(re.escape(literal) for literal in ordered))
+            prefixes = {
+                literal: [(section, l) for l in ordered if literal.startswith(l)]
+                for literal in ordered
+            }
+            self._scanners[section] = (regex, prefixes)
+
+    def _section_text(self, test, section):
+        elem = test
+        for key in section.split("/"):
+            if key not in elem:
+                return None
+            elem = elem[key]
+        return "\n".join(l.get("msg", "") for l in elem)
+
+    def scan(self, test, sections=None):
+        """Finds literals present in the sections of a test
+
+        :param test: Test dictionary
+        :param sections: Sections to scan (default all)
+        :returns: Set of (section, literal) pairs found
+        """
+
+        found = set()
+        for section in self._scanners if sections is None else sections:
+            text = self._section_text(test, section)
+            if text is None:
+                continue
+            regex, prefixes = self._scanners[section]
+            seen = set()
+            m = regex.search(text)
+            while m:
+                literal = m.group()
+                if literal not in seen:
+                    seen.add(literal)
+                    found.update(prefixes[literal])
+                m = regex.search(text, m.start() + 1)
+        return found
+
+    def candidates(self, test, cfrs):
+        """Selects classifiers that might match a test
+
+        :param test: Test dictionary
+        :param cfrs: Classifiers to check
+        :returns: List of classifiers, in the same order
+        """
+
+        required = self._required
+        sections = set()
+        for cfr in cfrs:
+            sections.update(self._sections.get(cfr, ()))
+        found = self.scan(test, sections)
+        return [
+            cfr
+            for cfr in cfrs
+            if cfr not in required
+            or any(option <= found for option in required[cfr])
+        ]
+
+    def quickscan_tags(self, cfrs):
+        """Determines tags needed for quick scans (see QuickScanText)
+
+        :param cfrs: Classifiers that will be run
+        :returns: Tuple of tags, in QUICKSCAN_TAGS order
+        """
+
+        tags = set()
+        for cfr in cfrs:
+            tags |= self._quickscan_tags.get(cfr, set())
+        return tuple(k for k in QUICKSCAN_TAGS if k in tags)
+
+
 # Check whether a certain test file exists, possibly replace
 TEST_DIRECTORY = pathlib.Path(__file__).parent.parent.joinpath("post-deployment")
 
+# Results of lint_classifiers() get cached here, keyed by a hash of
+# this module, so importing does not need to look at the test sources
+# (see module documentation)
+REGISTRY_CACHE = pathlib.Path(__file__).parent.joinpath("classifiers-registry.json")
+
+
+def _module_hash():
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_registry_cache(cache_file=REGISTRY_CACHE):
+    """Loads test aliases found by the last lint_classifiers() run
+
+    :param cache_file: Cache file to read
+    :returns: Dictionary of test IDs to list of replacement test IDs,
+       or None if there is no cache for this version of the module
+    """
+
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache["hash"] != _module_hash():
+            return None
+        return {
+            (test_file, name): [tuple(alias) for alias in aliases]
+            for test_file, name, aliases in cache["aliases"]
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_registry_cache(aliases, cache_file=REGISTRY_CACHE):
+    """Saves test aliases for load_registry_cache()
+
+    :param aliases: Dictionary of test IDs to replacement test IDs
+    :param cache_file: Cache file to write
+    """
+
+    cache = {
+        "hash": _module_hash(),
+        "aliases": [[*test_id, aliases] for test_id, aliases in aliases.items()],
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Could not write classifier registry cache {cache_file}: {e}")
+
+
 # Classifiers - simple map of pairs for now
 classifiers = []
 classifier_by_test = {}
+_test_aliases = load_registry_cache()
+if _test_aliases is None:
+    print(
+        f"No classifier registry cache for this version of classifiers.py at "
+        f"{REGISTRY_CACHE}, tests in moved files will not be classified. "
+        "Run scripts/lint_classifiers.py to create it!"
+    )
+    _test_aliases = {}
+
+
+def registry_hash():
+    """Hash identifying the registered classifiers
+
+    Changes whenever this module or the test aliases applied from the
+    registry cache change, so it can be used to key cached
+    classification results.
+    """
+
+    aliases = sorted((test_id, tuple(ids)) for test_id, ids in _test_aliases.items())
+    return hashlib.sha256(f"{_module_hash()} {aliases!r}".encode()).hexdigest()
 
 
 def add_classifier(tests, *args, **kwargs):
@@ -227,46 +768,71 @@ def add_classifier(tests, *args, **kwargs):
     classifiers.append(cfr)
     for test_id in tests:
         assert len(test_id) == 2
-        if test_id not in classifier_by_test:
-            classifier_by_test[test_id] = []
-        classifier_by_test[test_id].append(cfr)
+        for test_id2 in [test_id, *_test_aliases.get(test_id, [])]:
+            if test_id2 not in classifier_by_test:
+                classifier_by_test[test_id2] = []
+            classifier_by_test[test_id2].append(cfr)
 
-        # Check whether test file exists
-        if test_id[1] is None:
-            continue
-        path_to_check = test_id[0]
-        if not TEST_DIRECTORY.joinpath(path_to_check).exists():
-            print(
-                f"Test file {test_id[0]} not found locally! Check {cfr.skb} classifier!"
-            )
-            fname = pathlib.Path(test_id[0]).name
-            for root, dirs, files in os.walk(TEST_DIRECTORY):
-                if fname in files:
-                    path2 = (
-                        pathlib.Path(root).relative_to(TEST_DIRECTORY).joinpath(fname)
-                    )
-                    print(
-                        f' ... speculatively replacing ("{test_id[0]}", "{test_id[1]}") by ("{path2}", "{test_id[1]}")'
-                    )
-                    path_to_check = str(path2)
-                    test_id2 = (str(path2), test_id[1])
-                    if test_id2 not in classifier_by_test:
-                        classifier_by_test[test_id2] = []
-                    classifier_by_test[test_id2].append(cfr)
-
-        if TEST_DIRECTORY.joinpath(path_to_check).exists():
-            # Check that test exists in given file
-            rc_testdef = re.compile("def " + re.escape(test_id[1]) + "\(")
-            with open(TEST_DIRECTORY.joinpath(path_to_check)) as f:
-                found = False
-                for l in f:
-                    if rc_testdef.match(l):
-                        found = True
-                        break
-            if not found:
+
+def lint_classifiers(test_directory=TEST_DIRECTORY):
+    """Checks that the tests classifiers refer to exist
+
+    Tests in files that have moved get (speculatively) registered under
+    their new path as well. As looking through the test sources takes
+    a while, this only happens here, with the replacements getting
+    cached for the next time the module gets imported.
+
+    :param test_directory: Directory with test sources
+    :returns: Number of problems found
+    """
+
+    problems = 0
+    aliases = {}
+    for cfr in classifiers:
+        for test_id in cfr.tests:
+
+            # Check whether test file exists
+            if test_id[1] is None:
+                continue
+            path_to_check = test_id[0]
+            if not test_directory.joinpath(path_to_check).exists():
+                problems += 1
                 print(
-                    f"Test {test_id[1]} not found in {path_to_check}! Check {cfr.skb} classifier!"
+                    f"Test file {test_id[0]} not found locally! Check {cfr.skb} classifier!"
                 )
+                fname = pathlib.Path(test_id[0]).name
+                for root, dirs, files in os.walk(test_directory):
+                    if fname in files:
+                        path2 = (
+                            pathlib.Path(root)
+                            .relative_to(test_directory)
+                            .joinpath(fname)
+                        )
+                        print(
+                            f' ... speculatively replacing ("{test_id[0]}", "{test_id[1]}") by ("{path2}", "{test_id[1]}")'
+                        )
+                        path_to_check = str(path2)
+                        test_aliases = aliases.setdefault(test_id, [])
+                        if (str(path2), test_id[1]) not in test_aliases:
+                            test_aliases.append((str(path2), test_id[1]))
+
+            if test_directory.joinpath(path_to_check).exists():
+                # Check that test exists in given file
+                rc_testdef = re.compile("def " + re.escape(test_id[1]) + "\\(")
+                with open(test_directory.joinpath(path_to_check)) as f:
+                    found = False
+                    for l in f:
+                        if rc_testdef.match(l):
+                            found = True
+                            break
+                if not found:
+                    problems += 1
+                    print(
+                        f"Test {test_id[1]} not found in {path_to_check}! Check {cfr.skb} classifier!"
+                    )
+
+    save_registry_cache(aliases)
+    return problems
 
 
 # Add classifiers
@@ -1381,15 +1947,175 @@ TAINT_TD = Classifier(
 classifiers += [UNKNOWN, UNKNOWN_TD, TAINT, TAINT_TD]
 
 
-def classify_test_results(test_results):
-    """Run classifiers on test results
+def _applicable_classifiers(test):
+    """Lists classifiers to run on a test"""
 
-    :param test_results: List of test dictionaries
-    :returns: List of test/cfr/matched dictionaries with triggered classifiers,
-       in the order they were matched
+    cfrs = list(classifier_by_test.get((test["file"], test["name"]), []))
+    cfrs += classifier_by_test.get((None, None), [])
+    return cfrs
+
+
+def _prepare_test(test, cfrs, cfr_set, profile):
+    """Sets up a test for running classifiers on it
+
+    :returns: Classifiers that can possibly match
     """
 
-    matches = []
+    # Skip classifiers that cannot match (one scan per section)
+    candidates = cfr_set.candidates(test, cfrs)
+    if profile is not None and len(candidates) < len(cfrs):
+        for cfr in set(cfrs) - set(candidates):
+            profile.skip(cfr)
+
+    # Messages as a single string for quick scan (see match_msg),
+    # built on first use with only the tags needed
+    test["msgs_t"] = QuickScanText(test["msgs"], cfr_set.quickscan_tags(candidates))
+    test["section_index"] = {}
+    return candidates
+
+
+def _release_test(test):
+    del test["msgs_t"]
+    del test["section_index"]
+
+
+def _run_classifier(cfr, test, profile, cfr_time):
+    """Runs a classifier on a test
+
+    :returns: List of matched lines, or None if it did not match
+    """
+
+    matched = []
+    s = time.time()
+    lines, regex_calls = scan_counter.lines, scan_counter.regex_calls
+    hit = cfr(test, matched) > 0
+    t = time.time() - s
+    cfr_time[cfr.skb] += t
+    if profile is not None:
+        profile.record(
+            cfr,
+            test,
+            t,
+            hit,
+            scan_counter.lines - lines,
+            scan_counter.regex_calls - regex_calls,
+        )
+    return matched if hit else None
+
+
+# Log and tests to classify in worker processes. Set before the
+# workers get forked, so they do not need to be sent (see
+# _classify_parallel).
+_worker_log = None
+_worker_tests = None
+
+
+def _classify_chunk(args):
+    """Runs all classifiers on a range of tests (in a worker process)
+
+    :returns: For every test a list of (classifier index, matched line
+       indices) for every classifier that matched, as well as statistics
+       (see ClassifierProfile.stats)
+    """
+
+    from analysis import logtable  # (pulls in kubernetes, so only when needed)
+
+    start, stop, budget = args
+    cfr_set = ClassifierSet(classifiers)
+    cfr_index = {cfr: i for i, cfr in enumerate(classifiers)}
+    cfr_time = {cfr.skb: 0 for cfr in classifiers}
+    profile = ClassifierProfile(budget)
+
+    # Identify lines by their index in the log
+    if isinstance(_worker_log, logtable.LogTable):
+        line_index = lambda line: line.index
+    else:
+        line_ids = {id(line): i for i, line in enumerate(_worker_log)}
+        line_index = lambda line: line_ids[id(line)]
+
+    results = []
+    for test in _worker_tests[start:stop]:
+        hits = []
+        for cfr in _prepare_test(test, _applicable_classifiers(test), cfr_set, profile):
+            matched = _run_classifier(cfr, test, profile, cfr_time)
+            if matched is not None:
+                hits.append((cfr_index[cfr], [line_index(line) for line in matched]))
+        _release_test(test)
+        results.append(hits)
+    return results, profile.stats
+
+
+def _classify_parallel(test_results, log, jobs, profile, cfr_time):
+    """Runs all classifiers on all tests using worker processes
+
+    Which triggers get generated depends on the order of tests (see
+    iter_classify_test_results), so this only finds out which
+    classifiers match.
+
+    :returns: For every test a dictionary of lines matched by every
+       classifier that matched
+    """
+
+    global _worker_log, _worker_tests
+    chunk_size = max(1, len(test_results) // (jobs * 4))
+    chunks = [
+        (
+            start,
+            min(start + chunk_size, len(test_results)),
+            None if profile is None else profile.budget,
+        )
+        for start in range(0, len(test_results), chunk_size)
+    ]
+    _worker_log, _worker_tests = log, test_results
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            jobs, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            chunk_results = list(executor.map(_classify_chunk, chunks))
+    finally:
+        _worker_log, _worker_tests = None, None
+
+    hits = []
+    for results, stats in chunk_results:
+        for skb, skb_stats in stats.items():
+            cfr_time[skb] += skb_stats["time"]
+        if profile is not None:
+            profile.merge(stats)
+        for test_hits in results:
+            hits.append(
+                {
+                    classifiers[i]: [log[j] for j in line_indices]
+                    for i, line_indices in test_hits
+                }
+            )
+    return hits
+
+
+def iter_classify_test_results(test_results, profile=None, log=None, jobs=1):
+    """Run classifiers on test results as they come in
+
+    Every test gets classified as soon as it is produced, so this can
+    be used with tests.iter_tests() to flag known issues while a test
+    run is still going on. Note that classifiers looking at detailed
+    reports ('detail/...' sections) can only match if the detail has
+    been attached to the test by the time it gets classified.
+
+    With multiple jobs, classifiers get run on all tests in worker
+    processes first, and triggers get generated from their results
+    afterwards. This needs all tests up-front, as well as the log
+    they were collected from. Only supported where processes can be
+    forked, otherwise tests get classified one by one. The same
+    happens while other threads are running (say, downloads in
+    Report.add_uris), as forking a multi-threaded process can leave
+    locks held by other threads locked forever in the workers.
+
+    :param test_results: Iterable of test dictionaries
+    :param profile: ClassifierProfile to record costs in
+    :param log: Log lines (or LogTable) tests were collected from
+    :param jobs: Number of worker processes
+    :returns: Iterator over test/cfr/matched dictionaries with triggered
+       classifiers, in the order they were matched
+    """
 
     # Walk through tests
     tainted = False
@@ -1398,33 +2124,43 @@ def classify_test_results(test_results):
     skbs_suppressed = set()
     start_time = time.time()
     cfr_time = {cfr.skb: 0 for cfr in classifiers}
-    for test in test_results:
+    cfr_set = ClassifierSet(classifiers)
+    all_hits = None
+    if (
+        jobs > 1
+        and log is not None
+        and "fork" in multiprocessing.get_all_start_methods()
+        and threading.active_count() == 1
+    ):
+        test_results = list(test_results)
+        all_hits = _classify_parallel(test_results, log, jobs, profile, cfr_time)
+    for n, test in enumerate(test_results):
 
         # Check whether we can match it to a classifier
-        cfrs = list(classifier_by_test.get((test["file"], test["name"]), []))
-        cfrs += classifier_by_test.get((None, None), [])
-        cfrs = [cfr for cfr in cfrs if not cfr.only_once or cfr.skb not in skbs_shown]
-
-        # Make messages into a single string for quick scan (see match_msg)
-        test["msgs_t"] = "\n\n\n".join(
-            "\n".join([f"\n\n#{i}"] + [msg.get(k, "") for k in QUICKSCAN_TAGS])
-            for i, msg in enumerate(test["msgs"])
-        )
+        cfrs = [
+            cfr
+            for cfr in _applicable_classifiers(test)
+            if not cfr.only_once or cfr.skb not in skbs_shown
+        ]
+        if all_hits is None:
+            cfrs = _prepare_test(test, cfrs, cfr_set, profile)
 
         found_classifier = False
         for cfr in cfrs:
-            matched = []
             if cfr.only_once and cfr.skb in skbs_shown:
                 continue
-            s = time.time()
-            if cfr(test, matched) > 0:
+            if all_hits is None:
+                matched = _run_classifier(cfr, test, profile, cfr_time)
+            else:
+                matched = all_hits[n].get(cfr)
+            if matched is not None:
 
                 # Decide whether to generate a new trigger
                 if not cfr.skb in skbs_suppressed and (
                     not cfr.only_once or cfr.skb not in skbs_shown
                 ):
 
-                    matches.append({"test": test, "cfr": cfr, "matched": matched})
+                    yield {"test": test, "cfr": cfr, "matched": matched}
                     skbs_shown.add(cfr.skb)
 
                 # Update state - do we see this as a possible cause
@@ -1436,7 +2172,8 @@ def classify_test_results(test_results):
                 # Check whether this is meant to suppress other messages
                 for skb in cfr.suppresses:
                     skbs_suppressed.add(skb)
-            cfr_time[cfr.skb] += time.time() - s
+        if all_hits is None:
+            _release_test(test)
 
         if not found_classifier:
             if (
@@ -1454,9 +2191,9 @@ def classify_test_results(test_results):
                 matched = matched + test.get("msgs", [])[-1:]
 
                 if tainted:
-                    matches.append({"test": test, "cfr": TAINT, "matched": matched})
+                    yield {"test": test, "cfr": TAINT, "matched": matched}
                 else:
-                    matches.append({"test": test, "cfr": UNKNOWN, "matched": matched})
+                    yield {"test": test, "cfr": UNKNOWN, "matched": matched}
             if test.get("teardown_status") in ["ERROR"]:
 
                 # See above
@@ -1467,11 +2204,9 @@ def classify_test_results(test_results):
                 matched = matched + test.get("msgs", [])[-1:]
 
                 if tainted:
-                    matches.append({"test": test, "cfr": TAINT_TD, "matched": matched})
+                    yield {"test": test, "cfr": TAINT_TD, "matched": matched}
                 else:
-                    matches.append(
-                        {"test": test, "cfr": UNKNOWN_TD, "matched": matched}
-                    )
+                    yield {"test": test, "cfr": UNKNOWN_TD, "matched": matched}
 
     # Show some timing statistics
     cfr_times = ", ".join(
@@ -1484,4 +2219,18 @@ def classify_test_results(test_results):
         f"Classifiers evaluated in {time.time()-start_time:.2f} s ({cfr_times})",
         flush=True,
     )
-    return matches
+
+
+def classify_test_results(test_results, profile=None, log=None, jobs=1):
+    """Run classifiers on test results
+
+    :param test_results: List of test dictionaries
+    :param profile: ClassifierProfile to record costs in
+    :param log: Log lines (or LogTable) tests were collected from.
+       Required for classifying in parallel.
+    :param jobs: Number of worker processes
+    :returns: List of test/cfr/matched dictionaries with triggered classifiers,
+       in the order they were matched
+    """
+
+    return list(iter_classify_test_results(test_results, profile, log, jobs))
@@ -0,0 +1,378 @@
+"""
+Random access to large JSON lines log dumps.
+
+Reading a dump with logs.collect_file() means parsing every single
+line, even if we are only interested in a short time window, a few
+pods or a single test. An IndexedDump instead memory-maps the dump and
+keeps a sidecar index (stored next to the dump as <dump>.idx) with the
+start offset, time stamp and pod of every line, as well as the
+positions of all test runner lines. Queries then only need to parse
+the lines they actually return.
+
+The index gets rebuilt automatically if the dump changes. Only plain
+JSON lines dumps are supported - chunked dumps (see
+logs.write_chunked_dump) have their own index.
+"""
+
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import time
+
+from analysis import logs, logtable, tests
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"SKALIDX\n"
+INDEX_HEADER = struct.Struct("<Q")
+
+# Sections of the index file: name, type code and item size. Ordered
+# by item size, so every section stays aligned.
+INDEX_SECTIONS = [
+    ("offsets", "Q", 8),
+    ("times", "q", 8),
+    ("runner", "I", 4),
+    ("pod_codes", "H", 2),
+]
+
+
+def _pad(length, alignment=8):
+    return -length % alignment
+
+
+class IndexedDump:
+    """Memory-mapped JSON lines dump with line index
+
+    :param filename: Name of dump file
+    :param verbosity: Whether to show status messages
+    :param index_filename: Where to cache the index (default
+       filename + ".idx"). The index is kept in memory only if it
+       cannot be written.
+    :raises ValueError: If the file is a chunked dump
+    """
+
+    def __init__(self, filename, verbosity=0, index_filename=None):
+        self.filename = filename
+        self.verbosity = verbosity
+        self.index_filename = index_filename or filename + INDEX_SUFFIX
+        self._file = open(filename, "rb")
+        if self._file.read(len(logs.CHUNKED_MAGIC)) == logs.CHUNKED_MAGIC:
+            self._file.close()
+            raise ValueError(f"{filename} is a chunked dump!")
+        stat = os.fstat(self._file.fileno())
+        self._stamp = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if stat.st_size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b""
+        self._index_file = None
+        self._index_map = None
+        if not self._load_index():
+            self._build_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Views must be released before the maps can be closed
+        for name, _, _ in INDEX_SECTIONS:
+            column = getattr(self, "_" + name, None)
+            if isinstance(column, memoryview):
+                column.release()
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_file.close()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _load_index(self):
+        """Maps the sidecar index, if it exists and matches the dump"""
+
+        try:
+            f = open(self.index_filename, "rb")
+        except OSError:
+            return False
+        try:
+            index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            f.close()
+            return False
+
+        try:
+            if index_map[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+                raise ValueError("bad magic")
+            pos = len(INDEX_MAGIC)
+            (header_len,) = INDEX_HEADER.unpack_from(index_map, pos)
+            pos += INDEX_HEADER.size
+            header = json.loads(index_map[pos : pos + header_len])
+            if (
+                header["size"] != self._stamp["size"]
+                or header["mtime_ns"] != self._stamp["mtime_ns"]
+            ):
+                raise ValueError("index out of date")
+            pos += header_len + _pad(header_len)
+
+            view = memoryview(index_map)
+            columns = {}
+            for name, typecode, size in INDEX_SECTIONS:
+                length = header["lengths"][name] * size
+                if pos + length > len(index_map):
+                    raise ValueError("index truncated")
+                columns[name] = view[pos : pos + length].cast(typecode)
+                pos += length + _pad(length)
+        except (ValueError, KeyError, struct.error):
+            index_map.close()
+            f.close()
+            return False
+
+        self._index_file = f
+        self._index_map = index_map
+        self._pod_names = [None] + header["pods"]
+        self._sorted = header["sorted"]
+        for name, column in columns.items():
+            setattr(self, "_" + name, column)
+        return True
+
+    def _build_index(self):
+        """Scans the dump and writes the sidecar index"""
+
+        t = time.time()
+        if self.verbosity > 0:
+            print(f"Indexing {self.filename}...", flush=True)
+
+        offsets = array.array("Q")
+        pod_codes = array.array("H")
+        runner = array.array("I")
+        pod_names = [None]
+        code_by_pod = {}
+        dates = []
+        date_lines = []
+
+        data = self._map
+        pos = 0
+        while pos < len(data):
+            end = data.find(b"\n", pos)
+            if end < 0:
+                end = len(data)
+            line = logs.decode_json_line(data[pos:end].rstrip(b"\r"))
+            if line is not None:
+                if "time" in line:
+                    date_lines.append(len(offsets))
+                    dates.append(line["time"])
+                pod = line.get("pod")
+                if pod is None:
+                    pod_codes.append(0)
+                else:
+                    code = code_by_pod.get(pod)
+                    if code is None:
+                        code = code_by_pod[pod] = len(pod_names)
+                        pod_names.append(pod)
+                    pod_codes.append(code)
+                if tests.is_test_runner(line):
+                    runner.append(len(offsets))
+                offsets.append(pos)
+            pos = end + 1
+
+        times = array.array("q", [logtable.NO_TIME]) * len(offsets)
+        for i, time_ns in zip(date_lines, logs.parse_dates_ns(dates)):
+            times[i] = time_ns
+
+        self._offsets = offsets
+        self._times = times
+        self._runner = runner
+        self._pod_codes = pod_codes
+        self._pod_names = pod_names
+        self._sorted = len(date_lines) == len(offsets) and all(
+            times[i] <= times[i + 1] for i in range(len(times) - 1)
+        )
+        self._write_index()
+
+        if self.verbosity > 0:
+            print(
+                f"  ... {len(offsets)} lines indexed ({time.time() - t:.2f} s)",
+                flush=True,
+            )
+
+    def _write_index(self):
+        header = json.dumps(
+            {
+                **self._stamp,
+                "pods": self._pod_names[1:],
+                "sorted": self._sorted,
+                "lengths": {
+                    name: len(getattr(self, "_" + name)) for name, _, _ in INDEX_SECTIONS
+                },
+            }
+        ).encode()
+
+        tmp_filename = self.index_filename + ".tmp"
+        try:
+            with open(tmp_filename, "wb") as f:
+                f.write(INDEX_MAGIC)
+                f.write(INDEX_HEADER.pack(len(header)))
+                f.write(header + bytes(_pad(len(header))))
+                for name, _, _ in INDEX_SECTIONS:
+                    data = getattr(self, "_" + name).tobytes()
+                    f.write(data + bytes(_pad(len(data))))
+            os.replace(tmp_filename, self.index_filename)
+        except OSError as e:
+            if self.verbosity > 0:
+                print(f"  ... could not write index {self.index_filename}: {e}")
+
+    def line(self, i, parse_time=True):
+        """Parses a single line
+
+        :param i: Index of line
+        :param parse_time: Parse time stamp into datetime
+        """
+
+        start = self._offsets[i]
+        end = self._map.find(b"\n", start)
+        if end < 0:
+            end = len(self._map)
+        line = logs.decode_json_line(self._map[start:end].rstrip(b"\r"))
+        if parse_time and "time" in line:
+            line["time"] = logs.parse_date(line["time"])
+        return line
+
+    def lines(self, indices=None, parse_time=True):
+        """Parses lines
+
+        :param indices: Indices of lines, in order (default all)
+        :param parse_time: Parse time stamps into datetime
+        :returns: Iterator over log lines
+        """
+
+        if indices is None:
+            indices = range(len(self))
+        for i in indices:
+            yield self.line(i, parse_time)
+
+    def window(self, start=None, end=None):
+        """Selects lines within a time window
+
+        Lines without time stamp are always included (same as
+        logs.iter_file).
+
+        :param start: Only lines with at least this time
+        :param end: Only lines before this time
+        :returns: Indices of lines
+        """
+
+        start_ns = logtable.NO_TIME if start is None else logs.time_to_ns(start)
+        end_ns = None if end is None else logs.time_to_ns(end)
+        if self._sorted:
+            lo = 0 if start is None else bisect.bisect_left(self._times, start_ns)
+            hi = len(self) if end is None else bisect.bisect_left(self._times, end_ns, lo)
+            return range(lo, hi)
+        return [
+            i
+            for i, time_ns in enumerate(self._times)
+            if time_ns == logtable.NO_TIME
+            or (time_ns >= start_ns and (end_ns is None or time_ns < end_ns))
+        ]
+
+    def pod_lines(self, pods, indices=None):
+        """Selects lines from the given pods
+
+        :param pods: Pod name or set of pod names
+        :param indices: Only consider these lines (e.g. from window())
+        :returns: Indices of lines
+        """
+
+        pods = pods if isinstance(pods, set) else {pods}
+        codes = {code for code, pod in enumerate(self._pod_names) if pod in pods}
+        if indices is None:
+            indices = range(len(self))
+        return [i for i in indices if self._pod_codes[i] in codes]
+
+    def test_lines(self, name):
+        """Selects lines required to collect the results of a test
+
+        The result contains all test runner lines, so
+        tests.collect_tests() will process the selection in the same
+        way as the full log. Other lines only get included around the
+        places where the test starts and where it gets reported on in
+        detail.
+
+        :param name: Name of test (without parameters)
+        :returns: Indices of lines
+        """
+
+        runner = list(self._runner)
+        msgs = [self.line(i, parse_time=False).get("msg", "") for i in runner]
+
+        # Skip initialisation, see tests.collect_tests
+        for k, msg in enumerate(msgs):
+            if tests.session_start_re.match(msg):
+                break
+        else:
+            return runner
+        ranges = []
+
+        for k in range(k + 1, len(runner)):
+            # Test start: Include lines back to the previous test end
+            # (or empty line) up to its teardown
+            m = tests.test_start_re.match(msgs[k])
+            if m and m["name"] == name:
+                start = 0
+                for j in range(k - 1, -1, -1):
+                    if not msgs[j] or tests.test_end_re.search(msgs[j]):
+                        start = runner[j] + 1
+                        break
+                end = next_start = len(self)
+                for j in range(k, len(runner)):
+                    if tests.test_end_re.search(msgs[j]):
+                        break
+                for j in range(j + 1, len(runner)):
+                    if not msgs[j]:
+                        end = runner[j] + 2
+                        break
+                for j in range(k + 1, len(runner)):
+                    if tests.test_start_re.match(msgs[j]):
+                        next_start = runner[j] + 1
+                        break
+                ranges.append((start, max(end, next_start)))
+
+            # Detailed report: Include lines up to the next report
+            m = tests.report_start_re.match(msgs[k])
+            if m and m["name"] == name:
+                end = len(self)
+                for j in range(k + 1, len(runner)):
+                    if (
+                        tests.report_start_re.match(msgs[j])
+                        or tests.test_error_report_re.match(msgs[j])
+                        or tests.end_re.match(msgs[j])
+                    ):
+                        end = runner[j] + 1
+                        break
+                ranges.append((runner[k], end))
+
+        # Lines following test ends and empty lines decide whether
+        # there is a teardown, so we need them for every test
+        selected = set(runner)
+        for j, msg in enumerate(msgs):
+            if (not msg or tests.test_end_re.search(msg)) and runner[j] + 1 < len(self):
+                selected.add(runner[j] + 1)
+        for start, end in ranges:
+            selected.update(range(start, min(end, len(self))))
+        return sorted(selected)
+
+    def collect_test(self, name):
+        """Collects results for a test, see tests.collect_tests
+
+        :param name: Name of test (without parameters)
+        :returns: List of test dictionaries (one per parameter / run)
+        """
+
+        lines = list(self.lines(self.test_lines(name)))
+        return [test for test in tests.collect_tests(lines) if test["name"] == name]
@@ -3,9 +3,19 @@ Functions for reading logs and events out of Kubernetes, as well
 as (de)serialisation as JSON files.
 """
 
+import concurrent.futures
 import datetime
+import fnmatch
+import functools
+import gzip
+import heapq
+import io
+import itertools
 import json
+import math
 import re
+import struct
+import sys
 import time
 from datetime import timedelta, timezone
 
@@ -13,6 +23,14 @@ try:
     import orjson
 except:
     orjson = json
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 import kubernetes
 
@@ -25,15 +43,129 @@ ska_re = re.compile(
 )
 
 # Standard datetime parsing tools
+@functools.lru_cache(maxsize=16384)
+def _parse_date_seconds(date_seconds):
+    dt = datetime.datetime.strptime(date_seconds, "%Y-%m-%dT%H:%M:%S")
+    return dt.replace(tzinfo=timezone.utc)
+
+
+@functools.lru_cache(maxsize=16384)
+def _parse_date_seconds_ns(date_seconds):
+    return time_to_ns(_parse_date_seconds(date_seconds))
+
+
+# Time stamps NumPy can convert the same way as parse_date_ns(): Fixed
+# format with 1-6 fractional digits (as strptime's "%f" accepts them),
+# in years where nanoseconds since epoch fit into 64 bits
+_NUMPY_DATE_RE = re.compile(
+    r"(?:19|20|21)\d\d-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{1,6}", re.ASCII
+)
+
+
+def _is_fast_date(date):
+    fraction = date[20:]
+    return (
+        20 < len(date) <= 26
+        and date[19] == "."
+        and fraction.isdigit()
+        and fraction.isascii()
+    )
+
+
 def parse_date(date):
+    """Parses a time stamp as rendered by Kubernetes or render_date()
+
+    Log lines come in at a much higher rate than seconds pass, so
+    we only parse the "%Y-%m-%dT%H:%M:%S" prefix using strptime
+    (caching the result) and add the fractional part separately.
+    """
+
+    if _is_fast_date(date):
+        return _parse_date_seconds(date[:19]).replace(
+            microsecond=int(date[20:].ljust(6, "0"))
+        )
     dt = datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%f")
     return dt.replace(tzinfo=timezone.utc)
 
 
+def parse_date_ns(date):
+    """Parses a time stamp (see parse_date) into nanoseconds since epoch"""
+
+    if _is_fast_date(date):
+        return _parse_date_seconds_ns(date[:19]) + int(date[20:].ljust(9, "0"))
+    return time_to_ns(parse_date(date))
+
+
+def parse_dates_ns(dates):
+    """Parses a list of time stamps into nanoseconds since epoch
+
+    Uses a vectorised conversion if NumPy is available.
+
+    :param dates: List of time stamps (see parse_date)
+    :returns: List of integers
+    """
+
+    # (NumPy accepts more formats, so only use it if all time stamps
+    # are in the format parse_date() expects)
+    if numpy is not None and all(map(_NUMPY_DATE_RE.fullmatch, dates)):
+        try:
+            return numpy.array(dates, dtype="datetime64[ns]").astype("int64").tolist()
+        except ValueError:
+            # Fall back to parse individually
+            pass
+    return [parse_date_ns(date) for date in dates]
+
+
 def render_date(dt):
     return dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
 
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def time_to_ns(dt):
+    """Converts a datetime into nanoseconds since epoch"""
+    return (dt - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
+def ns_to_time(ns):
+    """Converts nanoseconds since epoch into a datetime"""
+    return EPOCH + datetime.timedelta(microseconds=ns // 1000)
+
+
+class FrozenTags(dict):
+    """Tags of a log line (see parse_tags)
+
+    The same object is shared between all lines with the same tags, so
+    it must not be modified.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Log line tags are shared and cannot be modified")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (FrozenTags, (dict(self),))
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_tags(ska_tags):
+    """Parses tags of a SKA format log line
+
+    The same tags appear on many lines, so results get cached.
+
+    :param ska_tags: Tags as comma-separated "name:value" pairs
+    :returns: FrozenTags mapping names to values (or None)
+    """
+
+    return FrozenTags(
+        (sys.intern(name_val[0]), name_val[1] if len(name_val) > 1 else None)
+        for name_val in [tag.split(":") for tag in ska_tags.split(",")]
+    )
+
+
 SAME_ATTRS_THRESHOLD = datetime.timedelta(milliseconds=0.1)
 ERROR_TIMESTAMP = datetime.datetime(year=1970, month=1, day=1, tzinfo=datetime.timezone.utc)
 
@@ -63,13 +195,10 @@ def parse_log_line(line: str, attrs: dict, previous: dict) -> dict:
     if m:
         out["ska_time"] = m["ska_time"]
         out["level"] = m["ska_level"]
-        out["thread"] = m["ska_thread"]
-        out["function"] = m["ska_function"]
-        out["source"] = m["ska_source"]
-        out["tags"] = {
-            name_val[0]: name_val[1] if len(name_val) > 1 else None
-            for name_val in [tag.split(":") for tag in m["ska_tags"].split(",")]
-        }
+        out["thread"] = sys.intern(m["ska_thread"])
+        out["function"] = sys.intern(m["ska_function"])
+        out["source"] = sys.intern(m["ska_source"])
+        out["tags"] = parse_tags(m["ska_tags"])
         line = m["msg"]
 
     # If a line without SKA-specific annotations follows one with
@@ -100,13 +229,68 @@ def aggregate_status(dct, statuses):
             statuses[dct["level"]] += 1
 
 
-def collect_pod_logs(api, namespace):
-    ret = api.list_namespaced_pod(namespace, watch=False)
-    lines = []
-    print(f"Obtaining logs from {len(ret.items)} pods on namespace {namespace}...")
-    for pod in ret.items:
+def _read_container_log(
+    api, namespace, pod_name, container_name, previous, since_seconds=None
+):
+    """Reads the log of a single container
+
+    :param since_seconds: Only return lines from given number of seconds ago
+    :returns: Log as a string, or None if it is not available
+    """
+
+    kwargs = {}
+    if since_seconds is not None:
+        kwargs["since_seconds"] = since_seconds
+    try:
+        return api.read_namespaced_pod_log(
+            pod_name,
+            namespace,
+            previous=previous,
+            container=container_name,
+            timestamps=True,
+            **kwargs,
+        )
+    except kubernetes.client.rest.ApiException as e:
+
+        # Try to parse as JSON to figure out whether
+        # something strange happened. As we are
+        # speculatively asking for previous containers,
+        # 'not found' errors are quite expected
+        try:
+            message = json.loads(e.body)["message"]
+        except (TypeError, ValueError, KeyError):
+            message = str(e)
+        if not message.endswith("not found"):
+            print(
+                f"While querying logs for pod {pod_name} container {container_name}: {e}"
+            )
+        return None
+
+
+def _iter_container_logs(
+    api, namespace, pods, concurrency=1, pod_stats=None, cursors=None, log_filter=None
+):
+    """Retrieves logs of all containers of the given pods
+
+    Up to the given number of requests get issued concurrently, but
+    logs are returned in the same order as if they were retrieved
+    one after another.
+
+    :param concurrency: Maximum number of requests to issue at the same time
+    :param pod_stats: Output parameter for retrieval statistics per pod
+    :param cursors: Only request logs after the cursors (see load_cursors)
+    :param log_filter: Only request logs of matching pods and containers,
+      and within its time window (see LogFilter)
+    :returns: Iterator over (pod name, line attributes, log) tuples
+    """
+
+    # Collect logs to request
+    requests = []
+    for pod in pods:
 
         podName = pod.metadata.name
+        if log_filter is not None and not log_filter.match_pod(podName):
+            continue
 
         # Collect containers
         containers = []
@@ -115,59 +299,324 @@ def collect_pod_logs(api, namespace):
         if pod.spec.containers is not None:
             containers += pod.spec.containers
 
-        # Loop through them to collect logs
-        statuses = {}
         for container in containers:
-            containerName = container.name
-
+            if log_filter is not None and not log_filter.match_container(
+                container.name
+            ):
+                continue
             for previous in [True, False]:
-                try:
-                    logs = api.read_namespaced_pod_log(
-                        podName,
-                        namespace,
-                        previous=previous,
-                        container=containerName,
-                        timestamps=True,
-                    )
-                except kubernetes.client.rest.ApiException as e:
-
-                    # Try to parse as JSON to figure out whether
-                    # something strange happened. As we are
-                    # speculatively asking for previous containers,
-                    # 'not found' errors are quite expected
-                    body = json.loads(e.body)
-                    if not body["message"].endswith("not found"):
-                        print(
-                            f"While querying logs for pod {podName} container {containerName}: {e}"
-                        )
+                requests.append((podName, container.name, previous))
+
+    def read(request):
+        start = time.time()
+        since_seconds = None
+        if cursors is not None:
+            since_seconds = _since_seconds(cursors.get(cursor_key(namespace, *request)))
+        if log_filter is not None and log_filter.start is not None:
+            since_seconds = min(
+                filter(None, [since_seconds, log_filter.since_seconds()])
+            )
+        logs = _read_container_log(api, namespace, *request, since_seconds)
+        return request, logs, time.time() - start
+
+    with concurrent.futures.ThreadPoolExecutor(max(1, concurrency)) as executor:
+        for (podName, containerName, previous), logs, duration in executor.map(
+            read, requests
+        ):
+
+            # Note statistics
+            if pod_stats is not None:
+                if podName not in pod_stats:
+                    pod_stats[podName] = {"requests": 0, "time": 0, "bytes": 0}
+                pod_stats[podName]["requests"] += 1
+                pod_stats[podName]["time"] += duration
+                pod_stats[podName]["bytes"] += 0 if logs is None else len(logs)
+
+            if logs is None:
+                continue
+            attrs = {
+                "pod": podName,
+                "container": containerName,
+                "previous": previous,
+                "namespace": namespace,
+            }
+            yield podName, attrs, logs
+
+
+def iter_log_lines(logs, attrs, cursors=None, log_filter=None):
+    """Lazily parses the log of a single container
+
+    :param logs: Log as returned by Kubernetes (with timestamps)
+    :param attrs: Attributes to add to every line
+    :param cursors: Skip lines up to the container's cursor, and move it
+      forward once all lines have been returned (see load_cursors)
+    :param log_filter: Only return lines within the filter's time window
+      and level (see LogFilter)
+    :returns: Iterator over parsed log lines
+    """
+
+    key = cursor = last_time = None
+    if cursors is not None:
+        key = cursor_key(
+            attrs["namespace"], attrs["pod"], attrs["container"], attrs["previous"]
+        )
+        cursor = cursors.get(key)
+    line_dict = {}
+    # Last line skipped because of its level - lines continuing it get
+    # skipped as well (see parse_log_line)
+    skipped, skipped_time = None, None
+    for line in logs.splitlines():
+        if len(line) > 0:
+
+            # Check level before parsing
+            if log_filter is not None and log_filter.min_level is not None:
+                level = _peek_level(line)
+                if level is not None:
+                    skipped = None
+                    if not log_filter.match_level(level):
+                        skipped, skipped_time = line, None
+                        continue
+                elif skipped is not None:
+                    if skipped_time is None:
+                        skipped_time = _peek_time(skipped)
+                    line_time = _peek_time(line)
+                    if (
+                        line_time is None
+                        or skipped_time is None
+                        or line_time - skipped_time < SAME_ATTRS_THRESHOLD
+                    ):
+                        skipped, skipped_time = line, line_time or skipped_time
+                        continue
+                    skipped = None
+
+            line_dict = parse_log_line(line, attrs, line_dict)
+            assert line_dict["time"] is not None
+            if log_filter is not None:
+                if log_filter.start is not None and line_dict["time"] < log_filter.start:
+                    continue
+                if log_filter.end is not None and line_dict["time"] >= log_filter.end:
+                    break
+            if key is not None:
+                if cursor is not None and line_dict["time"] <= cursor:
                     continue
-                attrs = {
-                    "pod": podName,
-                    "container": containerName,
-                    "previous": previous,
-                    "namespace": namespace,
-                }
-                line_dict = {}
-                for line in logs.splitlines():
-                    if len(line) > 0:
-
-                        # Add line to list
-                        line_dict = parse_log_line(line, attrs, line_dict)
-                        assert(line_dict['time'] is not None)
-                        lines.append(line_dict)
-                        aggregate_status(line_dict, statuses)
+                if last_time is None or line_dict["time"] > last_time:
+                    last_time = line_dict["time"]
+            yield line_dict
+
+    if last_time is not None:
+        cursors[key] = last_time
+
+
+# Safety margin for clock differences when requesting logs since a cursor
+CURSOR_MARGIN = 60
+
+
+def cursor_key(namespace, pod, container, previous):
+    """Identifies a log stream for cursors (see load_cursors)"""
+    return f"{namespace}/{pod}/{container}/{'previous' if previous else 'current'}"
+
+
+def load_cursors(filename):
+    """Loads log cursors from a file
+
+    Cursors note the time of the last line we have seen for every
+    log stream, i.e. (pod, container, previous) - and the events of
+    a namespace. Passing them to the log collection functions will
+    skip every line we have already seen, and update them with the
+    lines read.
+
+    :param filename: JSON file to load from
+    :returns: Dictionary of cursors (empty if the file does not exist)
+    """
+
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            return {key: parse_date(date) for key, date in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def save_cursors(filename, cursors):
+    """Saves log cursors to a file (see load_cursors)"""
+
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({key: render_date(dt) for key, dt in cursors.items()}, f, indent=1)
 
+
+def _since_seconds(cursor):
+    """Determines seconds to request from Kubernetes to cover a cursor"""
+
+    if cursor is None:
+        return None
+    since = datetime.datetime.now(timezone.utc) - cursor
+    return max(1, math.ceil(since.total_seconds()) + CURSOR_MARGIN)
+
+
+# Order of SKA log levels, for filtering by minimum level
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50, "FATAL": 50}
+
+
+class LogFilter:
+    """Selects log lines to collect
+
+    Pod and container filters get applied before requesting logs, and
+    the time window is used to limit the logs requested. Level
+    filters get checked before a line is fully parsed.
+
+    :param pods: Glob patterns for pod names to include (default all)
+    :param containers: Glob patterns for container names to include (default all)
+    :param start: Only lines with at least this time
+    :param end: Only lines before this time
+    :param min_level: Only lines with at least this level (see LEVELS).
+      Lines with unknown or no level are kept.
+    """
+
+    def __init__(self, pods=None, containers=None, start=None, end=None, min_level=None):
+        self.pods = pods
+        self.containers = containers
+        self.start = start
+        self.end = end
+        self.min_level = None
+        if min_level is not None:
+            if min_level.upper() not in LEVELS:
+                raise ValueError(f"Unknown log level {min_level}!")
+            self.min_level = LEVELS[min_level.upper()]
+
+    def match_pod(self, pod_name):
+        return self.pods is None or any(
+            fnmatch.fnmatchcase(pod_name, pattern) for pattern in self.pods
+        )
+
+    def match_container(self, container_name):
+        return self.containers is None or any(
+            fnmatch.fnmatchcase(container_name, pattern) for pattern in self.containers
+        )
+
+    def match_level(self, level):
+        return (
+            self.min_level is None or LEVELS.get(level.upper(), math.inf) >= self.min_level
+        )
+
+    def match_line(self, line):
+        """Checks a (parsed) log line against the filter"""
+
+        if "pod" in line and not self.match_pod(line["pod"]):
+            return False
+        if "container" in line and not self.match_container(line["container"]):
+            return False
+        if "level" in line and not self.match_level(line["level"]):
+            return False
+        if "time" in line:
+            if self.start is not None and line["time"] < self.start:
+                return False
+            if self.end is not None and line["time"] >= self.end:
+                return False
+        return True
+
+    def since_seconds(self):
+        """Determines seconds to request from Kubernetes to cover the window"""
+
+        if self.start is None:
+            return None
+        since = datetime.datetime.now(timezone.utc) - self.start
+        return max(1, math.ceil(since.total_seconds()) + CURSOR_MARGIN)
+
+
+def _peek_level(line):
+    """Gets the level of a raw SKA format log line, or None for other lines"""
+
+    space = line.find(" ")
+    if not line.startswith("1|", space + 1):
+        return None
+    parts = line.split("|", 3)
+    return parts[2] if len(parts) > 3 else None
+
+
+def _peek_time(line):
+    """Gets the Kubernetes time stamp of a raw log line, or None"""
+
+    m = kube_time_re.match(line)
+    return None if m is None else parse_date(m["kube_time"])
+
+
+def collect_pod_logs(api, namespace, concurrency=1, pod_stats=None, cursors=None, log_filter=None):
+    """Collects logs from all containers of all pods in a namespace
+
+    :param api: Kubernetes core API object
+    :param namespace: Namespace to collect logs from
+    :param concurrency: Number of logs to request concurrently
+    :param pod_stats: Output parameter for retrieval statistics per pod
+      (number of requests, accumulated request time and bytes received)
+    :param cursors: Only collect lines after cursors, updating them
+      (see load_cursors)
+    :param log_filter: Only collect matching lines (see LogFilter)
+    :returns: List of log lines
+    """
+
+    ret = api.list_namespaced_pod(namespace, watch=False)
+    lines = []
+    print(f"Obtaining logs from {len(ret.items)} pods on namespace {namespace}...")
+
+    def show_statuses(podName, statuses):
         if "ERROR" in statuses or "CRITICAL" in statuses:
             print(
                 f"  {podName}:",
                 ", ".join([f"{n}x{level}" for level, n in statuses.items()]),
             )
 
+    current_pod = None
+    statuses = {}
+    for podName, attrs, logs in _iter_container_logs(
+        api, namespace, ret.items, concurrency, pod_stats, cursors, log_filter
+    ):
+        if podName != current_pod:
+            show_statuses(current_pod, statuses)
+            current_pod = podName
+            statuses = {}
+        for line_dict in iter_log_lines(logs, attrs, cursors, log_filter):
+            lines.append(line_dict)
+            aggregate_status(line_dict, statuses)
+    show_statuses(current_pod, statuses)
+
     print(f"  ... {len(lines)} lines read")
     return lines
 
 
-def collect_events(api, namespace):
+def iter_pod_logs(api, namespace, concurrency=1, pod_stats=None, cursors=None, log_filter=None):
+    """Streaming version of collect_pod_logs
+
+    Container logs get parsed only once the returned line streams get
+    consumed. Every stream is ordered by time, so they can get
+    combined using merge_lines().
+
+    :param api: Kubernetes core API object
+    :param namespace: Namespace to collect logs from
+    :param concurrency: Number of logs to request concurrently
+    :param pod_stats: Output parameter for retrieval statistics per pod
+    :param cursors: Only return lines after cursors, updating them as
+      lines are consumed (see load_cursors)
+    :param log_filter: Only return matching lines (see LogFilter)
+    :returns: Iterator over per-container line iterators
+    """
+
+    ret = api.list_namespaced_pod(namespace, watch=False)
+    print(f"Obtaining logs from {len(ret.items)} pods on namespace {namespace}...")
+    for _, attrs, logs in _iter_container_logs(
+        api, namespace, ret.items, concurrency, pod_stats, cursors, log_filter
+    ):
+        yield iter_log_lines(logs, attrs, cursors, log_filter)
+
+
+def collect_events(api, namespace, cursors=None, log_filter=None):
+    """Collects events from a namespace
+
+    :param api: Kubernetes core API object
+    :param namespace: Namespace to collect events from
+    :param cursors: Only collect events after cursor, updating it
+      (see load_cursors)
+    :param log_filter: Only collect matching events (see LogFilter)
+    :returns: List of event lines
+    """
 
     print(f"Obtaining events from namespace {namespace}...")
     lines = []
@@ -197,6 +646,17 @@ def collect_events(api, namespace):
                 lines.append({"time": item.last_timestamp, **attrs})
                 aggregate_status(attrs, statuses)
 
+    if log_filter is not None:
+        lines = [line for line in lines if log_filter.match_line(line)]
+
+    # Filter out events we have seen before
+    if cursors is not None:
+        key = f"{namespace}/events"
+        if key in cursors:
+            lines = [line for line in lines if line["time"] > cursors[key]]
+        if lines:
+            cursors[key] = max(line["time"] for line in lines)
+
     print(
         f"  ... {len(lines)} events:",
         ", ".join([f"{n}x{level}" for level, n in statuses.items()]),
@@ -205,31 +665,295 @@ def collect_events(api, namespace):
     return lines
 
 
-def collect_file(filename, verbosity, fileobj=None):
+def iter_file(filename, verbosity, fileobj=None, parse_time=True, start=None, end=None):
+    """Lazily reads log lines from a JSON lines file or a chunked dump
+
+    The format is detected automatically (see write_chunked_dump).
+
+    :param filename: Name of file to read
+    :param verbosity: Whether to show a status message
+    :param fileobj: File object to read from (instead of opening filename)
+    :param parse_time: Parse time stamps into datetime. Otherwise leave
+       them as strings (or nanoseconds for chunked dumps), e.g. for
+       parsing in bulk (see LogTable)
+    :param start: Only return lines with at least this time
+    :param end: Only return lines before this time
+    :returns: Iterator over log lines
+    """
 
     t = time.time()
     if verbosity > 0:
         print(f"Reading from {filename}...", flush=True)
-    # Read JSON lines from a file
-    lines = []
-    with (open(filename, "r") if fileobj is None else fileobj) as f:
-        for line in f:
-            # Sometimes we end up with b'...'
-            if isinstance(line, bytes):
-                if line.startswith(b"b'{"):
-                    line = line[2:-2].decode("unicode_escape")
-                else:
-                    line = line.decode("utf-8")
-            if line.startswith("b'{"):
-                line = line[2:-2].encode("utf-8").decode("unicode_escape")
-            line_dict = orjson.loads(line)
-            if "time" in line_dict:
-                line_dict["time"] = parse_date(line_dict["time"])
-            lines.append(line_dict)
+    count = 0
+    with (open(filename, "rb") if fileobj is None else fileobj) as f:
+
+        # Chunked dump? (The magic is a line of its own.)
+        head = f.readline()
+        if head in (CHUNKED_MAGIC, CHUNKED_MAGIC.decode()):
+            lines = _iter_chunked_dump(f, parse_time, start, end)
+        else:
+            lines = _iter_json_lines(itertools.chain([head], f), parse_time, start, end)
+        for line_dict in lines:
+            count += 1
+            yield line_dict
 
     if verbosity > 0:
-        print(f"  ... {len(lines)} lines read ({time.time() - t:.2f} s)", flush=True)
-    return lines
+        print(f"  ... {count} lines read ({time.time() - t:.2f} s)", flush=True)
+
+
+def decode_json_line(line):
+    """Decodes a line from a JSON lines dump
+
+    :param line: Line as bytes or string
+    :returns: Log line dictionary (with time as string), or None for
+       empty lines
+    """
+
+    # Sometimes we end up with b'...'
+    if isinstance(line, bytes):
+        if line.startswith(b"b'{"):
+            line = line[2:-2].decode("unicode_escape")
+        else:
+            line = line.decode("utf-8")
+    if line.startswith("b'{"):
+        line = line[2:-2].encode("utf-8").decode("unicode_escape")
+    if not line or line.isspace():
+        return None
+    return orjson.loads(line)
+
+
+def _iter_json_lines(f, parse_time, start, end):
+    """Reads log lines from JSON lines (see iter_file)"""
+
+    for line in f:
+        line_dict = decode_json_line(line)
+        if line_dict is None:
+            continue
+        line_time = None
+        if "time" in line_dict and (start is not None or end is not None):
+            line_time = parse_date(line_dict["time"])
+            if (start is not None and line_time < start) or (
+                end is not None and line_time >= end
+            ):
+                continue
+        if parse_time and "time" in line_dict:
+            line_dict["time"] = (
+                parse_date(line_dict["time"]) if line_time is None else line_time
+            )
+        yield line_dict
+
+
+def collect_file(filename, verbosity, fileobj=None, start=None, end=None):
+    return list(iter_file(filename, verbosity, fileobj, start=start, end=end))
+
+
+# Chunked dump format. Layout:
+#  - CHUNKED_MAGIC, header length (uint32) and JSON header
+#  - Chunks: CHUNK_HEADER (tag b"CHNK", data length, line count, minimum
+#    and maximum time), followed by compressed JSON lines. Times are
+#    given as nanoseconds since epoch. Chunks containing lines without
+#    time cover the full range (CHUNK_TIME_MIN to CHUNK_TIME_MAX), as
+#    such lines are part of every time window.
+#  - Index: CHUNK_HEADER (tag b"INDX") followed by a JSON list of
+#    [offset, line count, minimum time, maximum time] per chunk
+#  - Trailer: Offset of index (uint64) and INDEX_MAGIC
+CHUNKED_MAGIC = b"SKALOGZ\n"
+INDEX_MAGIC = b"SKAIDX1\n"
+CHUNK_HEADER = struct.Struct("<4sIIqq")
+CHUNKED_SUFFIX = ".jsonz"
+CHUNKED_CODECS = ["gzip"] + ([] if zstandard is None else ["zstd"])
+CHUNK_TIME_MIN = -(2**63)
+CHUNK_TIME_MAX = 2**63 - 1
+
+
+def _compress(codec, data):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(codec, data):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class ChunkedDumpWriter:
+    """Writes log lines as a chunked dump (see write_chunked_dump)
+
+    :param f: Binary file object to write to
+    :param codec: Compression to use (see CHUNKED_CODECS)
+    :param chunk_lines: Number of lines per chunk
+    """
+
+    def __init__(self, f, codec="gzip", chunk_lines=8192):
+        if codec not in CHUNKED_CODECS:
+            raise ValueError(f"Unsupported codec {codec}!")
+        self.f = f
+        self.codec = codec
+        self.chunk_lines = chunk_lines
+        self.offset = 0
+        self.index = []
+        self.chunk = []
+        self.chunk_times = []
+
+        header = json.dumps(
+            {"version": 1, "codec": codec, "time": "ns", "chunk_lines": chunk_lines}
+        ).encode()
+        self._write(CHUNKED_MAGIC + struct.pack("<I", len(header)) + header)
+
+    def _write(self, data):
+        self.f.write(data)
+        self.offset += len(data)
+
+    def write(self, line):
+        """Adds a log line (dictionary)"""
+
+        line_dict = dict(line)
+        if line_dict.get("time") is not None:
+            line_dict["time"] = time_to_ns(line_dict["time"])
+            self.chunk_times.append(line_dict["time"])
+        data = orjson.dumps(line_dict)
+        self.chunk.append(data if isinstance(data, bytes) else data.encode())
+        if len(self.chunk) >= self.chunk_lines:
+            self.flush()
+
+    def flush(self):
+        """Writes out the current chunk"""
+
+        if not self.chunk:
+            return
+        data = _compress(self.codec, b"\n".join(self.chunk))
+        if len(self.chunk_times) < len(self.chunk):
+            min_time, max_time = CHUNK_TIME_MIN, CHUNK_TIME_MAX
+        else:
+            min_time, max_time = min(self.chunk_times), max(self.chunk_times)
+        self.index.append([self.offset, len(self.chunk), min_time, max_time])
+        self._write(
+            CHUNK_HEADER.pack(b"CHNK", len(data), len(self.chunk), min_time, max_time)
+        )
+        self._write(data)
+        self.chunk = []
+        self.chunk_times = []
+
+    def close(self):
+        """Writes the last chunk and the index"""
+
+        self.flush()
+        index_offset = self.offset
+        data = json.dumps(self.index).encode()
+        self._write(CHUNK_HEADER.pack(b"INDX", len(data), len(self.index), 0, 0))
+        self._write(data)
+        self._write(struct.pack("<Q", index_offset) + INDEX_MAGIC)
+
+
+def write_chunked_dump(lines, f, codec="gzip", chunk_lines=8192):
+    """Writes log lines as a chunked dump
+
+    Lines are written as JSON in compressed chunks, with an index
+    noting the time range of every chunk. This allows iter_file() to
+    only decompress chunks that cover the requested time window,
+    seeking directly to them if the file is seekable.
+
+    :param lines: Log lines to write
+    :param f: Binary file object to write to
+    :param codec: Compression to use (see CHUNKED_CODECS)
+    :param chunk_lines: Number of lines per chunk
+    """
+
+    writer = ChunkedDumpWriter(f, codec, chunk_lines)
+    for line in lines:
+        writer.write(line)
+    writer.close()
+
+
+def _read_chunk_index(f):
+    """Reads the index of a chunked dump, if the file allows seeking"""
+
+    try:
+        if not f.seekable():
+            return None
+        pos = f.tell()
+        f.seek(-8 - len(INDEX_MAGIC), io.SEEK_END)
+        index_offset, magic = struct.unpack("<Q8s", f.read(8 + len(INDEX_MAGIC)))
+        if magic != INDEX_MAGIC:
+            f.seek(pos)
+            return None
+        f.seek(index_offset)
+        tag, length, _, _, _ = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+        index = json.loads(f.read(length))
+        f.seek(pos)
+        return index
+    except (OSError, ValueError):
+        return None
+
+
+def _iter_chunked_dump(f, parse_time, start, end):
+    """Reads log lines from a chunked dump (see iter_file)"""
+
+    (header_length,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(header_length))
+    codec = header["codec"]
+    start_ns = None if start is None else time_to_ns(start)
+    end_ns = None if end is None else time_to_ns(end)
+
+    def in_window(min_time, max_time):
+        return (start_ns is None or max_time >= start_ns) and (
+            end_ns is None or min_time < end_ns
+        )
+
+    # Determine chunks to read. Use the index if we have a time window
+    # and can seek, otherwise go through the chunks in order.
+    index = None
+    if start is not None or end is not None:
+        index = _read_chunk_index(f)
+    if index is not None:
+        chunks = (
+            offset
+            for offset, count, min_time, max_time in index
+            if in_window(min_time, max_time)
+        )
+    else:
+        chunks = itertools.repeat(None)
+
+    for offset in chunks:
+        if offset is not None:
+            f.seek(offset)
+        chunk_header = f.read(CHUNK_HEADER.size)
+        if len(chunk_header) < CHUNK_HEADER.size:
+            break
+        tag, length, count, min_time, max_time = CHUNK_HEADER.unpack(chunk_header)
+        if tag != b"CHNK":
+            break
+        data = f.read(length)
+        if not in_window(min_time, max_time):
+            continue
+
+        for line in _decompress(codec, data).split(b"\n"):
+            line_dict = orjson.loads(line)
+            time_ns = line_dict.get("time")
+            if time_ns is None:
+                pass
+            elif (start_ns is not None and time_ns < start_ns) or (
+                end_ns is not None and time_ns >= end_ns
+            ):
+                continue
+            elif parse_time:
+                line_dict["time"] = ns_to_time(time_ns)
+            yield line_dict
+
+
+def merge_lines(streams):
+    """Merges time-ordered line streams into a single time-ordered stream
+
+    Works lazily using a heap, so only one line per stream is kept
+    in memory at any given time. Lines with the same time stamp are
+    returned in order of the streams.
+
+    :param streams: Iterables over log lines, each ordered by time
+    :returns: Iterator over log lines
+    """
+    return heapq.merge(*streams, key=lambda line: line["time"])
 
 
 # https://stackoverflow.com/questions/14693701/how-can-i-remove-the-ansi-escape-sequences-from-a-string-in-python
@@ -0,0 +1,278 @@
+"""
+Compact column-oriented storage for log lines.
+
+Log lines as produced by logs.parse_log_line() or logs.collect_file()
+are dictionaries, which is convenient but quite wasteful for large
+logs: Every line carries its own dictionary, datetime object and
+copies of pod, container and namespace names. A LogTable instead
+stores every attribute as a column. Time stamps are kept as integer
+nanoseconds, attributes with few distinct values (such as pod or
+level) as small integer codes, and other strings get interned.
+
+Rows are returned as LogRow views, which behave like (read-only) log
+line dictionaries, so they can be passed to tests.collect_tests(),
+classifiers and report generation as-is.
+"""
+
+import array
+import sys
+from collections.abc import Mapping, Sequence
+
+from analysis import logs
+
+# Marks a missing time stamp in the time column
+NO_TIME = -(2**63)
+
+# Number of lines to add at a time in LogTable.extend()
+BATCH_SIZE = 65536
+
+# Marks a missing attribute when looking up rows
+_MISSING = object()
+
+# Attributes stored as integer codes
+CODED_ATTRS = ["pod", "container", "previous", "namespace", "level", "tags"]
+# Attributes stored as (interned) strings
+STRING_ATTRS = ["ska_time", "thread", "function", "source"]
+# Order of attributes in rows
+ATTR_ORDER = [
+    "pod",
+    "container",
+    "previous",
+    "namespace",
+    "time",
+    "ska_time",
+    "level",
+    "thread",
+    "function",
+    "source",
+    "tags",
+    "msg",
+]
+
+
+def _tags_key(tags):
+    return tuple(tags.items()) if isinstance(tags, dict) else tags
+
+
+class _CodedColumn:
+    """Column of values with few distinct values, stored as codes
+
+    Code 0 is reserved for missing values.
+    """
+
+    def __init__(self, typecode="H", key=None):
+        self.codes = array.array(typecode)
+        self.values = [None]
+        self.key = key
+        self._code_by_key = {}
+
+    def append(self, value, missing=False):
+        if missing:
+            self.codes.append(0)
+            return
+        key = value if self.key is None else self.key(value)
+        code = self._code_by_key.get(key)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self._code_by_key[key] = code
+        self.codes.append(code)
+
+
+class LogTable(Sequence):
+    """Column-oriented table of log lines
+
+    :param lines: Log lines (dictionaries) to add initially
+    """
+
+    def __init__(self, lines=()):
+        self._time = array.array("q")
+        self._coded = {attr: _CodedColumn() for attr in CODED_ATTRS}
+        self._coded["tags"] = _CodedColumn("I", key=_tags_key)
+        self._strings = {attr: [] for attr in STRING_ATTRS}
+        self._msg = []
+        # Attributes not covered above (e.g. from events), by row
+        self._extra = {}
+        self.extend(lines)
+
+    def __len__(self):
+        return len(self._msg)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [LogRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("log table index out of range")
+        return LogRow(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield LogRow(self, i)
+
+    def append(self, line):
+        """Adds a log line (dictionary) to the end of the table
+
+        The time stamp can be given either as a datetime, a string
+        (see logs.parse_date) or nanoseconds since epoch.
+        """
+
+        time = line.get("time")
+        if time is None:
+            self._append(line, NO_TIME)
+        elif isinstance(time, str):
+            self._append(line, logs.parse_date_ns(time))
+        elif isinstance(time, int):
+            self._append(line, time)
+        else:
+            self._append(line, logs.time_to_ns(time))
+
+    def _append(self, line, time_ns):
+        self._time.append(time_ns)
+        for attr, col in self._coded.items():
+            col.append(line.get(attr), attr not in line)
+        for attr, col in self._strings.items():
+            value = line.get(attr)
+            col.append(sys.intern(value) if isinstance(value, str) else value)
+        self._msg.append(line.get("msg"))
+
+        extra = {
+            k: v
+            for k, v in line.items()
+            if k not in self._coded
+            and k not in self._strings
+            and k not in ("time", "msg")
+        }
+        if extra:
+            self._extra[len(self._msg) - 1] = extra
+
+    def extend(self, lines):
+        """Adds log lines to the end of the table
+
+        Lines are added in batches, so time stamps given as strings
+        can be parsed in bulk.
+        """
+
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= BATCH_SIZE:
+                self._extend_batch(batch)
+                batch = []
+        self._extend_batch(batch)
+
+    def _extend_batch(self, lines):
+        dates = [line["time"] for line in lines if isinstance(line.get("time"), str)]
+        times_ns = iter(logs.parse_dates_ns(dates))
+        for line in lines:
+            time = line.get("time")
+            if time is None:
+                self._append(line, NO_TIME)
+            elif isinstance(time, str):
+                self._append(line, next(times_ns))
+            elif isinstance(time, int):
+                self._append(line, time)
+            else:
+                self._append(line, logs.time_to_ns(time))
+
+    def _get(self, i, key, default=KeyError):
+        """Returns attribute of row i, or default if not set
+
+        Raises KeyError if no default is given.
+        """
+
+        if key == "msg":
+            msg = self._msg[i]
+            if msg is not None:
+                return msg
+        elif key == "time":
+            ns = self._time[i]
+            if ns != NO_TIME:
+                return logs.ns_to_time(ns)
+        elif key in self._coded:
+            col = self._coded[key]
+            code = col.codes[i]
+            if code != 0:
+                return col.values[code]
+        elif key in self._strings:
+            value = self._strings[key][i]
+            if value is not None:
+                return value
+        else:
+            extra = self._extra.get(i)
+            if extra is not None and key in extra:
+                return extra[key]
+        if default is KeyError:
+            raise KeyError(key)
+        return default
+
+    def _keys(self, i):
+        """Lists attributes set for row i (in order of logs.parse_log_line)"""
+
+        for attr in ATTR_ORDER:
+            if self._get(i, attr, _MISSING) is not _MISSING:
+                yield attr
+        yield from self._extra.get(i, ())
+
+    def mask(self, attr, predicate):
+        """Evaluates a predicate on an attribute of every line
+
+        For attributes stored as codes, the predicate gets evaluated
+        only once per distinct value.
+
+        :param attr: Attribute to check
+        :param predicate: Function to call with attribute value. Lines
+           without the attribute are never selected.
+        :returns: bytearray with 1 for every selected line, 0 otherwise
+        """
+
+        if attr in self._coded:
+            col = self._coded[attr]
+            flags = [0] + [1 if predicate(value) else 0 for value in col.values[1:]]
+            return bytearray(flags[code] for code in col.codes)
+        flags = bytearray(len(self))
+        for i in range(len(self)):
+            value = self._get(i, attr, _MISSING)
+            if value is not _MISSING and predicate(value):
+                flags[i] = 1
+        return flags
+
+
+class LogRow(Mapping):
+    """Read-only dictionary view of a line in a LogTable
+
+    Views get created on every access, so rows compare by value like
+    the dictionaries they stand in for (see Mapping), not by identity.
+    Two equal lines compare equal even if they are different rows, and
+    rows are not hashable.
+    """
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    @property
+    def index(self):
+        """Position of the row in its table"""
+        return self._index
+
+    def __getitem__(self, key):
+        return self._table._get(self._index, key)
+
+    def get(self, key, default=None):
+        return self._table._get(self._index, key, default)
+
+    def __contains__(self, key):
+        return self._table._get(self._index, key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        return self._table._keys(self._index)
+
+    def __len__(self):
+        return sum(1 for _ in self._table._keys(self._index))
+
+    def __repr__(self):
+        return repr(dict(self))
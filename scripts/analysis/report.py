@@ -1,22 +1,47 @@
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import heapq
 import io
+import itertools
+import os
 import pathlib
+import pickle
 import shutil
 import tarfile
+import tempfile
 import traceback
 
 import gitlab
 import rstgen
 import urllib3
-from analysis import classifiers, logs, tests
+from analysis import classifiers, logs, logtable, tests
 
 cfrs_sorted = sorted(classifiers.classifiers, key=lambda cfr: cfr.skb)
 
+# Number of retained logs to keep in memory while writing the report
+LOADED_LOG_COUNT = 4
+
+# Read size for downloads, and size up to which downloads waiting to
+# be analysed get kept in memory (see Report.add_uris)
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+DOWNLOAD_SPOOL_SIZE = 64 * 1024 * 1024
+
 
 def _strip_match(match):
-    """Strip detailed test log from a match to safe space"""
+    """Strip detailed test log from a match to safe space
+
+    Matched lines get replaced by dictionaries with just their time
+    (all we need to highlight them), so no references to the log
+    (say, rows of a LogTable) remain.
+    """
 
+    match_stripped = dict(match)
+    if "matched" in match:
+        match_stripped["matched"] = [{"time": line["time"]} for line in match["matched"]]
     if not "test" in match:
-        return match
+        return match_stripped
 
     test = dict(match["test"])
     if "msgs" in test:
@@ -27,8 +52,9 @@ def _strip_match(match):
         del test["detail"]
     if "teardown_detail" in test:
         del test["teardown_detail"]
+    if "msgs_t" in test:
+        del test["msgs_t"]
 
-    match_stripped = dict(match)
     match_stripped["test"] = test
     return match_stripped
 
@@ -41,16 +67,261 @@ def _is_tarball(fname):
     )
 
 
+def _is_uri(fname):
+    return fname.startswith("http://") or fname.startswith("https://")
+
+
+def analyse_log(log, budget=None, jobs=1):
+    """Collects and classifies tests from a log
+
+    :param log: List of log lines as dictionaries (or LogTable)
+    :param budget: Time budget per classifier and test (see
+       classifiers.ClassifierProfile)
+    :param jobs: Number of processes to classify tests with
+    :returns: Dictionary with number of lines, matches, date of the
+       first log line, pod timings and classifier statistics (see
+       Report.add_analysis)
+    """
+
+    test_data = tests.collect_tests(log, 1)
+    profile = classifiers.ClassifierProfile(budget)
+    analysis = dict(
+        lines=len(log),
+        matches=classifiers.classify_test_results(test_data, profile, log, jobs),
+        date=None,
+        timings={},
+        profile=profile.stats,
+    )
+
+    # Extract date from first log message
+    for l in log:
+        if "time" in l:
+            analysis["date"] = l["time"]
+            break
+    if analysis["date"] is not None:
+        analysis["timings"] = logs.collect_pod_timings(log)
+    return analysis
+
+
+@contextlib.contextmanager
+def _open_uri(http, uri):
+    """Opens a URI for reading its contents as they arrive
+
+    :param http: urllib3.PoolManager to use
+    :param uri: URI to retrieve
+    :returns: Context manager for suggested file name and file object
+    """
+
+    print(f"Retrieving {uri}...", flush=True)
+    fname = urllib3.util.parse_url(uri).path
+    with http.request("GET", uri, preload_content=False) as r:
+        # Get suggested file name from header
+        if (
+            r.getheaders()
+            .get("Content-Disposition", "")
+            .startswith('attachment; filename="')
+        ):
+            fname = r.getheaders().get("Content-Disposition")[22:-1]
+        # (keep it open at the end, so io.BufferedReader can see EOF)
+        r.auto_close = False
+        yield fname, io.BufferedReader(r, DOWNLOAD_BUFFER_SIZE)
+        print(f" ... got {r.tell()} bytes.", flush=True)
+
+
+def _fetch(http, uri):
+    """Downloads a file
+
+    Files larger than DOWNLOAD_SPOOL_SIZE get written to a temporary
+    file instead of being kept in memory.
+
+    :param http: urllib3.PoolManager to use
+    :param uri: URI to retrieve
+    :returns: Suggested file name and file object with the file's contents
+    """
+
+    with _open_uri(http, uri) as (fname, f):
+        spool = tempfile.SpooledTemporaryFile(DOWNLOAD_SPOOL_SIZE)
+        shutil.copyfileobj(f, spool, DOWNLOAD_BUFFER_SIZE)
+    spool.seek(0)
+    return fname, spool
+
+
+def _load_log(fname, member=None, http=None):
+    """Reads a log from a file or URI, or the given member of a tarball"""
+
+    for _, log in _iter_logs(fname, {member}, http):
+        return log
+
+
+def _iter_logs(fname, members, http=None):
+    """Reads logs from a file or URI, or the given members of a tarball
+
+    The file gets read (or downloaded) just once, sequentially.
+
+    :param fname: Name of file or URI
+    :param members: Collection of tarball members to read, or just
+       None for a flat file
+    :param http: urllib3.PoolManager to use for URIs
+    :returns: Iterator over (member, log) pairs, in the order members
+       appear in the tarball
+    """
+
+    with contextlib.ExitStack() as stack:
+        fileobj = None
+        if _is_uri(fname):
+            _, fileobj = stack.enter_context(
+                _open_uri(http or urllib3.PoolManager(), fname)
+            )
+        if None in members:
+            yield None, logtable.LogTable(
+                logs.iter_file(fname, 1, fileobj, parse_time=False)
+            )
+            return
+        if fileobj is None:
+            tar = tarfile.open(fname, mode="r:*")
+        else:
+            tar = tarfile.open(mode="r|*", fileobj=fileobj)
+        remaining = set(members)
+        with tar:
+            for i, info in enumerate(iter(tar.next, None)):
+                if i not in remaining:
+                    continue
+                with tar.extractfile(info) as f:
+                    yield i, logtable.LogTable(
+                        logs.iter_file(info.name, 1, f, parse_time=False)
+                    )
+                remaining.remove(i)
+                if not remaining:
+                    return
+    raise ValueError(f"Members {sorted(remaining)} not found in {fname}!")
+
+
+def _portable_analysis(analysis):
+    """Strips an analysis for sending it to another process
+
+    Classifiers get replaced by their index in classifiers.classifiers
+    (log lines are already replaced by _strip_match).
+    """
+
+    cfr_index = {id(cfr): i for i, cfr in enumerate(classifiers.classifiers)}
+    matches = []
+    for match in analysis["matches"]:
+        match = _strip_match(match)
+        match["cfr"] = cfr_index[id(match["cfr"])]
+        matches.append(match)
+    return {**analysis, "matches": matches}
+
+
+def _restore_analysis(analysis):
+    """Reverses _portable_analysis"""
+
+    matches = [
+        {**match, "cfr": classifiers.classifiers[match["cfr"]]}
+        for match in analysis["matches"]
+    ]
+    return {**analysis, "matches": matches}
+
+
+def analyse_file(fname, budget=None):
+    """Analyses a log file or a tarball of log files
+
+    Meant to be run in a worker process, see Report.add_files(). Errors
+    get printed, analysing as many logs as possible.
+
+    :param fname: Name of log file or tarball
+    :param budget: Time budget for classifiers, see analyse_log()
+    :returns: List of (name, source, origin, analysis) tuples for every
+       log, with analysis stripped by _portable_analysis
+    """
+
+    results = []
+    try:
+        if _is_tarball(fname):
+            with tarfile.open(fname, mode="r:*") as tar:
+                for member, info in enumerate(iter(tar.next, None)):
+                    with tar.extractfile(info) as f:
+                        try:
+                            log = logtable.LogTable(
+                                logs.iter_file(info.name, 1, f, parse_time=False)
+                            )
+                            results.append(
+                                (
+                                    info.name,
+                                    fname,
+                                    (fname, member),
+                                    _portable_analysis(analyse_log(log, budget)),
+                                )
+                            )
+                        except Exception:
+                            traceback.print_exc()
+        else:
+            log = _load_log(fname)
+            results.append(
+                (
+                    fname,
+                    None,
+                    (fname, None),
+                    _portable_analysis(analyse_log(log, budget)),
+                )
+            )
+    except Exception:
+        traceback.print_exc()
+    return results
+
+
+def _bit_count(bits):
+    return bin(bits).count("1")
+
+
+def _spool_log(directory, log_id, log, matches):
+    """Writes a log and its (full) matches to a spool file
+
+    Classifiers get replaced by their index, as they cannot be pickled.
+
+    :returns: Name of the spool file
+    """
+
+    cfr_index = {id(cfr): i for i, cfr in enumerate(classifiers.classifiers)}
+    matches = [{**match, "cfr": cfr_index[id(match["cfr"])]} for match in matches]
+    fname = os.path.join(directory, f"log-{log_id}.pickle")
+    with open(fname, "wb") as f:
+        pickle.dump((log, matches), f, pickle.HIGHEST_PROTOCOL)
+    return fname
+
+
+def _unspool_log(fname):
+    """Reads a log and its matches written by _spool_log"""
+
+    with open(fname, "rb") as f:
+        log, matches = pickle.load(f)
+    return log, [
+        {**match, "cfr": classifiers.classifiers[match["cfr"]]} for match in matches
+    ]
+
+
 class Report:
-    def __init__(self, matches_per_clfr_count=10, context_lines=10):
+    def __init__(
+        self,
+        matches_per_clfr_count=10,
+        context_lines=10,
+        cfr_budget=None,
+        jobs=1,
+        cache=None,
+        concurrency=4,
+    ):
 
         # Parameters
         self.matches_per_clfr_count = matches_per_clfr_count
         self.context_lines = context_lines
+        self.cfr_budget = cfr_budget
+        self.jobs = jobs
+        self.cache = cache
+        self.concurrency = concurrency
 
-        # Work structures
-        self.http = urllib3.PoolManager()
+        # Work structures (connections get reused by download threads)
+        self.http = urllib3.PoolManager(maxsize=concurrency)
         self.matches_per_file = {}
+        # Heaps of (date, -log_id, match log), see add_cfr_matches()
         self.matches_per_clfr = {cfr.skb: [] for cfr in cfrs_sorted}
         self.all_matches_per_clfr = {cfr.skb: [] for cfr in cfrs_sorted}
         self.total_lines = 0
@@ -59,23 +330,79 @@ class Report:
         self.revisions = {}
         self.revision_files = {}
         self.file_date = {}
+        self.profile = classifiers.ClassifierProfile(cfr_budget)
 
         # See build_maps()
         self.files_per_cfr = None
+        self.file_names = None
+        self.file_bits_per_cfr = None
+        self.file_bits_per_revision = None
+
+        # Retained match logs by log ID, logs spooled to disk and
+        # logs loaded back (see _load_match_log)
+        self._retained = {}
+        self._spool_dir = None
+        self._loaded = collections.OrderedDict()
 
     def add_log(self, fname, log, source=None, revision=None):
         """Adds a log to the report
 
         :param fname: (File) name of the log
-        :param log: List of log lines as dictionaries
+        :param log: List of log lines as dictionaries (or LogTable)
         :param source: Original source of the log, say if extracted from an URL
         :param sha: The Git revision associated witht the log
+        :returns: Analysis of the log, see analyse_log()
         """
 
-        # Extract test data, classify
-        self.total_lines += len(log)
-        test_data = tests.collect_tests(log, 1)
-        matches = classifiers.classify_test_results(test_data)
+        analysis = analyse_log(log, self.cfr_budget, self.jobs)
+        self.add_analysis(fname, analysis, log, source, revision)
+        return analysis
+
+    def _add_results(self, results, revision=None):
+        """Adds analyses as returned by analyse_file()"""
+
+        for name, source, origin, analysis in results:
+            self.add_analysis(
+                name, _restore_analysis(analysis), None, source, revision, origin
+            )
+
+    def _cache_results(self, fname, results, revision=None):
+        """Stores analyses as returned by analyse_file() in the cache
+
+        Classifier statistics get dropped, as they only describe the
+        run that did the analysis. Nothing gets stored if no log
+        could be analysed, so errors get retried.
+        """
+
+        if self.cache is None or not results:
+            return
+        self.cache.put(
+            fname,
+            [
+                (name, source, origin, {**analysis, "profile": {}})
+                for name, source, origin, analysis in results
+            ],
+            revision,
+        )
+
+    def add_analysis(
+        self, fname, analysis, log=None, source=None, revision=None, origin=None
+    ):
+        """Adds an analysed log to the report
+
+        :param fname: (File) name of the log
+        :param analysis: Analysis of the log, see analyse_log()
+        :param log: The log itself. If not given, it gets read again
+          from origin once needed for the report. Otherwise it gets
+          spooled to disk if we retain matches for it.
+        :param source: Original source of the log, say if extracted from an URL
+        :param revision: The Git revision associated witht the log
+        :param origin: File name and tarball member to re-read the log from
+        """
+
+        self.total_lines += analysis["lines"]
+        self.profile.merge(analysis.get("profile", {}))
+        matches = analysis["matches"]
 
         # Note all matches, but remove detailed test logs to save space
         self.matches_per_file[fname] = [_strip_match(match) for match in matches]
@@ -86,12 +413,8 @@ class Report:
                 self.revision_files[revision] = set()
             self.revision_files[revision].add(fname)
 
-        # Extract date from first log message
-        log_date = None
-        for l in log:
-            if "time" in l:
-                log_date = l["time"]
-                break
+        # Date of first log message
+        log_date = analysis["date"]
         if log_date is not None:
             self.file_date[fname] = log_date
 
@@ -102,17 +425,29 @@ class Report:
             ):
                 self.revisions[revision] = log_date
 
+            matches_by_cfr = {}
+            for match in matches:
+                matches_by_cfr.setdefault(match["cfr"], []).append(match)
             for cfr in classifiers.classifiers:
-                cfr_matches = [match for match in matches if match["cfr"] is cfr]
-                if not cfr_matches:
+                if cfr not in matches_by_cfr:
                     continue
                 self.add_cfr_matches(
-                    fname, source, log, log_date, cfr, cfr_matches, revision
+                    fname,
+                    source,
+                    log,
+                    log_date,
+                    cfr,
+                    matches_by_cfr[cfr],
+                    revision,
+                    origin,
                 )
 
+            # Move log to disk if we show matches from it
+            if log is not None and self.log_id in self._retained:
+                self._spool(self.log_id, log, matches)
+
             # Collect timings
-            timings = logs.collect_pod_timings(log)
-            for pod, pod_ts in timings.items():
+            for pod, pod_ts in analysis["timings"].items():
                 current_pod_ts = self.pod_timings.get(pod, {})
                 # Note that theoretically a container can appear multiple times.
                 # We ignore that here.
@@ -124,15 +459,17 @@ class Report:
 
         self.log_id += 1
 
-    def add_cfr_matches(self, fname, source, log, log_date, cfr, cfr_matches, revision):
+    def add_cfr_matches(
+        self, fname, source, log, log_date, cfr, cfr_matches, revision, origin=None
+    ):
 
         # Strip test information
         cfr_matches_stripped = [_strip_match(cfr_match) for cfr_match in cfr_matches]
 
-        # Add to list, retaining only a number of matches (as
-        # we keep basically the entire log for them in
-        # memory!)
-        match_list = self.matches_per_clfr.get(cfr.skb, [])
+        # Add to heap, retaining only the latest matches (as we
+        # need basically the entire log for them!). On equal dates,
+        # earlier logs win.
+        match_heap = self.matches_per_clfr.setdefault(cfr.skb, [])
         match_log = dict(
             date=log_date,
             log=log,
@@ -142,71 +479,318 @@ class Report:
             source=source,
             matches=cfr_matches,
             revision=revision,
+            origin=origin,
+            spool=None,
+            unavailable=False,
         )
-        match_list.append(match_log)
-        match_list = sorted(match_list, key=lambda match: match["date"], reverse=True)
-        self.matches_per_clfr[cfr.skb] = match_list[: self.matches_per_clfr_count]
+        entry = (log_date, -self.log_id, match_log)
+        if len(match_heap) < self.matches_per_clfr_count:
+            heapq.heappush(match_heap, entry)
+            dropped = None
+        else:
+            dropped = heapq.heappushpop(match_heap, entry)[2]
+        if dropped is not match_log:
+            self._retained.setdefault(self.log_id, []).append(match_log)
+        if dropped is not None and dropped is not match_log:
+            self._release_match_log(dropped)
 
         # Retain stripped matches for all
-        all_matches_list = self.all_matches_per_clfr.get(cfr.skb, [])
         match_log_stripped = dict(match_log)
         match_log_stripped["matches"] = cfr_matches_stripped
         del match_log_stripped["log"]
-        all_matches_list.append(match_log_stripped)
-        self.all_matches_per_clfr[cfr.skb] = list(all_matches_list)
+        del match_log_stripped["spool"]
+        del match_log_stripped["unavailable"]
+        self.all_matches_per_clfr.setdefault(cfr.skb, []).append(match_log_stripped)
+
+    def _release_match_log(self, match_log):
+        """Forgets a match log dropped from the retained matches
+
+        Removes its spooled log once no retained match needs it.
+        """
+
+        retained = self._retained[match_log["log_id"]]
+        retained.remove(match_log)
+        if retained:
+            return
+        del self._retained[match_log["log_id"]]
+        if match_log["spool"] is not None:
+            os.remove(match_log["spool"])
+
+    def retained_matches(self, cfr):
+        """Lists the retained match logs for a classifier, latest first"""
+
+        return [
+            match_log
+            for _, _, match_log in sorted(
+                self.matches_per_clfr[cfr.skb], key=lambda entry: entry[:2], reverse=True
+            )
+        ]
+
+    def _spool(self, log_id, log, matches):
+        """Moves a log and its (full) matches to disk
+
+        Sets the spool file for all match logs retained for it.
+        """
+
+        if self._spool_dir is None:
+            self._spool_dir = tempfile.TemporaryDirectory(prefix="report-")
+        spool = _spool_log(self._spool_dir.name, log_id, log, matches)
+        for match_log in self._retained[log_id]:
+            match_log.update(log=None, matches=None, spool=spool)
+
+    def _spool_retained_logs(self):
+        """Reads back all retained logs that are not in memory or spooled
+
+        Logs get grouped by the file or URI they came from, so every
+        file gets read (or downloaded) once, no matter how many logs
+        or classifiers need it. Logs get analysed again and spooled.
+        Errors get printed, and logs that could not be read get marked
+        unavailable.
+        """
+
+        # Collect members to read by file
+        to_read = {}
+        for log_id, match_logs in self._retained.items():
+            match_log = match_logs[0]
+            if (
+                match_log["log"] is not None
+                or match_log["spool"] is not None
+                or match_log["unavailable"]
+            ):
+                continue
+            if match_log["origin"] is None:
+                print(f"Cannot read log {match_log['name']} again!")
+                self._mark_unavailable(log_id)
+                continue
+            fname, member = match_log["origin"]
+            to_read.setdefault(fname, {})[member] = log_id
+
+        # Read them
+        for fname, members in to_read.items():
+            try:
+                for member, log in _iter_logs(fname, list(members), self.http):
+                    log_id = members.pop(member)
+                    self._spool(log_id, log, analyse_log(log)["matches"])
+            except Exception as e:
+                print(f"Could not read {fname} again: {e}")
+            for log_id in members.values():
+                self._mark_unavailable(log_id)
+
+    def _mark_unavailable(self, log_id):
+        for match_log in self._retained[log_id]:
+            match_log["unavailable"] = True
+
+    def _load_match_log(self, match_log):
+        """Gets the log and full matches for a retained match log
+
+        Logs not in memory get read from their spool file. If not
+        spooled yet, all such logs get read again from their origin
+        and spooled first (see _spool_retained_logs). Only the last
+        few logs loaded are kept in memory.
+
+        :returns: Log and list of the classifier's matches, or None if
+           the log could not be read
+        """
+
+        if match_log["log"] is not None:
+            return match_log["log"], match_log["matches"]
+
+        if match_log["spool"] is None and not match_log["unavailable"]:
+            self._spool_retained_logs()
+        if match_log["unavailable"]:
+            return None
+
+        log_id = match_log["log_id"]
+        if log_id in self._loaded:
+            self._loaded.move_to_end(log_id)
+        else:
+            self._loaded[log_id] = _unspool_log(match_log["spool"])
+            if len(self._loaded) > LOADED_LOG_COUNT:
+                self._loaded.popitem(last=False)
+        log, matches = self._loaded[log_id]
+        return log, [match for match in matches if match["cfr"] is match_log["cfr"]]
 
     def add_tarball(self, tar, source, revision=None):
-        while True:
+        """Adds all logs from a tarball
+
+        :returns: List of (name, source, origin, analysis) tuples, see
+           analyse_file()
+        """
+
+        results = []
+        for member in itertools.count():
             # Read through tar file sequentially to minimise seeking
             info = tar.next()
             if info is None:
-                return
+                return results
             # Extract
             with tar.extractfile(info) as f:
                 try:
-                    self.add_log(
-                        info.name, logs.collect_file(info.name, 1, f), source, revision
+                    analysis = self.add_log(
+                        info.name,
+                        logtable.LogTable(
+                            logs.iter_file(info.name, 1, f, parse_time=False)
+                        ),
+                        source,
+                        revision,
                     )
+                    results.append((info.name, source, (source, member), analysis))
                 except Exception:
                     traceback.print_exc()
 
     def add_file_or_uri(self, fname, revision=None):
 
-        # Is a URI?
+        # Analysed before?
+        if self.cache is not None:
+            results = self.cache.get(fname, revision)
+            if results is not None:
+                self._add_results(results, revision)
+                return
+
+        # Is a URI? Process it as it gets downloaded.
         if fname.startswith("http://") or fname.startswith("https://"):
+            with _open_uri(self.http, fname) as download:
+                self._add_download(fname, download, revision)
+            return
 
-            # Read it to a memory buffer
-            bio = io.BytesIO()
-            print(f"Retrieving {fname}...", flush=True)
-            _fname = urllib3.util.parse_url(fname).path
-            with self.http.request("GET", fname, preload_content=False) as r:
-                # Get suggested file name from header
-                if (
-                    r.getheaders()
-                    .get("Content-Disposition", "")
-                    .startswith('attachment; filename="')
-                ):
-                    _fname = r.getheaders().get("Content-Disposition")[22:-1]
-                # Copy data
-                shutil.copyfileobj(r, bio)
-            print(f" ... got {len(bio.getvalue())} bytes.", flush=True)
-            bio.seek(0)
+        # Assume it's a file. Tarball?
+        if _is_tarball(fname):
+            with tarfile.open(fname, mode="r:*") as tar:
+                results = self.add_tarball(tar, fname, revision)
+        else:
+            analysis = self.add_log(
+                fname,
+                logtable.LogTable(logs.iter_file(fname, 1, parse_time=False)),
+                None,
+                revision,
+            )
+            results = [(fname, None, (fname, None), analysis)]
+        self._cache_analyses(fname, results, revision)
+
+    def _add_download(self, uri, download, revision=None):
+        """Adds logs from a downloaded file
+
+        The file gets read sequentially, so it can be streamed, see
+        _open_uri() and _fetch().
+        """
 
+        _fname, f = download
+        with f:
             # Tarball?
             if _is_tarball(_fname):
-                with tarfile.open(mode="r:*", fileobj=bio) as tar:
-                    self.add_tarball(tar, fname, revision)
+                with tarfile.open(mode="r|*", fileobj=f) as tar:
+                    results = self.add_tarball(tar, uri, revision)
             else:
                 # Otherwise expect it to be a flat file
-                self.add_log(_fname, logs.collect_file(fname, 1, bio), fname, revision)
-            return
+                analysis = self.add_log(
+                    _fname,
+                    logtable.LogTable(logs.iter_file(uri, 1, f, parse_time=False)),
+                    uri,
+                    revision,
+                )
+                results = [(_fname, uri, (uri, None), analysis)]
+        self._cache_analyses(uri, results, revision)
 
-        # Assume it's a file. Tarball?
-        if _is_tarball(fname):
-            with tarfile.open(fname, mode="r:*") as tar:
-                self.add_tarball(tar, fname, revision)
-        else:
-            self.add_log(fname, logs.collect_file(fname, 1), revision)
+    def _cache_analyses(self, fname, results, revision=None):
+        """Stores analyses of logs added from a file or URI in the cache"""
+
+        if self.cache is not None:
+            self._cache_results(
+                fname,
+                [
+                    (name, source, origin, _portable_analysis(analysis))
+                    for name, source, origin, analysis in results
+                ],
+                revision,
+            )
+
+    def add_uris(self, uris, concurrency=None):
+        """Adds logs from URIs, downloading them concurrently
+
+        Downloads run in a pool of threads, while logs already
+        downloaded get analysed. Logs are added in the order the URIs
+        are given, and only a limited number of downloads are held in
+        memory at a time. Errors get printed, adding as many logs as
+        possible.
+
+        :param uris: Iterable of (URI, revision) pairs
+        :param concurrency: Number of downloads to run at once (default
+           as given to the constructor)
+        """
+
+        concurrency = concurrency or self.concurrency
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            pending = collections.deque()
+            for uri, revision in uris:
+
+                # Analysed before? Otherwise start download.
+                results = None
+                if self.cache is not None:
+                    results = self.cache.get(uri, revision)
+                if results is None:
+                    download = executor.submit(_fetch, self.http, uri)
+                else:
+                    download = None
+                pending.append((uri, revision, download, results))
+
+                # Process downloads in order, once enough are under way
+                while len(pending) >= concurrency or (
+                    pending and pending[0][2] is None
+                ):
+                    self._add_pending(*pending.popleft())
+            while pending:
+                self._add_pending(*pending.popleft())
+
+    def _add_pending(self, uri, revision, download, results):
+        """Adds a log from add_uris(), waiting for its download"""
+
+        try:
+            if download is None:
+                self._add_results(results, revision)
+            else:
+                self._add_download(uri, download.result(), revision)
+        except Exception:
+            traceback.print_exc()
+
+    def add_files(self, fnames, jobs=1):
+        """Adds logs from files (or URIs), analysing files in parallel
+
+        Local files and tarballs get analysed in worker processes,
+        which only send back stripped matches. Results are added in
+        the order the files are given, so the report is the same as if
+        add_file_or_uri() was called on every file in turn.
+
+        :param fnames: Names of log files, tarballs or URIs
+        :param jobs: Number of worker processes
+        """
+
+        # Look up files analysed before
+        cached = {}
+        if self.cache is not None:
+            for fname in fnames:
+                if not _is_uri(fname) and fname not in cached:
+                    results = self.cache.get(fname)
+                    if results is not None:
+                        cached[fname] = results
+
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            results = executor.map(
+                functools.partial(analyse_file, budget=self.cfr_budget),
+                [fname for fname in fnames if not _is_uri(fname) and fname not in cached],
+            )
+            for fname in fnames:
+                if _is_uri(fname):
+                    try:
+                        self.add_file_or_uri(fname)
+                    except Exception:
+                        traceback.print_exc()
+                    continue
+                if fname in cached:
+                    self._add_results(cached[fname])
+                    continue
+                file_results = next(results)
+                self._cache_results(fname, file_results)
+                self._add_results(file_results)
 
     def add_from_gitlab(self, uri, header, project, search, job_names, artifact):
 
@@ -216,21 +800,28 @@ class Report:
         pips = proj.pipelines.list(**search)
         print(f"Found {len(pips)} GitLab pipelines", flush=True)
 
-        # Go through pipelines, look for matching jobs
-        for pip in pips:
-
-            # Find a (successful) job matching the desired name
-            jobs = pip.jobs.list(scope="success", include_retried="yes")
-            for job in (job for job in jobs if job.name in job_names):
-
-                # (Attempt to) download the artefact
-                try:
-                    self.add_file_or_uri(
+        def list_jobs(pip):
+            try:
+                return pip.jobs.list(scope="success", include_retried="yes")
+            except Exception:
+                traceback.print_exc()
+                return []
+
+        # Go through pipelines, look for matching jobs. Jobs get listed
+        # concurrently, and artefacts downloaded as they are found.
+        def iter_artifacts(pips_jobs):
+            for pip, jobs in pips_jobs:
+
+                # Find a (successful) job matching the desired name
+                for job in (job for job in jobs if job.name in job_names):
+                    yield (
                         f"{uri}/{project}/-/jobs/{job.id}/artifacts/raw/{artifact}?inline=false",
                         pip.sha,
                     )
-                except Exception:
-                    traceback.print_exc()
+
+        with concurrent.futures.ThreadPoolExecutor(self.concurrency) as executor:
+            pips_jobs = zip(pips, executor.map(list_jobs, pips))
+            self.add_uris(iter_artifacts(pips_jobs))
 
     def make_matches_table(self, f):
 
@@ -240,34 +831,41 @@ class Report:
             header.append(cfr.skb)
 
         # Now go through files
+        if self.file_bits_per_cfr is None:
+            self.build_maps()
+        cfr_bits = [self.file_bits_per_cfr[cfr.skb] for cfr in cfrs_sorted]
         rows = []
-        match_count = {cfr.skb: 0 for cfr in classifiers.classifiers}
-        for fname in sorted(self.matches_per_file.keys()):
-            matches = self.matches_per_file[fname]
-            row = [fname]
-            for cfr in cfrs_sorted:
-                cfr_matches = [match for match in matches if match["cfr"] is cfr]
-                if cfr_matches:
-                    row.append("X")
-                    match_count[cfr.skb] += 1
-                else:
-                    row.append("")
-            rows.append(row)
+        for i, fname in enumerate(self.file_names):
+            rows.append([fname] + ["X" if bits >> i & 1 else "" for bits in cfr_bits])
 
         # Add a table with the count at the end
-        rows.append(["Sum:"] + [str(match_count[cfr.skb]) for cfr in cfrs_sorted])
+        rows.append(["Sum:"] + [str(_bit_count(bits)) for bits in cfr_bits])
         print(rstgen.table(header, rows), file=f)
 
     def build_maps(self):
+        """Builds the index of classifiers matching files
+
+        Files are numbered in order of their names, so sets of files
+        can be represented as bits of an integer.
+        """
+
+        self.file_names = sorted(self.matches_per_file.keys())
+        file_bit = {fname: 1 << i for i, fname in enumerate(self.file_names)}
 
         # Files that match a given classifier
+        self.file_bits_per_cfr = {cfr.skb: 0 for cfr in classifiers.classifiers}
+        for fname, matches in self.matches_per_file.items():
+            for match in matches:
+                self.file_bits_per_cfr[match["cfr"].skb] |= file_bit[fname]
         self.files_per_cfr = {
-            cfr.skb: {
-                fname
-                for fname, matches in self.matches_per_file.items()
-                if any(match["cfr"] is cfr for match in matches)
-            }
-            for cfr in classifiers.classifiers
+            skb: {fname for fname in self.file_names if bits & file_bit[fname]}
+            for skb, bits in self.file_bits_per_cfr.items()
+        }
+
+        # Files for a given revision
+        self.file_bits_per_revision = {
+            revision: sum(file_bit[fname] for fname in fnames if fname in file_bit)
+            for revision, fnames in self.revision_files.items()
         }
 
     def make_overview_table(self, f, revision=None):
@@ -275,8 +873,10 @@ class Report:
         # Print a header
         if revision is None:
             files = self.matches_per_file.keys()
+            file_bits = (1 << len(self.file_names)) - 1
         else:
             files = self.revision_files[revision]
+            file_bits = self.file_bits_per_revision[revision]
         file_count = len(files)
         print(f"Covering {file_count} logs.", file=f)
         if file_count > 0:
@@ -295,12 +895,15 @@ class Report:
             "**Cross-Check**",
         ]
         rows = []
+        cfr_file_counts = {
+            skb: _bit_count(bits) for skb, bits in self.file_bits_per_cfr.items()
+        }
         for cfr in sorted(
-            cfrs_sorted, key=lambda cfr: len(self.files_per_cfr[cfr.skb]), reverse=True
+            cfrs_sorted, key=lambda cfr: cfr_file_counts[cfr.skb], reverse=True
         ):
 
             matches = self.all_matches_per_clfr[cfr.skb]
-            files_with_matches = self.files_per_cfr[cfr.skb]
+            files_with_matches = self.file_bits_per_cfr[cfr.skb]
 
             # Specialise to revision, if requested.
             if revision is not None:
@@ -315,8 +918,9 @@ class Report:
                     for cfr_match in matches
                     if cfr_match["revision"] == revision
                 ]
-                files_with_matches = files_with_matches & self.revision_files[revision]
-            files_matched_rel = len(files_with_matches) / max(1, file_count)
+                files_with_matches &= file_bits
+            files_matched_count = _bit_count(files_with_matches)
+            files_matched_rel = files_matched_count / max(1, file_count)
 
             # Include date + link to latest match
             if matches:
@@ -324,7 +928,7 @@ class Report:
                 # Generate link - if it is one of the matches we are keeping
                 if any(
                     cfr_match["log_id"] == last_match["log_id"]
-                    for cfr_match in self.matches_per_clfr[cfr.skb]
+                    for _, _, cfr_match in self.matches_per_clfr[cfr.skb]
                 ):
                     last_ref = f":ref:`{last_match['date']} <{cfr.skb}-{last_match['log_id']}>`"
                 else:
@@ -338,7 +942,9 @@ class Report:
 
                 # Collect number of runs that fail for other classifiers as well
                 cfr_intersection = {
-                    cfr2.skb: len(self.files_per_cfr[cfr2.skb] & files_with_matches)
+                    cfr2.skb: _bit_count(
+                        self.file_bits_per_cfr[cfr2.skb] & files_with_matches
+                    )
                     for cfr2 in classifiers.classifiers
                 }
 
@@ -351,11 +957,11 @@ class Report:
                     [
                         (
                             cfr2,
-                            cfr_intersection[cfr2.skb] / len(files_with_matches)
-                            - len(self.files_per_cfr[cfr2.skb]) / file_count,
+                            cfr_intersection[cfr2.skb] / files_matched_count
+                            - cfr_file_counts[cfr2.skb] / file_count,
                         )
                         for cfr2 in classifiers.classifiers
-                        if len(self.files_per_cfr[cfr2.skb]) > 0
+                        if cfr_file_counts[cfr2.skb] > 0
                         and cfr2.skb != cfr.skb
                         and (not cfr.taints or not cfr2.skb.startswith("TAINT"))
                     ],
@@ -373,7 +979,7 @@ class Report:
                 [
                     f":ref:`{cfr.skb} <{cfr.skb}>`",
                     cfr.message,
-                    f"{len(files_with_matches)} ({files_matched_rel*100:.1f}%)",
+                    f"{files_matched_count} ({files_matched_rel*100:.1f}%)",
                     last_ref,
                     other_skb_changes,
                 ]
@@ -470,9 +1076,17 @@ class Report:
         )
 
         # Show example matches
-        for cfr_match in self.matches_per_clfr[cfr.skb]:
+        for cfr_match in self.retained_matches(cfr):
 
             first = True
+            loaded = self._load_match_log(cfr_match)
+            if loaded is None:
+                date = cfr_match["date"].strftime("%Y-%m-%d")
+                print(f".. _{cfr.skb}-{cfr_match['log_id']}:\n", file=f)
+                print(rstgen.header(2, f" {date} {cfr_match['name']}"), file=f)
+                print(f"Log {cfr_match['name']} could not be read again.\n", file=f)
+                continue
+            _, cfr_matches = loaded
 
             def test_id(match):
                 return (
@@ -481,12 +1095,10 @@ class Report:
                     match["test"].get("param"),
                 )
 
-            for tid in {test_id(match) for match in cfr_match["matches"]}:
+            for tid in {test_id(match) for match in cfr_matches}:
 
                 # Get all data
-                matches = [
-                    match for match in cfr_match["matches"] if test_id(match) == tid
-                ]
+                matches = [match for match in cfr_matches if test_id(match) == tid]
                 test = matches[0]["test"]
 
                 # Show header for test
@@ -535,7 +1147,12 @@ class Report:
                     to_highlight[line["time"]].append(other)
 
         # Now pretty-print lines
-        for l in cfr_match["log"]:
+        loaded = self._load_match_log(cfr_match)
+        if loaded is None:
+            print("\nLog could not be read!", file=f)
+            return
+        log, _ = loaded
+        for l in log:
             print(logs.pp_line(l), file=f)
             for other in to_highlight.get(l["time"], []):
                 print(f" ^^ {other['cfr'].skb} {other['cfr'].message}", file=f)
@@ -545,7 +1162,7 @@ class Report:
         # Collect all logs to generate
         logs_to_generate = {}
         for cfr in classifiers.classifiers:
-            for cfr_match in self.matches_per_clfr[cfr.skb]:
+            for cfr_match in self.retained_matches(cfr):
                 logs_to_generate[cfr_match["log_id"]] = cfr_match
 
         # Generate them!
@@ -587,3 +1204,33 @@ class Report:
             rows.append(row)
 
         print(rstgen.table(header, rows), file=f)
+
+    def make_profile_table(self, f):
+
+        header = [
+            "**SKB**",
+            "Time",
+            "Max",
+            "Tests",
+            "Evaluated",
+            "Hit rate",
+            "Lines",
+            "Regex calls",
+        ]
+        rows = []
+        for skb, stats in self.profile.to_json()["classifiers"].items():
+            rows.append(
+                [
+                    skb + (" (!)" if skb in self.profile.over_budget else ""),
+                    f"{stats['time']:.2f} s",
+                    f"{stats['max_time']:.3f} s",
+                    str(stats["tests"]),
+                    str(stats["evaluated"]),
+                    f"{100 * stats['hit_rate']:.1f} %",
+                    str(stats["lines"]),
+                    str(stats["regex_calls"]),
+                ]
+            )
+        if not rows:
+            return
+        print(rstgen.table(header, rows), file=f)
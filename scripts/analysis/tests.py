@@ -1,5 +1,156 @@
+import itertools
 import re
 import time
+from collections.abc import Sequence
+
+from analysis import logtable
+
+# Regular expressions for test runner output
+test_start_re = re.compile(
+    "(?P<file>tests/[\w\d/_\-\.]+\.py)\:\:(?P<name>[\w\d/_\-\.]+)(?P<param>\[[^\]]*\])?"
+)
+test_end_re = re.compile("(?P<status>[A-Z]+) (?P<msg>\([^\)]*\))? *\[[ ]*\d+\%\]$")
+test_teardown_re = re.compile("\-+\ [\w ]+ \-+")
+test_error_report_re = re.compile("=+ [A-Z]+ =+")
+session_start_re = re.compile("(=+ test session starts =+|collected.*selected.*)")
+report_start_re = re.compile(
+    "_+ (?P<status>[A-Z]+ at (?P<occasion>\w+) of )?(?P<name>[\w\d_]+)(?P<param>\[[^\]]*\])? _+$"
+)
+section_start_re = re.compile("\-+ (?P<title>[\w ]+) \-+$")
+end_re = re.compile("=+ [ a-z]+ summary [ a-z]+ =+")
+
+
+# Kinds of test runner lines, see _classify_runner_line
+OTHER, EMPTY, SESSION_START, TEST_START, TEARDOWN, ERROR_REPORT, REPORT_START, END = range(8)
+
+
+def is_test_runner_pod(pod):
+    return "makefile-runner" in pod
+
+
+def is_test_runner(line):
+    # Filter out lines from non-makefile-runner pods
+    return "pod" in line and is_test_runner_pod(line["pod"])
+
+
+# First characters of lines _classify_runner_line does not classify as OTHER
+_CLASSIFIED_PREFIXES = frozenset(["", "t", "=", "_", "-", "c"])
+# Test end lines finish with the progress percentage
+_TEST_END_SUFFIXES = ("%]", "%]\n")
+
+
+def _classify_runner_line(msg):
+    """Determines what kind of test runner line we are looking at
+
+    All regular expressions are anchored at the start, so the first
+    character tells us which one can possibly match.
+
+    :returns: Kind of line and match (for TEST_START and REPORT_START)
+    """
+
+    c = msg[:1]
+    if not c:
+        return EMPTY, None
+    if c == "t":
+        m = test_start_re.match(msg)
+        if m:
+            return TEST_START, m
+    elif c == "=":
+        if test_error_report_re.match(msg):
+            return ERROR_REPORT, None
+        if end_re.match(msg):
+            return END, None
+        if session_start_re.match(msg):
+            return SESSION_START, None
+    elif c == "_":
+        m = report_start_re.match(msg)
+        if m:
+            return REPORT_START, m
+    elif c == "-":
+        if test_teardown_re.match(msg):
+            return TEARDOWN, None
+    elif c == "c":
+        if session_start_re.match(msg):
+            return SESSION_START, None
+    return OTHER, None
+
+
+def _search_test_end(msg):
+    return test_end_re.search(msg) if msg.endswith(_TEST_END_SUFFIXES) else None
+
+
+class LineSlice(Sequence):
+    """View of a range of log lines
+
+    Behaves like a (read-only) list of the lines, without copying
+    them. Slicing a view returns a list.
+
+    :param lines: Log lines
+    :param start: Index of first line
+    :param stop: Index after last line
+    """
+
+    __slots__ = ("_lines", "_start", "_stop")
+
+    def __init__(self, lines, start, stop):
+        self._lines = lines
+        self._start = start
+        self._stop = max(start, min(stop, len(lines)))
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._lines[i] for i in range(self._start, self._stop)[index]]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("line slice index out of range")
+        return self._lines[self._start + index]
+
+    def __iter__(self):
+        lines = self._lines
+        for i in range(self._start, self._stop):
+            yield lines[i]
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def _runner_mask(lines):
+    """Determines which lines are from the test runner
+
+    Only checks every pod name once.
+
+    :returns: Sequence of flags, true for test runner lines
+    """
+
+    if isinstance(lines, logtable.LogTable):
+        return lines.mask("pod", is_test_runner_pod)
+    runner_pods = {}
+    mask = bytearray(len(lines))
+    for i, line in enumerate(lines):
+        pod = line.get("pod")
+        if pod is None:
+            continue
+        flag = runner_pods.get(pod)
+        if flag is None:
+            flag = runner_pods[pod] = is_test_runner_pod(pod)
+        mask[i] = flag
+    return mask
+
+
+def _index_runner_lines(lines):
+    """Collects positions and messages of all test runner lines"""
+
+    positions = list(itertools.compress(range(len(lines)), _runner_mask(lines)))
+    return positions, [lines[i]["msg"] for i in positions]
 
 
 def collect_tests(lines, verbosity=0):
@@ -18,6 +169,8 @@ def collect_tests(lines, verbosity=0):
     - 'teardown_detail': Detailed information about teardown added by pytest later
     - ('teardown_detail/main': Teardown exception log)
 
+    Lists of log lines are returned as LineSlice views into lines.
+
     :param lines: Log lines
     :param verbosity: Whether to show a status message
     :returns: dictionary per test
@@ -25,46 +178,62 @@ def collect_tests(lines, verbosity=0):
 
     start_time = time.time()
     tests = []
-    test_start_re = re.compile(
-        "(?P<file>tests/[\w\d/_\-\.]+\.py)\:\:(?P<name>[\w\d/_\-\.]+)(?P<param>\[[^\]]*\])?"
-    )
-    test_end_re = re.compile("(?P<status>[A-Z]+) (?P<msg>\([^\)]*\))? *\[[ ]*\d+\%\]$")
-    test_teardown_re = re.compile("\-+\ [\w ]+ \-+")
-    test_error_report_re = re.compile("=+ [A-Z]+ =+")
+    line_count = len(lines)
 
-    def is_test_runner(line):
-        # Filter out lines from non-makefile-runner pods
-        return "pod" in line and "makefile-runner" in line["pod"]
+    # Index test runner lines. For every runner line, find the
+    # previous line that can start a test (the last test end or empty
+    # line) as well as the next test end and the next empty line.
+    positions, msgs = _index_runner_lines(lines)
+    runner_count = len(positions)
+    kinds = [OTHER] * runner_count
+    matches = [None] * runner_count
+    for k, msg in enumerate(msgs):
+        if msg[:1] in _CLASSIFIED_PREFIXES:
+            kinds[k], matches[k] = _classify_runner_line(msg)
+    ends = [
+        test_end_re.search(msg) if msg.endswith(_TEST_END_SUFFIXES) else None
+        for msg in msgs
+    ]
+    prev_stop = []
+    stop = -1
+    for k in range(runner_count):
+        prev_stop.append(stop)
+        if not msgs[k] or ends[k]:
+            stop = positions[k]
+    next_end = [None] * (runner_count + 1)
+    next_empty = [None] * (runner_count + 1)
+    for k in range(runner_count - 1, -1, -1):
+        next_end[k] = k if ends[k] else next_end[k + 1]
+        next_empty[k] = k if not msgs[k] else next_empty[k + 1]
 
     # Go forward to session start (ignore initialisation)
-    session_start_re = re.compile("(=+ test session starts =+|collected.*selected.*)")
-    i = 0
-    while i < len(lines):
-        if is_test_runner(lines[i]) and session_start_re.match(lines[i]["msg"]):
-            break
-        i += 1
-    i += 1
+    k = 0
+    while k < runner_count and kinds[k] != SESSION_START:
+        k += 1
+    i = (positions[k] if k < runner_count else line_count) + 1
 
     # First phase: Collect main test output
     start_line = i
     skipped = 0
-    while i < len(lines):
-        line = lines[i]
-        if not is_test_runner(line):
-            i += 1
-            skipped += 1
-            continue
-        if test_error_report_re.match(line["msg"]):
-            i += 1
-            skipped += 1
+    while i < line_count:
+
+        # Find next test start (or the error reports)
+        while k < runner_count and positions[k] < i:
+            k += 1
+        while k < runner_count and kinds[k] not in (TEST_START, ERROR_REPORT):
+            k += 1
+        if k >= runner_count:
+            skipped += line_count - i
+            i = line_count
             break
+        if kinds[k] == ERROR_REPORT:
+            skipped += positions[k] + 1 - i
+            i = positions[k] + 1
+            break
+        skipped += positions[k] - i
+        m = matches[k]
 
-        # Start of test?
-        m = test_start_re.match(line["msg"])
-        if not m:
-            i += 1
-            skipped += 1
-            continue
+        # Start of test
         test = {"file": m["file"], "name": m["name"]}
         if m["param"] is not None:
             test["param"] = m["param"]
@@ -73,155 +242,389 @@ def collect_tests(lines, verbosity=0):
         # Get all lines before the first test runner line that are not
         # from the test runner itself - Python waits with generating
         # the line until the test has possibly finished, so relevant
-        # logs often appear *before* this line.
-        while i > 0:
-            if is_test_runner(lines[i - 1]):
-                # An empty line generally marks the beginning of the test
-                if not lines[i - 1]["msg"]:
-                    break
-                # Otherwise stop on the last test case end (i.e. make
-                # sure we do not drop any lines!)
-                if test_end_re.search(lines[i - 1]["msg"]):
-                    break
-            i -= 1
+        # logs often appear *before* this line. An empty line
+        # generally marks the beginning of the test. Otherwise start
+        # after the last test case end (i.e. make sure we do not drop
+        # any lines!)
+        start = prev_stop[k] + 1
 
         # Now add log lines until we hit the end
-        test_lines = []
-        while i < len(lines):
-            test_lines.append(lines[i])
-            # Test ended?
-            if is_test_runner(lines[i]):
-                m = test_end_re.search(lines[i]["msg"])
-                if m:
-                    test["status"] = m["status"]
-                    break
-            i += 1
-        i += 1
-        test["msgs"] = test_lines
+        end = next_end[k]
+        if end is None:
+            test["msgs"] = LineSlice(lines, start, line_count)
+            i = line_count + 1
+            continue
+        test["status"] = ends[end]["status"]
+        test["msgs"] = LineSlice(lines, start, positions[end] + 1)
+        i = positions[end] + 1
+        k = end + 1
 
         # Add further lines if there's a teardown (up to an empty line)
         failed_teardown_prefix = test["file"] + "::" + test["name"] + " "
-        if (
-            i < len(lines)
-            and is_test_runner(lines[i])
-            and test_teardown_re.match(lines[i]["msg"])
-        ):
+        if k < runner_count and positions[k] == i and kinds[k] == TEARDOWN:
 
-            teardown_lines = []
-            while i < len(lines) and (not is_test_runner(lines[i]) or lines[i]["msg"]):
-                teardown_lines.append(lines[i])
-                i += 1
+            teardown_start = i
+            empty = next_empty[k]
+            i = line_count if empty is None else positions[empty]
 
             # Except if the teardown failed, which will be indicated
             # by an empty line followed by a 'FAILED' for the
             # test. Those two lines we also want.
-            if i + 1 < len(lines) and lines[i + 1]["msg"].startswith(
+            if i + 1 < line_count and lines[i + 1]["msg"].startswith(
                 failed_teardown_prefix
             ):
-                teardown_lines.append(lines[i])
-                teardown_lines.append(lines[i + 1])
-                m = test_end_re.search(lines[i + 1]["msg"])
+                m = _search_test_end(lines[i + 1]["msg"])
                 if m:
                     test["teardown_status"] = m["status"]
                 i += 2
 
-            test["teardown"] = teardown_lines
+            test["teardown"] = LineSlice(lines, teardown_start, i)
 
         # Alternatively we can also have a "naked" teardown failure, without log
-        elif i < len(lines) and lines[i]["msg"].startswith(failed_teardown_prefix):
-            m = test_end_re.search(lines[i]["msg"])
+        elif i < line_count and lines[i]["msg"].startswith(failed_teardown_prefix):
+            m = _search_test_end(lines[i]["msg"])
             if m:
                 test["teardown_status"] = m["status"]
-            test["teardown"] = [lines[i]]
+            test["teardown"] = LineSlice(lines, i, i + 1)
             i += 1
 
     # Second phase: Detailed error reports. We get the reports in the
     # same order, which is a god-send because the names are often not
-    # unique. Keep track of which ones we haven't visited yet.
-    unmatched_tests = list(tests)
-    report_start_re = re.compile(
-        "_+ (?P<status>[A-Z]+ at (?P<occasion>\w+) of )?(?P<name>[\w\d_]+)(?P<param>\[[^\]]*\])? _+$"
-    )
-    section_start_re = re.compile("\-+ (?P<title>[\w ]+) \-+$")
-    end_re = re.compile("=+ [ a-z]+ summary [ a-z]+ =+")
-    while i < len(lines):
-        line = lines[i]
-        if not is_test_runner(line):
-            i += 1
-            skipped += 1
-            continue
-        if end_re.match(lines[i]["msg"]):
+    # unique. Keep track of which ones we haven't visited yet (all
+    # from index next_test onwards).
+    next_test = 0
+    while i < line_count:
+
+        # Go to next test runner line
+        while k < runner_count and positions[k] < i:
+            k += 1
+        if k >= runner_count:
+            skipped += line_count - i
+            i = line_count
+            break
+        skipped += positions[k] - i
+        i = positions[k]
+        if kinds[k] == END:
             break
 
         # New reports group?
-        if test_error_report_re.match(lines[i]["msg"]):
+        if kinds[k] == ERROR_REPORT:
             i += 1
             skipped += 1
-            unmatched_tests = list(tests)  # Tests might appear again!
+            next_test = 0  # Tests might appear again!
             continue
 
         # Must match a report start
-        m = report_start_re.match(line["msg"])
-        if not m:
+        if kinds[k] != REPORT_START:
             i += 1
             skipped += 1
             continue
+        m = matches[k]
 
         # Find test
-        while unmatched_tests and (
-            unmatched_tests[0]["name"] != m["name"]
-            or unmatched_tests[0].get("param") != m["param"]
+        while next_test < len(tests) and (
+            tests[next_test]["name"] != m["name"]
+            or tests[next_test].get("param") != m["param"]
         ):
-            unmatched_tests.pop(0)
-        if not unmatched_tests:
+            next_test += 1
+        if next_test >= len(tests):
             print(f"Could not match test {m['name']} {m['param']}! Discarding data!")
             i += 1
             skipped += 1
             continue
-        test = unmatched_tests.pop(0)
+        test = tests[next_test]
+        next_test += 1
         occasion = m["occasion"]
 
+        # Get lines. Note that this includes lines from all pods.
         sections = {}
         current_section = "main"
-        current_lines = [lines[i]]
+        section_start = i
         i += 1
-
-        # Get lines
-        while i < len(lines):
-            if not is_test_runner(line):
-                i += 1
-                skipped += 1
-                continue
+        while i < line_count:
+            msg = lines[i]["msg"]
+            c = msg[:1]
 
             # New report?
-            if (
-                report_start_re.match(lines[i]["msg"])
-                or test_error_report_re.match(lines[i]["msg"])
-                or end_re.match(lines[i]["msg"])
-            ):
+            if c == "_" and report_start_re.match(msg):
+                break
+            if c == "=" and (test_error_report_re.match(msg) or end_re.match(msg)):
                 break
 
             # New section?
-            m = section_start_re.match(lines[i]["msg"])
+            m = section_start_re.match(msg) if c == "-" else None
             if m:
-                sections[current_section] = current_lines
+                sections[current_section] = LineSlice(lines, section_start, i)
                 current_section = m["title"]
-                current_lines = sections.get("current_section", [])
-
-                current_lines.append(lines[i])
-                i += 1
-                continue
-            current_lines.append(lines[i])
+                section_start = i
             i += 1
 
         # Complete reports
-        sections[current_section] = current_lines
+        sections[current_section] = LineSlice(lines, section_start, i)
         test["detail" if occasion is None else occasion + "_detail"] = sections
 
-    skipped += len(lines) - i
+    skipped += line_count - i
     if verbosity > 0:
         print(
-            f"Finished, {len(lines)-skipped-start_line}/{len(lines)-start_line} lines of test report used "
+            f"Finished, {line_count-skipped-start_line}/{line_count-start_line} lines of test report used "
             f"({time.time()-start_time:.2f} s)"
         )
     return tests
+
+
+# States of TestStream
+(
+    _SESSION,
+    _TESTS,
+    _TEST,
+    _AFTER_END,
+    _TEARDOWN,
+    _AFTER_TEARDOWN,
+    _REPORTS,
+    _REPORT,
+    _DONE,
+) = range(9)
+
+
+class TestStream:
+    """Incremental version of collect_tests
+
+    Log lines get fed in as they arrive using add(), which returns
+    every test as soon as its end (and teardown, if any) has been
+    seen. Detailed error reports only appear at the end of the
+    pytest run, so they get attached to the test dictionaries
+    returned earlier. Once all lines have been added, the results are
+    the same as what collect_tests() returns for the same lines.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.tests = []
+        self._runner_pods = {}
+        self._state = _SESSION
+        # Last test end or empty test runner line (see collect_tests)
+        self._last_stop = -1
+        self._test = None
+        self._start = None
+        self._empty = None
+        self._next_test = 0
+        self._occasion = None
+        self._sections = None
+        self._section = None
+
+    def add(self, line):
+        """Adds a log line
+
+        :param line: Log line
+        :returns: List of tests completed by this line
+        """
+
+        i = len(self.lines)
+        self.lines.append(line)
+        runner = False
+        pod = line.get("pod")
+        if pod is not None:
+            runner = self._runner_pods.get(pod)
+            if runner is None:
+                runner = self._runner_pods[pod] = is_test_runner_pod(pod)
+
+        done = []
+        self._step(i, runner, done)
+        if runner:
+            msg = line["msg"]
+            if not msg or _search_test_end(msg):
+                self._last_stop = i
+        return done
+
+    def close(self):
+        """Finishes the stream
+
+        :returns: List of tests that were still incomplete
+        """
+
+        lines = self.lines
+        done = []
+        test = self._test
+        if self._state == _TEST:
+            test["msgs"] = LineSlice(lines, self._start, len(lines))
+            done.append(test)
+        elif self._state == _AFTER_END:
+            done.append(test)
+        elif self._state == _TEARDOWN:
+            test["teardown"] = LineSlice(lines, self._start, len(lines))
+            done.append(test)
+        elif self._state == _AFTER_TEARDOWN:
+            test["teardown"] = LineSlice(lines, self._start, self._empty)
+            done.append(test)
+        elif self._state == _REPORT:
+            self._finish_report(len(lines))
+        self._state = _DONE
+        self._test = None
+        return done
+
+    def _step(self, i, runner, done):
+        lines = self.lines
+        state = self._state
+
+        if state == _SESSION:
+            # Ignore initialisation
+            if runner and _classify_runner_line(lines[i]["msg"])[0] == SESSION_START:
+                self._state = _TESTS
+
+        elif state == _TESTS:
+            if not runner:
+                return
+            kind, m = _classify_runner_line(lines[i]["msg"])
+            if kind == ERROR_REPORT:
+                self._state = _REPORTS
+                return
+            if kind != TEST_START:
+                return
+
+            # Start of test, see collect_tests
+            test = {"file": m["file"], "name": m["name"]}
+            if m["param"] is not None:
+                test["param"] = m["param"]
+            self.tests.append(test)
+            self._test = test
+            self._start = self._last_stop + 1
+            self._state = _TEST
+            # (might end on the same line)
+            self._step(i, runner, done)
+
+        elif state == _TEST:
+            if not runner:
+                return
+            m = _search_test_end(lines[i]["msg"])
+            if m:
+                self._test["status"] = m["status"]
+                self._test["msgs"] = LineSlice(lines, self._start, i + 1)
+                self._state = _AFTER_END
+
+        elif state == _AFTER_END:
+            test = self._test
+            msg = lines[i]["msg"]
+            if runner and msg[:1] == "-" and test_teardown_re.match(msg):
+                self._start = i
+                self._state = _TEARDOWN
+                return
+
+            # "Naked" teardown failure?
+            if msg.startswith(test["file"] + "::" + test["name"] + " "):
+                m = _search_test_end(msg)
+                if m:
+                    test["teardown_status"] = m["status"]
+                test["teardown"] = LineSlice(lines, i, i + 1)
+                self._complete(done)
+                return
+            self._complete(done)
+            self._step(i, runner, done)
+
+        elif state == _TEARDOWN:
+            if runner and not lines[i]["msg"]:
+                self._empty = i
+                self._state = _AFTER_TEARDOWN
+
+        elif state == _AFTER_TEARDOWN:
+            # Teardown failed?
+            test = self._test
+            msg = lines[i]["msg"]
+            if msg.startswith(test["file"] + "::" + test["name"] + " "):
+                m = _search_test_end(msg)
+                if m:
+                    test["teardown_status"] = m["status"]
+                test["teardown"] = LineSlice(lines, self._start, i + 1)
+                self._complete(done)
+                return
+            test["teardown"] = LineSlice(lines, self._start, self._empty)
+            self._complete(done)
+            # (the empty line cannot start a test)
+            self._step(i, runner, done)
+
+        elif state == _REPORTS:
+            if not runner:
+                return
+            kind, m = _classify_runner_line(lines[i]["msg"])
+            if kind == END:
+                self._state = _DONE
+            elif kind == ERROR_REPORT:
+                self._next_test = 0  # Tests might appear again!
+            elif kind == REPORT_START:
+                self._start_report(i, m)
+
+        elif state == _REPORT:
+            msg = lines[i]["msg"]
+            c = msg[:1]
+
+            # New report?
+            if (c == "_" and report_start_re.match(msg)) or (
+                c == "=" and (test_error_report_re.match(msg) or end_re.match(msg))
+            ):
+                self._finish_report(i)
+                self._state = _REPORTS
+                self._step(i, runner, done)
+                return
+
+            # New section?
+            m = section_start_re.match(msg) if c == "-" else None
+            if m:
+                self._sections[self._section] = LineSlice(lines, self._start, i)
+                self._section = m["title"]
+                self._start = i
+
+    def _complete(self, done):
+        done.append(self._test)
+        self._test = None
+        self._state = _TESTS
+
+    def _start_report(self, i, m):
+        # Reports come in the same order as the tests, see collect_tests
+        tests = self.tests
+        next_test = self._next_test
+        while next_test < len(tests) and (
+            tests[next_test]["name"] != m["name"]
+            or tests[next_test].get("param") != m["param"]
+        ):
+            next_test += 1
+        if next_test >= len(tests):
+            print(f"Could not match test {m['name']} {m['param']}! Discarding data!")
+            self._next_test = next_test
+            return
+        self._test = tests[next_test]
+        self._next_test = next_test + 1
+        self._occasion = m["occasion"]
+        self._sections = {}
+        self._section = "main"
+        self._start = i
+        self._state = _REPORT
+
+    def _finish_report(self, i):
+        sections = self._sections
+        sections[self._section] = LineSlice(self.lines, self._start, i)
+        occasion = self._occasion
+        self._test["detail" if occasion is None else occasion + "_detail"] = sections
+        self._test = None
+
+
+def iter_tests(lines, verbosity=0):
+    """Collect pytest results while reading log lines
+
+    Like collect_tests, but returns tests as soon as they have
+    finished. Detailed information ('detail', 'teardown_detail') gets
+    added to the test dictionaries only later.
+
+    :param lines: Log lines, e.g. an iterator as returned by logs.merge_lines()
+    :param verbosity: Whether to show a status message
+    :returns: Iterator over test dictionaries
+    """
+
+    start_time = time.time()
+    stream = TestStream()
+    for line in lines:
+        yield from stream.add(line)
+    yield from stream.close()
+    if verbosity > 0:
+        print(
+            f"Finished, {len(stream.tests)} tests in {len(stream.lines)} lines "
+            f"({time.time()-start_time:.2f} s)"
+        )
@@ -0,0 +1,58 @@
+# /bin/env python3
+"""
+Benchmark parsing of log time stamps
+
+Usage:
+  bench_parse_dates.py [--count=<n>]
+
+Options:
+  --count=<n>  Number of time stamps to parse [default: 2000000]
+
+Time stamps get generated like in a log dump (many lines per second,
+varying numbers of fractional digits), then parsed using strptime as
+well as logs.parse_date(), parse_date_ns() and parse_dates_ns().
+Results are checked against strptime.
+"""
+
+import datetime
+import os
+import random
+import sys
+import time
+
+from docopt import docopt
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from analysis import logs
+
+arguments = docopt(__doc__, version="SKAMPI log analysis")
+count = int(arguments["--count"])
+
+# Generate time stamps
+random.seed(0)
+dt = datetime.datetime(2023, 5, 1, 12, 0, 0)
+dates = []
+for _ in range(count):
+    dt += datetime.timedelta(microseconds=random.randint(0, 2000))
+    date = logs.render_date(dt).rstrip("0")
+    dates.append(date + "0" if date.endswith(".") else date)
+
+
+def strptime(date):
+    dt = datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%f")
+    return dt.replace(tzinfo=datetime.timezone.utc)
+
+
+def bench(name, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{name:15} {time.perf_counter() - start:6.2f} s", flush=True)
+    return result
+
+
+print(f"Parsing {count} time stamps (NumPy {'not ' if logs.numpy is None else ''}available)")
+expected = bench("strptime", lambda: [strptime(date) for date in dates])
+assert bench("parse_date", lambda: [logs.parse_date(date) for date in dates]) == expected
+expected_ns = [logs.time_to_ns(dt) for dt in expected]
+assert bench("parse_date_ns", lambda: [logs.parse_date_ns(date) for date in dates]) == expected_ns
+assert bench("parse_dates_ns", lambda: logs.parse_dates_ns(dates)) == expected_ns
@@ -6,17 +6,34 @@ Usage:
   collect_k8s_logs.py <ns>... [--timefmt=<format>]
       [--pp=<out>] [--dump=<out>] [--tests=<out>] [--test=<out>]
       [--eval=<out>] [--eval-json=<out>] [-v <0,1>] [--pp-thread]
+      [--concurrency=<N>] [--cursor=<file>] [--dump-codec=<codec>]
+      [--pods=<globs>] [--containers=<globs>] [--since=<time>] [--until=<time>]
+      [--min-level=<level>] [--jobs=<N>]
 
 Options:
   <ns>             Namespaces or JSON dump files (files must have '/' or '.')
   --timefmt=<fmt>  Format timestamps (default %H:%M:%S.%f)
   --pp=<out>       Pretty-print to file ('-' for stdout - default)
-  --dump=<out>     Write JSON strings to file ('-' for stdout)
+  --dump=<out>     Write JSON strings to file ('-' for stdout). Files ending
+                   in .jsonz get written as compressed chunked dump
+  --dump-codec=<codec> Compression for chunked dumps (gzip or zstd, default gzip)
   --tests=<out>    Put test case summary into file ('-' for stdout)
   --eval=<out>     Evaluate output against classifiers ('-' for stdout)
   --eval-json=<out> Evaluate, but given JSON output ('-' for stdout)
   --test=<test>    Filter out only test of given name
   --pp-thread      Include thread field in pretty-printed output
+  --concurrency=<N> Number of pod logs to request at once (default 8)
+  --cursor=<file>  Only collect lines not seen in previous runs, keeping
+                   track of them in the given file. If it exists, --dump
+                   appends to the given file instead of overwriting it
+                   (not supported for chunked dumps)
+  --pods=<globs>   Only collect logs of pods matching (comma-separated) patterns
+  --containers=<globs> Only collect logs of containers matching patterns
+  --since=<time>   Only collect lines from given time (UTC, %Y-%m-%dT%H:%M:%S)
+  --until=<time>   Only collect lines before given time
+  --min-level=<level> Only collect lines with at least the given level
+                   (e.g. WARNING). Lines without level are kept.
+  --jobs=<N>       Number of processes to classify tests with (default 1)
   -v <0,1>         Verbosity level for report (0: default, 1: show matched lines)
 """
 
@@ -32,7 +49,7 @@ from docopt import docopt
 from kubernetes import client, config
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from analysis import classifiers, logs, tests
+from analysis import classifiers, logindex, logs, logtable, tests
 
 # Configs can be set in Configuration class directly or using helper utility
 config.load_kube_config()
@@ -46,15 +63,79 @@ if verbosity is None:
 else:
     verbosity = int(verbosity)
 
-lines = []
+concurrency = int(arguments["--concurrency"] or 8)
+jobs = int(arguments["--jobs"] or 1)
+
+# Continue from last collection?
+cursor_file = arguments["--cursor"]
+cursors = None
+dump_mode = "w"
+if cursor_file is not None:
+    if os.path.exists(cursor_file):
+        dump_mode = "a"
+    cursors = logs.load_cursors(cursor_file)
+
+# Filter lines?
+def parse_time_arg(arg):
+    if arg is None:
+        return None
+    return logs.parse_date(arg if "." in arg else arg + ".0")
+
+
+def split_globs(arg):
+    return None if arg is None else arg.split(",")
+
+
+log_filter = None
+if any(
+    arguments[option] is not None
+    for option in ["--pods", "--containers", "--since", "--until", "--min-level"]
+):
+    log_filter = logs.LogFilter(
+        split_globs(arguments["--pods"]),
+        split_globs(arguments["--containers"]),
+        parse_time_arg(arguments["--since"]),
+        parse_time_arg(arguments["--until"]),
+        arguments["--min-level"],
+    )
+
+# Every source is ordered by time, so we can merge them lazily
+streams = []
 for namespace in arguments["<ns>"]:
     if "." in namespace or "/" in namespace:
-        lines += logs.collect_file(namespace, verbosity)
+        if log_filter is None:
+            streams.append(logs.iter_file(namespace, verbosity))
+        else:
+            streams.append(
+                filter(
+                    log_filter.match_line,
+                    logs.iter_file(
+                        namespace, verbosity, start=log_filter.start, end=log_filter.end
+                    ),
+                )
+            )
     else:
-        lines += logs.collect_pod_logs(v1, namespace)
-        lines += logs.collect_events(v1, namespace)
-
-lines = sorted(lines, key=lambda line: line["time"])
+        t = time.time()
+        pod_stats = {}
+        streams += logs.iter_pod_logs(
+            v1, namespace, concurrency, pod_stats, cursors, log_filter
+        )
+        events = logs.collect_events(v1, namespace, cursors, log_filter)
+        streams.append(sorted(events, key=lambda line: line["time"]))
+        print(
+            f"  ... retrieved {sum(s['bytes'] for s in pod_stats.values())} bytes "
+            f"in {sum(s['requests'] for s in pod_stats.values())} requests "
+            f"({time.time() - t:.2f} s)"
+        )
+        if verbosity > 0:
+            for pod, stats in sorted(
+                pod_stats.items(), key=lambda pod_s: pod_s[1]["time"], reverse=True
+            ):
+                print(
+                    f"  {pod}: {stats['requests']} requests, {stats['bytes']} bytes, "
+                    f"{stats['time']:.2f} s"
+                )
+lines = logs.merge_lines(streams)
 
 # Default is pretty-print to stdout
 pp_target = arguments["--pp"]
@@ -68,8 +149,37 @@ if all(
 ):
     pp_target = "-"
 
+# Only after a single test from a single JSON dump? Then we can use an
+# index to read just the lines around the test.
+test_name = arguments["--test"]
+test_results = None
+sources = arguments["<ns>"]
+if (
+    test_name is not None
+    and log_filter is None
+    and tests_target is not None
+    and all(
+        target is None
+        for target in [pp_target, dump_target, eval_target, eval_json_target]
+    )
+    and len(sources) == 1
+    and ("." in sources[0] or "/" in sources[0])
+):
+    try:
+        with logindex.IndexedDump(sources[0], verbosity) as dump:
+            test_results = dump.collect_test(test_name)
+    except ValueError:
+        pass
+
+# Test analysis needs to see all lines at once, so collect them into
+# a (compact) table. Otherwise we can stream lines straight through.
+if test_results is None and any(
+    target is not None for target in [tests_target, eval_target, eval_json_target]
+):
+    lines = logtable.LogTable(lines)
+
 # Small helper for printing to stdout/file
-def make_target(target_name, message=""):
+def make_target(target_name, message="", mode="w"):
     if target_name is not None:
         if target_name == "-":
             yield sys.stdout
@@ -83,7 +193,8 @@ def make_target(target_name, message=""):
                 print(
                     f"  {os.getenv('CI_PROJECT_URL')}/-/jobs/{os.getenv('CI_JOB_ID')}/artifacts/file/{target_name}"
                 )
-            with open(target_name, "w", encoding="utf-8") as f:
+            encoding = None if "b" in mode else "utf-8"
+            with open(target_name, mode, encoding=encoding) as f:
                 yield f
 
 
@@ -91,16 +202,38 @@ def make_target(target_name, message=""):
 def pp_line(line):
     return logs.pp_line(line, arguments["--timefmt"] or "%H:%M:%S.%f",
                         arguments["--pp-thread"])
-for pp_file in make_target(pp_target, f"Pretty-printing to {pp_target}..."):
-    for line in lines:
-        print(pp_line(line), file=pp_file)
 
-# Dump
-for dump_file in make_target(dump_target, f"Dumping JSON to {dump_target}..."):
+# Dump as chunks?
+dump_writer = None
+if dump_target is not None and dump_target.endswith(logs.CHUNKED_SUFFIX):
+    if dump_mode == "a":
+        print("Cannot append to chunked dump!")
+        exit(1)
+    dump_mode = "wb"
+
+# Pretty-print and dump in the same pass over the lines
+pp_files = make_target(pp_target, f"Pretty-printing to {pp_target}...")
+dump_files = make_target(dump_target, f"Dumping JSON to {dump_target}...", dump_mode)
+pp_file = next(pp_files, None)
+dump_file = next(dump_files, None)
+if dump_mode == "wb":
+    dump_writer = logs.ChunkedDumpWriter(dump_file, arguments["--dump-codec"] or "gzip")
+if pp_file is not None or dump_file is not None:
     for line in lines:
-        print(
-            json.dumps({**line, "time": logs.render_date(line["time"])}), file=dump_file
-        )
+        if pp_file is not None:
+            print(pp_line(line), file=pp_file)
+        if dump_writer is not None:
+            dump_writer.write(line)
+        elif dump_file is not None:
+            print(
+                json.dumps({**line, "time": logs.render_date(line["time"])}),
+                file=dump_file,
+            )
+if dump_writer is not None:
+    dump_writer.close()
+# (closes the files)
+pp_files.close()
+dump_files.close()
 
 # Find test cases
 for tests_file in make_target(
@@ -108,9 +241,11 @@ for tests_file in make_target(
 ):
 
     # Done, print results
-    for test in tests.collect_tests(lines, verbosity):
-        if arguments["--test"] is not None:
-            if test["name"] != arguments["--test"]:
+    if test_results is None:
+        test_results = tests.collect_tests(lines, verbosity)
+    for test in test_results:
+        if test_name is not None:
+            if test["name"] != test_name:
                 continue
         print(
             "\n===",
@@ -145,7 +280,9 @@ for tests_file in make_target(
 for eval_file in make_target(eval_target, f"Writing evaluation to {eval_target}..."):
 
     # Evaluate classifiers
-    triggers = classifiers.classify_test_results(tests.collect_tests(lines, verbosity))
+    triggers = classifiers.classify_test_results(
+        tests.collect_tests(lines, verbosity), log=lines, jobs=jobs
+    )
 
     for trigger in triggers:
 
@@ -171,7 +308,9 @@ for eval_json_file in make_target(
 ):
 
     # Evaluate classifiers, write out result
-    triggers = classifiers.classify_test_results(tests.collect_tests(lines, verbosity))
+    triggers = classifiers.classify_test_results(
+        tests.collect_tests(lines, verbosity), log=lines, jobs=jobs
+    )
     outputs = []
     for trigger in triggers:
         outputs.append(
@@ -197,3 +336,7 @@ for eval_json_file in make_target(
             }
         )
     json.dump(outputs, eval_json_file)
+
+# Remember how far we got for next time
+if cursors is not None:
+    logs.save_cursors(cursor_file, cursors)
@@ -0,0 +1,33 @@
+# /bin/env python3
+"""
+Check that the tests classifiers refer to exist
+
+Usage:
+  lint_classifiers.py [--tests=<dir>]
+
+Options:
+  --tests=<dir>  Directory with test sources (default scripts/post-deployment)
+
+Tests found in a different place get registered there as well the
+next time classifiers are loaded. They get recorded in
+scripts/analysis/classifiers-registry.json, which needs to be created
+again whenever scripts/analysis/classifiers.py changes.
+"""
+
+import os
+import pathlib
+import sys
+
+from docopt import docopt
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from analysis import classifiers
+
+arguments = docopt(__doc__, version="SKAMPI log analysis")
+test_directory = classifiers.TEST_DIRECTORY
+if arguments["--tests"] is not None:
+    test_directory = pathlib.Path(arguments["--tests"])
+
+problems = classifiers.lint_classifiers(test_directory)
+print(f"{len(classifiers.classifiers)} classifiers checked, {problems} problems found")
+exit(1 if problems else 0)
@@ -4,6 +4,8 @@ Analyse results from many stress-test runs into a report
 
 Usage:
   make_analysis.py [<eval>...] [--matches-per-clfr=<N>] [--context-lines=<N>]
+     [--jobs=<N>] [--cfr-budget=<s>] [--concurrency=<N>]
+     [--cache=<dir>] [--cache-max-age=<days>] [--cache-max-size=<MB>]
      [--gitlab=<uri>] [--gitlab-header=<k=v>] [--gitlab-project=<id>]
      [--gitlab-search=<k=v>] [--gitlab-job=<name>] [--gitlab-artifact=<name>]
 
@@ -11,6 +13,17 @@ Options:
   <eval>                   Path/URIs of log files (possibly in tarballs)
   --matches-per-clfr=<N>   How many matches to report per classifier (default 3)
   --context-lines=<N>      Log lines to show for context around match (default 30)
+  --jobs=<N>               Number of processes to analyse files with (default 1).
+                           With a single file, its tests get classified in parallel
+  --cfr-budget=<s>         Warn about classifiers taking longer than this on
+                           a single test (default 0.5)
+  --concurrency=<N>        Number of GitLab artefacts to download at once
+                           (default 4)
+  --cache=<dir>            Directory to cache analyses of logs in, so logs
+                           already seen do not get classified again
+  --cache-max-age=<days>   Remove cached analyses not used for this long
+  --cache-max-size=<MB>    Remove least recently used cached analyses until
+                           the cache is at most this large
   --gitlab=<uri>           Gitlab instance to query
   --gitlab-header=<k=v>    Parameters to GitLab API (e.g. private_token=...)
   --gitlab-project=<name>  Project ID to query (e.g. ska-telescope/skampi)
@@ -19,6 +32,7 @@ Options:
   --gitlab-artifact=<name> Artefact to download
 """
 
+import json
 import os
 import sys
 import traceback
@@ -26,17 +40,33 @@ import traceback
 import rstgen
 from docopt import docopt
 
-sys.path.appendos.path.dirname(os.path.abspath(__file__))
-from analysis import classifiers, logs, tests
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from analysis import cache, classifiers, logs, tests
 from analysis.report import Report
 
 arguments = docopt(__doc__, version="SKAMPI log analysis")
 
 matches_per_clfr_count = int(arguments["--matches-per-clfr"] or 3)
 context_lines = int(arguments["--context-lines"] or 30)
+jobs = int(arguments["--jobs"] or 1)
+concurrency = int(arguments["--concurrency"] or 4)
+cfr_budget = arguments["--cfr-budget"]
+if cfr_budget is not None:
+    cfr_budget = float(cfr_budget)
+
+analysis_cache = None
+if arguments["--cache"] is not None:
+    analysis_cache = cache.AnalysisCache(arguments["--cache"], verbosity=1)
 
 # Collected data
-report = Report(matches_per_clfr_count, context_lines)
+report = Report(
+    matches_per_clfr_count,
+    context_lines,
+    cfr_budget,
+    jobs,
+    analysis_cache,
+    concurrency,
+)
 
 # Read from GitLab
 if arguments["--gitlab"] is not None:
@@ -63,16 +93,31 @@ if arguments["--gitlab"] is not None:
     )
 
 # Read triggers from files
-for fname in arguments["<eval>"]:
-    try:
-        report.add_file_or_uri(fname)
-    except Exception:
-        traceback.print_exc()
+if jobs > 1 and len(arguments["<eval>"]) > 1:
+    report.add_files(arguments["<eval>"], jobs)
+else:
+    for fname in arguments["<eval>"]:
+        try:
+            report.add_file_or_uri(fname)
+        except Exception:
+            traceback.print_exc()
 report.build_maps()
 
+# Clean up cache
+if analysis_cache is not None:
+    print(
+        f"Analysis cache: {analysis_cache.hits} hits, {analysis_cache.misses} misses"
+    )
+    max_age = arguments["--cache-max-age"]
+    max_size = arguments["--cache-max-size"]
+    analysis_cache.evict(
+        None if max_age is None else float(max_age) * 24 * 3600,
+        None if max_size is None else float(max_size) * 1024 * 1024,
+    )
+
 # Create overview
 pages = {
-    "Overview": ["overview.rst", "timing.rst"],
+    "Overview": ["overview.rst", "timing.rst", "profile.rst"],
     "Never": [],
     "Always": [],
     "Sometimes": [],
@@ -102,6 +147,23 @@ with open("timing.rst", "w", encoding="utf-8") as f:
 
     report.make_pod_timing_table(f)
 
+# Create classifier profile (also as JSON)
+with open("profile.rst", "w", encoding="utf-8") as f:
+
+    print(rstgen.header(1, "Classifier Profile"), file=f)
+
+    print(
+        "Time spent on every classifier, sorted by total time. Classifiers that "
+        f"took longer than {report.profile.budget:g} s on a single test are "
+        "marked with (!).\n",
+        file=f,
+    )
+
+    report.make_profile_table(f)
+
+with open("profile.json", "w", encoding="utf-8") as f:
+    json.dump(report.profile.to_json(), f, indent=1)
+
 # For every classifier, create report
 for cfr in sorted(classifiers.classifiers, key=lambda cfr: cfr.skb):
     try:
@@ -0,0 +1,8 @@
+"""Makes the log analysis scripts importable for their unit tests."""
+
+import os
+import sys
+
+sys.path.append(
+    os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+)
@@ -0,0 +1,108 @@
+"""Generates synthetic logs of test runs for unit tests."""
+
+import datetime
+import random
+
+RUNNER = "makefile-runner-abc"
+PODS = ["centralnode-01-0", "subarraynode1-sa1-0", "sdp-lmc-subarray-01-0", "proccontrol-0"]
+TESTS = [
+    ("tests/smoke/test_mvp_clean.py", "test_is_running"),
+    ("tests/smoke/test_devices.py", "test_dish_in_idle"),
+    ("tests/acceptance/test_XR-13_A1.py", "test_allocate_resources"),
+    ("tests/integration/test_foo.py", "test_bar"),
+]
+MSGS = [
+    "KeyError: 'On'",
+    "transition: OFF",
+    "It seems some elements are in fault, will attempt to clear them",
+    "all good",
+    "Command On not allowed when the device is in OFF state",
+]
+
+
+def banner(title, char):
+    """Renders a section header the way pytest does"""
+    return f" {title} ".center(80, char)
+
+
+def make_lines(test_count, seed=0, truncate=False):
+    """Generates the log of a test run as produced by logs.collect_file
+
+    Tests get run with random outcomes, teardowns and log lines from
+    other pods, followed by a failure report and a summary, as
+    pytest would output them.
+
+    :param test_count: Number of tests to run
+    :param seed: Random seed
+    :param truncate: Cut the log off at a random line
+    :returns: List of log line dictionaries (with time as string)
+    """
+
+    rand = random.Random(seed)
+    t = datetime.datetime(2023, 5, 1, 12, 0, 0)
+    lines = []
+
+    def emit(pod, msg):
+        nonlocal t
+        t += datetime.timedelta(microseconds=rand.randint(1, 300000))
+        lines.append(
+            {
+                "pod": pod,
+                "container": pod.split("-")[0],
+                "time": t.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+                "msg": msg,
+            }
+        )
+
+    def other_lines(count, runner=False):
+        for _ in range(rand.randint(0, count)):
+            emit(rand.choice(PODS + [RUNNER] * runner), rand.choice(MSGS))
+
+    emit(RUNNER, banner("test session starts", "="))
+    emit(RUNNER, f"collected {test_count} items / 0 deselected / {test_count} selected")
+    done = []
+    for k in range(test_count):
+        fname, name = rand.choice(TESTS)
+        name += rand.choice(["", "", "[a-1]", "[b]"])
+        progress = f"[{100 * (k + 1) // test_count:3d}%]"
+        emit(RUNNER, "")
+        other_lines(4)
+        emit(RUNNER, f"{fname}::{name} ")
+        other_lines(6, runner=True)
+        status = rand.choice(["PASSED", "PASSED", "FAILED", "XFAIL", "SKIPPED"])
+        if rand.random() < 0.3:
+            emit(RUNNER, f"{status} (some reason)                          {progress}")
+        else:
+            emit(RUNNER, f"{status}                                  {progress}")
+        teardown = rand.random() < 0.2
+        if teardown:
+            emit(RUNNER, banner("live log teardown", "-"))
+            other_lines(3, runner=True)
+            if rand.random() < 0.5:
+                emit(RUNNER, "")
+                emit(RUNNER, f"{fname}::{name} ERROR                   {progress}")
+        elif rand.random() < 0.1:
+            # Teardown failing without log
+            teardown = True
+            emit(RUNNER, f"{fname}::{name} ERROR                   {progress}")
+        done.append((name, status, teardown))
+
+    emit(RUNNER, "")
+    emit(RUNNER, banner("FAILURES", "="))
+    for name, status, _ in done:
+        if status == "FAILED":
+            emit(RUNNER, banner(name, "_"))
+            emit(RUNNER, "E   AssertionError: Expected <400> to be equal to <200>")
+            emit(RUNNER, banner("Captured log call", "-"))
+            other_lines(3, runner=True)
+    emit(RUNNER, banner("ERRORS", "="))
+    for name, _, teardown in done:
+        if teardown and rand.random() < 0.5:
+            emit(RUNNER, banner(f"ERROR at teardown of {name}", "_"))
+            emit(RUNNER, "E   KeyError: 'StartUpTelescope'")
+    emit(RUNNER, banner("short test summary info", "="))
+    emit(RUNNER, "FAILED foo")
+
+    if truncate:
+        del lines[rand.randint(1, len(lines)) :]
+    return lines
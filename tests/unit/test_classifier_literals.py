@@ -0,0 +1,273 @@
+"""Pre-filtering classifiers by required literals (scripts/analysis/classifiers.py)."""
+
+import datetime
+import inspect
+import random
+import re
+import string
+
+import pytest
+
+from analysis import classifiers
+from analysis.classifiers import sre_parse
+
+# Characters to build sample strings from
+ALPHABET = string.ascii_letters + string.digits + " .:_-()'[]<>"
+
+CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: str.isdigit,
+    sre_parse.CATEGORY_NOT_DIGIT: lambda c: not c.isdigit(),
+    sre_parse.CATEGORY_SPACE: str.isspace,
+    sre_parse.CATEGORY_NOT_SPACE: lambda c: not c.isspace(),
+    sre_parse.CATEGORY_WORD: lambda c: c.isalnum() or c == "_",
+    sre_parse.CATEGORY_NOT_WORD: lambda c: not (c.isalnum() or c == "_"),
+}
+
+
+def _in_set(items, c):
+    for op, av in items:
+        if op is sre_parse.LITERAL and c == chr(av):
+            return True
+        if op is sre_parse.RANGE and av[0] <= ord(c) <= av[1]:
+            return True
+        if op is sre_parse.CATEGORY and CATEGORIES[av](c):
+            return True
+    return False
+
+
+def _sample(pattern, rand, out, ignorecase, groups):
+    for op, av in pattern:
+        if op is sre_parse.LITERAL:
+            c = chr(av)
+            out.append(c.swapcase() if ignorecase and rand.random() < 0.5 else c)
+        elif op is sre_parse.NOT_LITERAL:
+            out.append(rand.choice([c for c in ALPHABET if c != chr(av)]))
+        elif op is sre_parse.ANY:
+            out.append(rand.choice(ALPHABET))
+        elif op is sre_parse.IN:
+            if av[0][0] is sre_parse.NEGATE:
+                chars = [c for c in ALPHABET if not _in_set(av[1:], c)]
+            else:
+                chars = [c for c in ALPHABET + " \t" if _in_set(av, c)]
+                chars += [chr(a) for o, a in av if o is sre_parse.LITERAL]
+            out.append(rand.choice(chars))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            min_count, max_count, sub_pattern = av
+            for _ in range(rand.randint(min_count, min(max_count, min_count + 3))):
+                _sample(sub_pattern, rand, out, ignorecase, groups)
+        elif op is sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, sub_pattern = av
+            sub_ignorecase = add_flags & re.I or ignorecase and not del_flags & re.I
+            start = len(out)
+            _sample(sub_pattern, rand, out, sub_ignorecase, groups)
+            groups[group] = "".join(out[start:])
+        elif op is sre_parse.BRANCH:
+            _sample(rand.choice(av[1]), rand, out, ignorecase, groups)
+        elif op is sre_parse.GROUPREF:
+            out.append(groups[av])
+        elif op is sre_parse.ASSERT:
+            # Look-ahead: Might be satisfied by what follows, or not
+            direction, sub_pattern = av
+            if direction > 0 and rand.random() < 0.5:
+                _sample(sub_pattern, rand, out, ignorecase, groups)
+        # Anchors and negative look-arounds get ignored, which might
+        # produce strings that do not match
+        elif op not in (sre_parse.AT, sre_parse.ASSERT_NOT):
+            raise ValueError(f"Cannot sample {op}")
+
+
+def sample(regex, rand, tries=100):
+    """Generates a random string matching a regular expression
+
+    :returns: String, or None if no match was found
+    """
+
+    pattern = sre_parse.parse(regex)
+    for _ in range(tries):
+        out = []
+        _sample(pattern, rand, out, pattern.state.flags & re.I, {})
+        s = "".join(out)
+        if re.match(regex, s):
+            return s
+    return None
+
+
+@pytest.mark.parametrize(
+    "regex,literal",
+    [
+        # Plain literals and escapes
+        (r"abc", "abc"),
+        (r"ab", None),
+        (r"a\.b\(c\)", "a.b(c)"),
+        (r"a\.b\d+cdef\s*\w", "cdef"),
+        (r"[a]bcd", "abcd"),
+        (r"\Aabcd\b", "abcd"),
+        (r"(?x) a b c d  # comment", "abcd"),
+        # Alternations
+        (r"abcd|efgh", None),
+        (r"abcd|abce", "abc"),
+        (r"(?:abcd|efgh)ijk", "ijk"),
+        (r"x(abcd|efgh)", None),
+        # Ignoring case
+        (r"(?i)abcd", None),
+        (r"(?i:abcd)efg", "efg"),
+        (r"xy(?i:abcd)", None),
+        (r"(?i:ab(?-i:cdef))", None),
+        (r"(?s:abcd)", "abcd"),
+        # Optional groups and repeats
+        (r"abc?", None),
+        (r"abcd*", "abc"),
+        (r"abc{0,2}", None),
+        (r"(abcd)?x", None),
+        (r"(a)?bcd", "bcd"),
+        (r"x(?:abcd)*", None),
+        (r"(?:xyz){2}", "xyz"),
+        (r"(?:abc)+?", "abc"),
+        (r"(?:(?i:abcd)x)+", None),
+        # Groups and look-arounds
+        (r"(?P<n>abcd)(?P=n)", "abcd"),
+        (r"x(?=.*abcd)", None),
+        (r"(?!abcd)xyz", "xyz"),
+    ],
+)
+def test_required_literal(regex, literal):
+    assert classifiers.required_literal(regex) == literal
+    rand = random.Random(regex)
+    for _ in range(20):
+        s = sample(regex, rand)
+        assert s is not None
+        assert literal is None or literal in s
+
+
+def test_invalid_regex():
+    assert classifiers.required_literal(r"(abcd") is None
+
+
+def _predicate_args(predicate):
+    """Reconstructs arguments of predicates from their closures"""
+
+    args = inspect.getclosurevars(predicate).nonlocals
+    if "predicates" in args:
+        return [a for p in args["predicates"] for a in _predicate_args(p)]
+    if "states" in args:
+        return [{"states": args["states"]}]
+    after_msg_rc = args.get("after_msg_rc")
+    return [
+        {
+            "msg_r": args["msg_rc"].pattern,
+            "after_msg_r": after_msg_rc and after_msg_rc.pattern,
+            "section": args.get("section", "msgs"),
+            "missing": args["missing"],
+            "msg_attrs": args.get("msg_attrs", {}),
+            "after_msg_attrs": args.get("after_msg_attrs", {}),
+        }
+    ]
+
+
+def _classifier_regexes():
+    regexes = set()
+    for cfr in classifiers.classifiers:
+        for predicate in cfr.predicates:
+            for args in _predicate_args(predicate):
+                regexes.add(args.get("msg_r"))
+                regexes.add(args.get("after_msg_r"))
+    regexes.discard(None)
+    return sorted(regexes)
+
+
+@pytest.mark.parametrize("regex", _classifier_regexes())
+def test_classifier_literals(regex):
+    """Literals of all classifiers appear in strings they match"""
+
+    literal = classifiers.required_literal(regex)
+    rand = random.Random(regex)
+    for _ in range(20):
+        s = sample(regex, rand)
+        assert s is not None
+        assert literal is None or literal in s
+
+
+def _make_test(cfr, predicate, rand):
+    """Makes a test that the predicate of a classifier might match"""
+
+    test = {"file": cfr.tests[0][0], "name": cfr.tests[0][1], "status": "FAILED", "msgs": []}
+    t = datetime.datetime(2023, 5, 1)
+    for args in _predicate_args(predicate):
+        if "states" in args:
+            test["status"] = args["states"][0]
+            continue
+        if args["missing"]:
+            continue
+        lines = test
+        *path, last = args["section"].split("/")
+        for key in path:
+            lines = lines.setdefault(key, {})
+        lines = lines.setdefault(last, [])
+        for regex, attrs in [
+            (args["after_msg_r"], args["after_msg_attrs"]),
+            (args["msg_r"], args["msg_attrs"]),
+        ]:
+            if regex is not None:
+                t += datetime.timedelta(milliseconds=1)
+                line = {k: sorted(v)[0] for k, v in attrs.items()}
+                lines.append({**line, "time": t, "msg": sample(regex, rand)})
+    return test
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_candidates(seed):
+    """Classifiers matching a test are never filtered out"""
+
+    rand = random.Random(seed)
+    cfr_set = classifiers.ClassifierSet(classifiers.classifiers)
+    hits = 0
+    for cfr in classifiers.classifiers:
+        for predicate in cfr.predicates:
+            test = _make_test(cfr, predicate, rand)
+            if cfr(test, []) > 0:
+                hits += 1
+                assert cfr_set.candidates(test, [cfr]) == [cfr]
+                assert cfr in cfr_set.candidates(test, classifiers.classifiers)
+
+    # Most predicates should match their test
+    assert hits >= 0.9 * sum(len(cfr.predicates) for cfr in classifiers.classifiers)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_candidates_combined(seed):
+    """... also if a test has lines for many classifiers"""
+
+    rand = random.Random(seed)
+    test = {"file": None, "name": None, "status": "FAILED", "msgs": []}
+    for cfr in classifiers.classifiers:
+        for predicate in cfr.predicates:
+            for key, value in _make_test(cfr, predicate, rand).items():
+                if isinstance(value, list):
+                    test[key] = test.get(key, []) + value
+                elif isinstance(value, dict):
+                    for section, lines in value.items():
+                        test.setdefault(key, {}).setdefault(section, []).extend(lines)
+
+    cfr_set = classifiers.ClassifierSet(classifiers.classifiers)
+    candidates = cfr_set.candidates(test, classifiers.classifiers)
+    hits = [cfr for cfr in classifiers.classifiers if cfr(test, []) > 0]
+    assert len(hits) > len(classifiers.classifiers) // 2
+    assert set(hits) <= set(candidates)
+
+
+def test_candidates_overlapping():
+    """Literals get found if they are prefixes of or overlap with others"""
+
+    cfrs = [
+        classifiers.Classifier([(None, None)], [classifiers.match_msg(regex)], skb, "")
+        for skb, regex in [
+            ("A", r"abcdef.*"),
+            ("B", r"abc.*"),
+            ("C", r".*bcdefg"),
+            ("D", r".*cdx"),
+        ]
+    ]
+    cfr_set = classifiers.ClassifierSet(cfrs)
+    test = {"msgs": [{"msg": "abcdefg"}]}
+    assert [cfr.skb for cfr in cfr_set.candidates(test, cfrs)] == ["A", "B", "C"]
+    assert [cfr.skb for cfr in cfrs if cfr(test, [])] == ["A", "B", "C"]
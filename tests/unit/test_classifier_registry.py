@@ -0,0 +1,26 @@
+"""Caching test aliases of classifiers (scripts/analysis/classifiers.py)."""
+
+import json
+
+from analysis import classifiers
+
+ALIASES = {("tests/old/test_a.py", "test_a"): [("tests/new/test_a.py", "test_a")]}
+
+
+def test_round_trip(tmp_path):
+    cache_file = tmp_path / "registry.json"
+    classifiers.save_registry_cache(ALIASES, cache_file)
+    assert classifiers.load_registry_cache(cache_file) == ALIASES
+    classifiers.save_registry_cache({}, cache_file)
+    assert classifiers.load_registry_cache(cache_file) == {}
+
+
+def test_no_valid_cache(tmp_path):
+    """Missing, broken and outdated caches are told apart from empty ones"""
+
+    cache_file = tmp_path / "registry.json"
+    assert classifiers.load_registry_cache(cache_file) is None
+    cache_file.write_text("{")
+    assert classifiers.load_registry_cache(cache_file) is None
+    cache_file.write_text(json.dumps({"hash": "outdated", "aliases": []}))
+    assert classifiers.load_registry_cache(cache_file) is None
@@ -0,0 +1,133 @@
+"""Windowed message predicates (match_msg in scripts/analysis/classifiers.py)."""
+
+import datetime
+import random
+import re
+
+import pytest
+
+from analysis import classifiers
+
+MSGS = ["start scan", "scan done", "error in scan", "start configure", "idle"]
+PODS = ["pod-a", "pod-b"]
+
+
+def make_section(rand, length, timing):
+    """Makes lines of a test section
+
+    :param timing: "sorted", "unsorted" or "missing" time stamps
+    """
+
+    t = datetime.datetime(2023, 5, 1)
+    lines = []
+    for _ in range(length):
+        t += datetime.timedelta(seconds=rand.choice([0, 0.5, 1, 2]))
+        lines.append({"pod": rand.choice(PODS), "time": t, "msg": rand.choice(MSGS)})
+    if timing == "missing" and lines:
+        for l in rand.sample(lines, rand.randint(1, len(lines))):
+            del l["time"]
+    if timing == "unsorted" and len(lines) > 1:
+        l = rand.choice(lines[1:])
+        l["time"] = lines[0]["time"] - datetime.timedelta(seconds=rand.choice([0.5, 3]))
+    return lines
+
+
+def reference(lines, msg_r, after_msg_r, after_attrs, attrs, max_time, max_count, missing):
+    """Straightforward evaluation of match_msg
+
+    :returns: Count (or whether nothing matched if missing) and matched lines
+    """
+
+    def attrs_match(line, attrs):
+        return all(line.get(k, "") == v for k, v in attrs.items())
+
+    window = lines
+    start_time = None
+    if after_msg_r is not None:
+        anchors = [
+            i
+            for i, l in enumerate(lines)
+            if attrs_match(l, after_attrs) and re.match(after_msg_r, l["msg"])
+        ]
+        if not anchors:
+            return 0, []
+        window = lines[anchors[0] + 1 :]
+        start_time = lines[anchors[0]].get("time")
+    if max_count is not None:
+        window = window[:max_count]
+    if max_time is not None:
+        # Window starts at "after" message, or first message with time
+        for i, l in enumerate(window):
+            start_time = start_time or l.get("time")
+            end_time = start_time and start_time + datetime.timedelta(seconds=max_time)
+            if "time" in l and l["time"] > end_time:
+                window = window[:i]
+                break
+    matched = [l for l in window if attrs_match(l, attrs) and re.match(msg_r, l["msg"])]
+    if missing:
+        return not matched, matched
+    return len(matched), matched
+
+
+@pytest.mark.parametrize("timing", ["sorted", "unsorted", "missing"])
+@pytest.mark.parametrize("seed", range(10))
+def test_windows(timing, seed):
+    """Bisection and walking through lines find the same lines"""
+
+    rand = random.Random(seed)
+    for _ in range(50):
+        lines = make_section(rand, rand.randint(0, 20), timing)
+        msg_r = rand.choice([r"scan.*", r".*scan", r"idle"])
+        after_msg_r = rand.choice([None, r"start.*", r"start scan"])
+        after_attrs = rand.choice([{}, {"pod": "pod-a"}])
+        attrs = rand.choice([{}, {"pod": "pod-b"}])
+        max_time = rand.choice([None, 0, 1, 2.5])
+        max_count = rand.choice([None, 0, 1, 3])
+        missing = rand.random() < 0.3
+        check = classifiers.match_msg(
+            msg_r,
+            after_msg_r=after_msg_r,
+            after_msg_attrs=after_attrs,
+            max_time=max_time,
+            max_count=max_count,
+            missing=missing,
+            **attrs,
+        )
+        expected_count, expected = reference(
+            lines, msg_r, after_msg_r, after_attrs, attrs, max_time, max_count, missing
+        )
+
+        # Bisecting needs sorted time stamps, otherwise match_msg
+        # falls back to walking through the lines
+        index = classifiers.SectionIndex(lines)
+        if max_time is not None and len(lines) > 1:
+            assert (index.times() is not None) == (timing == "sorted")
+        for test in [{"msgs": lines}, {"msgs": lines, "section_index": {"msgs": index}}]:
+            matched = []
+            assert check(test, matched) == expected_count
+            assert [id(l) for l in matched] == [id(l) for l in expected]
+
+
+def test_fallback(monkeypatch):
+    """Walking through lines gives the same results for sorted lines"""
+
+    rand = random.Random(0)
+    cases = []
+    for _ in range(500):
+        lines = make_section(rand, rand.randint(0, 20), "sorted")
+        args = dict(
+            after_msg_r=rand.choice([None, r"start.*"]),
+            after_msg_attrs=rand.choice([{}, {"pod": "pod-a"}]),
+            max_time=rand.choice([0, 1, 2.5]),
+            max_count=rand.choice([None, 0, 1, 3]),
+            missing=rand.random() < 0.3,
+        )
+        check = classifiers.match_msg(r".*scan", **args)
+        matched = []
+        cases.append((lines, check, check({"msgs": lines}, matched), matched))
+
+    monkeypatch.setattr(classifiers.SectionIndex, "times", lambda self: None)
+    for lines, check, count, matched in cases:
+        fallback_matched = []
+        assert check({"msgs": lines}, fallback_matched) == count
+        assert [id(l) for l in fallback_matched] == [id(l) for l in matched]
@@ -0,0 +1,29 @@
+"""Classification in worker processes (scripts/analysis/classifiers.py)."""
+
+import threading
+
+from analysis import classifiers
+
+
+def test_no_fork_with_threads(monkeypatch):
+    """Tests get classified in the parent while other threads run"""
+
+    calls = []
+
+    def classify_parallel(test_results, log, jobs, profile, cfr_time):
+        calls.append(jobs)
+        return []
+
+    monkeypatch.setattr(classifiers, "_classify_parallel", classify_parallel)
+    assert list(classifiers.iter_classify_test_results([], log=[], jobs=2)) == []
+    assert calls == [2]
+
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        assert list(classifiers.iter_classify_test_results([], log=[], jobs=2)) == []
+    finally:
+        stop.set()
+        thread.join()
+    assert calls == [2]
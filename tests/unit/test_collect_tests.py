@@ -0,0 +1,81 @@
+"""Segmenting logs into tests (tests.collect_tests in scripts/analysis/tests.py)."""
+
+import gc
+import json
+import os
+import re
+import time
+from collections.abc import Mapping, Sequence
+
+import pytest
+import synthetic_logs
+
+from analysis import tests
+
+# Results of collect_tests() before it was rewritten to segment logs
+# in a single pass, for logs generated by synthetic_logs.make_lines().
+# Lists of lines are given as [start, stop) index ranges.
+EXPECTED = os.path.join(os.path.dirname(__file__), "data", "collect_tests.json")
+with open(EXPECTED) as f:
+    CASES = json.load(f)
+
+
+def line_ranges(lines, index):
+    ranges = []
+    for i in (index[id(line)] for line in lines):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return ranges
+
+
+def encode(test, index):
+    """Replaces lists of lines in a test by index ranges"""
+
+    return {
+        key: (
+            {title: line_ranges(section, index) for title, section in value.items()}
+            if isinstance(value, Mapping)
+            else line_ranges(value, index)
+            if isinstance(value, Sequence) and not isinstance(value, str)
+            else value
+        )
+        for key, value in test.items()
+    }
+
+
+@pytest.mark.parametrize(
+    "case", CASES, ids=lambda case: f"{case['tests']}-{case['seed']}-{case['truncate']}"
+)
+def test_same_as_before(case, capsys):
+    """Tests get segmented as before, line by line"""
+
+    lines = synthetic_logs.make_lines(case["tests"], case["seed"], case["truncate"])
+    index = {id(line): i for i, line in enumerate(lines)}
+    result = tests.collect_tests(lines, 1)
+    assert [encode(test, index) for test in result] == case["expected"]
+
+    output = capsys.readouterr().out.splitlines()
+    assert [re.sub(r" \(\d+\.\d+ s\)$", "", msg) for msg in output] == case["output"]
+
+
+def test_linear_time():
+    """Time taken grows linearly with the number of tests"""
+
+    def best_time(lines):
+        times = []
+        gc.disable()
+        try:
+            for _ in range(3):
+                start = time.perf_counter()
+                tests.collect_tests(lines)
+                times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        return min(times)
+
+    time_10k = best_time(synthetic_logs.make_lines(10000))
+    time_20k = best_time(synthetic_logs.make_lines(20000))
+    # (Quadratic time would make this 4)
+    assert time_20k / time_10k < 3
@@ -0,0 +1,134 @@
+"""Concurrent collection of container logs (scripts/analysis/logs.py)."""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from kubernetes.client.rest import ApiException
+
+from analysis import logs
+
+
+class FakeCoreV1Api:
+    """Stand-in for kubernetes.client.CoreV1Api serving canned logs
+
+    :param pod_logs: Logs by pod and container name
+    :param delays: Seconds to wait before answering, by (pod, container)
+    :param failing: (pod, container) pairs to fail requests for
+    """
+
+    def __init__(self, pod_logs, delays=None, failing=()):
+        self.pod_logs = pod_logs
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def list_namespaced_pod(self, namespace, watch=False):
+        return SimpleNamespace(
+            items=[
+                SimpleNamespace(
+                    metadata=SimpleNamespace(name=pod),
+                    spec=SimpleNamespace(
+                        init_containers=None,
+                        containers=[SimpleNamespace(name=name) for name in containers],
+                    ),
+                )
+                for pod, containers in self.pod_logs.items()
+            ]
+        )
+
+    def read_namespaced_pod_log(
+        self, pod, namespace, previous, container, timestamps, **kwargs
+    ):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delays.get((pod, container), 0.01))
+            if previous:
+                e = ApiException(status=400, reason="Bad Request")
+                e.body = json.dumps(
+                    {"message": f'previous terminated container "{container}" not found'}
+                )
+                raise e
+            if (pod, container) in self.failing:
+                raise ApiException(status=500, reason="Internal Server Error")
+            return self.pod_logs[pod][container]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def make_log(*lines):
+    return "".join(f"2023-01-01T00:00:{t:09.6f}123Z {msg}\n" for t, msg in lines)
+
+
+def collect(api, concurrency):
+    streams = list(logs.iter_pod_logs(api, "ns", concurrency))
+    return [
+        (line["pod"], line["container"], line["msg"]) for line in logs.merge_lines(streams)
+    ]
+
+
+def test_order_preserved():
+    """Lines get merged by time (ties in container order), however long requests take"""
+
+    api = FakeCoreV1Api(
+        {
+            "pod-a": {
+                "c1": make_log((1, "a1 first"), (3, "a1 second"), (5, "a1 third")),
+                "c2": make_log((2, "a2 first"), (3, "a2 second")),
+            },
+            "pod-b": {"c1": make_log((0, "b1 first"), (3, "b1 second"))},
+        },
+        # Earlier containers answer last
+        delays={("pod-a", "c1"): 0.2, ("pod-a", "c2"): 0.1, ("pod-b", "c1"): 0},
+    )
+    assert collect(api, 4) == [
+        ("pod-b", "c1", "b1 first"),
+        ("pod-a", "c1", "a1 first"),
+        ("pod-a", "c2", "a2 first"),
+        ("pod-a", "c1", "a1 second"),
+        ("pod-a", "c2", "a2 second"),
+        ("pod-b", "c1", "b1 second"),
+        ("pod-a", "c1", "a1 third"),
+    ]
+
+
+def test_concurrency_limit():
+    """No more requests than allowed are issued at the same time"""
+
+    api = FakeCoreV1Api(
+        {
+            f"pod-{i}": {f"c{j}": make_log((i + j, f"{i}/{j}")) for j in range(3)}
+            for i in range(4)
+        },
+        delays={(f"pod-{i}", f"c{j}"): 0.05 for i in range(4) for j in range(3)},
+    )
+    assert len(collect(api, 3)) == 12
+    assert 1 < api.max_active <= 3
+
+    api.max_active = 0
+    assert len(collect(api, 1)) == 12
+    assert api.max_active == 1
+
+
+def test_failing_container(capsys):
+    """A container failing to return its log does not stop collection"""
+
+    api = FakeCoreV1Api(
+        {
+            "pod-a": {"c1": make_log((1, "a1")), "c2": make_log((2, "a2"))},
+            "pod-b": {"c1": make_log((3, "b1"))},
+        },
+        failing=[("pod-a", "c2")],
+    )
+    assert collect(api, 2) == [("pod-a", "c1", "a1"), ("pod-b", "c1", "b1")]
+
+    # Only the unexpected error gets reported
+    out = capsys.readouterr().out
+    assert "While querying logs for pod pod-a container c2" in out
+    assert "not found" not in out
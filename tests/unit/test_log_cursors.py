@@ -0,0 +1,29 @@
+"""Incremental collection with log cursors (scripts/analysis/logs.py)."""
+
+from analysis import logs
+
+ATTRS = {"pod": "pod-a", "container": "c1", "previous": False, "namespace": "ns"}
+KEY = logs.cursor_key("ns", "pod-a", "c1", False)
+
+
+def test_same_time_stamp():
+    """Lines with the same time stamp all get returned, and only once"""
+
+    log = (
+        "2023-01-01T00:00:01.000000000Z first\n"
+        "2023-01-01T00:00:01.000000000Z same time\n"
+        "2023-01-01T00:00:02.000000000Z later\n"
+    )
+    cursors = {}
+    lines = list(logs.iter_log_lines(log, ATTRS, cursors))
+    assert [line["msg"] for line in lines] == ["first", "same time", "later"]
+    assert cursors[KEY] == logs.parse_date("2023-01-01T00:00:02.000000")
+
+    # Collecting again only returns new lines
+    log += (
+        "2023-01-01T00:00:03.000000000Z new\n"
+        "2023-01-01T00:00:03.000000000Z new, same time\n"
+    )
+    lines = list(logs.iter_log_lines(log, ATTRS, cursors))
+    assert [line["msg"] for line in lines] == ["new", "new, same time"]
+    assert cursors[KEY] == logs.parse_date("2023-01-01T00:00:03.000000")
@@ -0,0 +1,82 @@
+"""Parsing of log time stamps (scripts/analysis/logs.py)."""
+
+import datetime
+
+import pytest
+
+from analysis import logs
+
+VALID = [
+    "2023-05-01T12:34:56.1",
+    "2023-05-01T12:34:56.12",
+    "2023-05-01T12:34:56.000001",
+    "2023-05-01T12:34:56.123456",
+    "2023-05-01T12:34:56.010",
+    "2024-02-29T23:59:59.999999",
+    "1970-01-01T00:00:00.0",
+    "1969-12-31T23:59:59.5",
+    "0023-05-01T12:34:56.413934",
+    "9999-12-31T23:59:59.999999",
+    # Accepted by strptime, but not in the fixed format
+    "2023-5-1T1:2:3.4",
+    "2023-05-01T12:34:5.12",
+]
+INVALID = [
+    "",
+    "2023-05-01T12:34:56",
+    "2023-05-01T12:34:56.",
+    "2023-05-01T12:34:56.1234567",
+    "2023-05-01T12:34:56.5Z",
+    "2023-05-01T12:34:56.+5",
+    "2023-05-01T12:34:56.-5",
+    "2023-05-01T12:34:56.1_2",
+    "2023-05-01T12:34:56. 5",
+    "2023-05-01T12:34:56.5 ",
+    "2023-05-01T12:34:56.\N{SUPERSCRIPT TWO}",
+    "2023-05-01 12:34:56.5",
+    "2023-02-29T12:34:56.5",
+    "2023-05-01T24:00:00.5",
+    "20230-05-01T12:34:56.5",
+]
+
+
+def strptime(date):
+    dt = datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%f")
+    return dt.replace(tzinfo=datetime.timezone.utc)
+
+
+@pytest.mark.parametrize("date", VALID)
+def test_valid(date):
+    """Time stamps get parsed just like strptime does"""
+
+    expected = strptime(date)
+    expected_ns = (expected - logs.EPOCH) // datetime.timedelta(microseconds=1) * 1000
+    assert logs.parse_date(date) == expected
+    assert logs.parse_date_ns(date) == expected_ns
+    assert logs.parse_dates_ns([VALID[0], date]) == [
+        logs.parse_date_ns(VALID[0]),
+        expected_ns,
+    ]
+
+
+@pytest.mark.parametrize("date", INVALID)
+def test_invalid(date):
+    """Time stamps strptime rejects get rejected"""
+
+    with pytest.raises(ValueError):
+        strptime(date)
+    with pytest.raises(ValueError):
+        logs.parse_date(date)
+    with pytest.raises(ValueError):
+        logs.parse_date_ns(date)
+    with pytest.raises(ValueError):
+        logs.parse_dates_ns([VALID[0], date])
+
+
+def test_without_numpy(monkeypatch):
+    """Batches of time stamps convert the same with or without NumPy"""
+
+    dates = VALID * 3
+    expected = logs.parse_dates_ns(dates)
+    monkeypatch.setattr(logs, "numpy", None)
+    assert logs.parse_dates_ns(dates) == expected
@@ -0,0 +1,76 @@
+"""Reading log dumps (scripts/analysis/logs.py)."""
+
+import io
+import json
+
+import pytest
+
+from analysis import logs
+
+LINE = '{"time": "2023-01-01T00:00:01.000000", "pod": "pod-a", "msg": "hello"}\n'
+
+
+@pytest.mark.parametrize("first", ["{}\n", "\n", '{"a":1}\n'])
+@pytest.mark.parametrize("mode", ["binary", "text"])
+def test_short_first_line(first, mode):
+    """Short first lines do not get mistaken for (part of) the chunked magic"""
+
+    data = first + LINE
+    f = io.BytesIO(data.encode()) if mode == "binary" else io.StringIO(data)
+    lines = list(logs.iter_file("dump.json", 0, f))
+    assert lines[-1]["msg"] == "hello"
+    assert len(lines) == (1 if first == "\n" else 2)
+
+
+def test_chunked_dump():
+    """Chunked dumps still get detected"""
+
+    f = io.BytesIO()
+    writer = logs.ChunkedDumpWriter(f, "gzip")
+    line = logs.decode_json_line(LINE)
+    writer.write({**line, "time": logs.parse_date(line["time"])})
+    writer.close()
+    f.seek(0)
+    lines = list(logs.iter_file("dump.jsonz", 0, f))
+    assert [line["msg"] for line in lines] == ["hello"]
+
+
+@pytest.mark.parametrize("chunk_lines", [1, 2, 8192])
+@pytest.mark.parametrize("seekable", [True, False])
+def test_untimed_lines_in_window(chunk_lines, seekable):
+    """Lines without time are part of every window, as with JSON lines"""
+
+    lines = [
+        {"msg": "no time 1"},
+        {"msg": "no time 2"},
+        {"time": "2023-01-01T00:00:01.000000", "msg": "a"},
+        {"time": "2023-01-01T00:00:03.000000", "msg": "b"},
+        {"msg": "no time 3"},
+        {"time": "2023-01-01T00:00:05.000000", "msg": "c"},
+    ]
+    json_data = "".join(json.dumps(line) + "\n" for line in lines)
+    f = io.BytesIO()
+    logs.write_chunked_dump(
+        (
+            {**line, "time": logs.parse_date(line["time"])} if "time" in line else line
+            for line in lines
+        ),
+        f,
+        chunk_lines=chunk_lines,
+    )
+    chunked_data = f.getvalue()
+
+    def read(data, **window):
+        f = io.BytesIO(data)
+        if not seekable:
+            f.seekable = lambda: False
+        return [line["msg"] for line in logs.iter_file("dump", 0, f, **window)]
+
+    for start, end in [(2, None), (None, 4), (2, 4), (6, None)]:
+        window = {
+            "start": start and logs.parse_date(f"2023-01-01T00:00:0{start}.0"),
+            "end": end and logs.parse_date(f"2023-01-01T00:00:0{end}.0"),
+        }
+        expected = read(json_data.encode(), **window)
+        assert read(chunked_data, **window) == expected
+        assert expected[:2] == ["no time 1", "no time 2"]
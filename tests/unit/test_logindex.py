@@ -0,0 +1,47 @@
+"""Random access to log dumps (scripts/analysis/logindex.py)."""
+
+import json
+
+import pytest
+import synthetic_logs
+
+from analysis import logindex, logs, tests
+
+
+def write_dump(path, lines):
+    with open(path, "w") as f:
+        for line in lines:
+            print(json.dumps(line), file=f)
+    return str(path)
+
+
+def check_collect_test(fname):
+    """Checks that collect_test() returns the same as collect_tests()"""
+
+    full = tests.collect_tests(logs.collect_file(fname, 0))
+    with logindex.IndexedDump(fname) as dump:
+        for name in {test["name"] for test in full} | {"test_missing"}:
+            assert dump.collect_test(name) == [
+                test for test in full if test["name"] == name
+            ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("truncate", [False, True])
+def test_collect_test(tmp_path, seed, truncate):
+    """Tests get collected as from the full log"""
+
+    lines = synthetic_logs.make_lines(8, seed, truncate)
+    check_collect_test(write_dump(tmp_path / "dump.json", lines))
+
+
+@pytest.mark.parametrize(
+    "last",
+    ["", "PASSED                                  [100%]", "FAILED (reason) [100%]"],
+)
+def test_collect_test_last_line(tmp_path, last):
+    """Dumps can end on lines that decide about teardowns"""
+
+    lines = synthetic_logs.make_lines(3, 0)[:12]
+    lines.append({**lines[-1], "pod": synthetic_logs.RUNNER, "msg": last})
+    check_collect_test(write_dump(tmp_path / "dump.json", lines))
@@ -0,0 +1,41 @@
+"""Column-oriented log storage (scripts/analysis/logtable.py)."""
+
+import pytest
+
+from analysis import logs, logtable
+
+LINES = [
+    {"pod": "a", "container": "c", "time": "2023-01-01T00:00:00.000001", "msg": "one"},
+    {"pod": "b", "container": "c", "time": "2023-01-01T00:00:01.5", "msg": "two"},
+    {"pod": "a", "container": "c", "time": "2023-01-01T00:00:00.000001", "msg": "one"},
+    {"pod": "a", "msg": "no time", "extra": 1},
+]
+
+
+def test_rows_like_dicts():
+    """Rows read back as the lines that were added"""
+
+    table = logtable.LogTable(LINES)
+    expected = [
+        {**line, "time": logs.parse_date(line["time"])} if "time" in line else line
+        for line in LINES
+    ]
+    assert [dict(row) for row in table] == expected
+    assert table[-1]["extra"] == 1
+    assert "time" not in table[3]
+
+
+def test_rows_compare_by_value():
+    """Rows are views compared by value, not identity"""
+
+    table = logtable.LogTable(LINES)
+    assert table[0] is not table[0]
+    assert table[0] == table[0] == table[2]
+    assert table[0] != table[1]
+    with pytest.raises(TypeError):
+        hash(table[0])
+
+    # So list.remove() drops the first equal row
+    rows = list(table)
+    rows.remove(table[2])
+    assert rows[0].index == 1
@@ -0,0 +1,75 @@
+"""Building reports (scripts/analysis/report.py)."""
+
+import gc
+import json
+import weakref
+
+from analysis import classifiers, logtable, report
+
+
+def make_lines(day):
+    """Lines of a test run with a single failing test"""
+
+    msgs = [
+        "============================= test session starts ==============================",
+        "collected 1 item",
+        "",
+        "tests/integration/test_foo.py::test_bar ",
+        "something went wrong",
+        "FAILED                                  [100%]",
+        "",
+    ]
+    return [
+        {
+            "pod": "makefile-runner-abc",
+            "container": "makefile",
+            "time": f"2023-05-{day:02d}T12:00:{i:02d}.000000",
+            "msg": msg,
+        }
+        for i, msg in enumerate(msgs)
+    ]
+
+
+def test_logs_released():
+    """Logs are not kept alive by the matches noted for them"""
+
+    rep = report.Report(matches_per_clfr_count=2)
+    refs = []
+    for day in range(1, 9):
+        log = logtable.LogTable(make_lines(day))
+        refs.append(weakref.ref(log))
+        assert rep.add_log(f"log-{day}", log)["matches"]
+    del log
+    gc.collect()
+
+    assert len(rep.matches_per_file) == 8
+    assert all(ref() is None for ref in refs)
+
+
+def test_missing_origin(tmp_path, capsys):
+    """Logs that cannot be read again get reported, not shown"""
+
+    fnames = []
+    for day in (1, 2):
+        fname = tmp_path / f"log-{day}.json"
+        with open(fname, "w") as f:
+            for line in make_lines(day):
+                print(json.dumps(line), file=f)
+        fnames.append(str(fname))
+    rep = report.Report()
+    rep.add_files(fnames, 1)
+    rep.build_maps()
+    (tmp_path / "log-1.json").unlink()
+
+    out = tmp_path / "out"
+    out.mkdir()
+    with open(out / "UNKNOWN.rst", "w") as f:
+        rep.make_cfr_report(f, classifiers.UNKNOWN)
+    assert rep.write_logs(out) == 2
+    assert f"Could not read {fnames[0]} again" in capsys.readouterr().out
+
+    cfr_report = (out / "UNKNOWN.rst").read_text()
+    assert f"Log {fnames[0]} could not be read again." in cfr_report
+    assert "tests/integration/test_foo.py::test_bar" in cfr_report
+    assert "Log could not be read!" in (out / "log-0.txt").read_text()
+    assert "something went wrong" in (out / "log-1.txt").read_text()
@@ -0,0 +1,100 @@
+"""Concurrent downloads of logs (Report.add_uris in scripts/analysis/report.py)."""
+
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from analysis import report
+
+
+class RecordingReport(report.Report):
+    """Report noting the names of logs in the order they get added"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.added = []
+
+    def add_log(self, fname, log, source=None, revision=None):
+        self.added.append((fname, source, revision))
+        return super().add_log(fname, log, source, revision)
+
+
+class FakeDownloads:
+    """Stand-in for report._fetch serving canned logs
+
+    :param delays: Seconds to wait before answering, by URI
+    :param failing: URIs to fail downloads for
+    """
+
+    def __init__(self, delays=None, failing=()):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, http, uri):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delays.get(uri, 0.01))
+            if uri in self.failing:
+                raise OSError(f"Could not retrieve {uri}")
+            line = {"pod": "p", "container": "c", "time": "2023-01-01T00:00:00.0", "msg": uri}
+            return uri.rsplit("/", 1)[-1], io.BytesIO(json.dumps(line).encode() + b"\n")
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def add_uris(rep, uris, concurrency):
+    """Runs Report.add_uris, failing instead of hanging"""
+
+    thread = threading.Thread(target=rep.add_uris, args=(uris, concurrency))
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "add_uris did not finish"
+
+
+@pytest.fixture
+def threads_finished():
+    """Checks that no threads are left running afterwards"""
+
+    before = set(threading.enumerate())
+    yield
+    assert set(threading.enumerate()) <= before
+
+
+def test_order_preserved(monkeypatch, threads_finished):
+    """Logs get added in the order URIs are given, however long downloads take"""
+
+    uris = [(f"http://example.com/log-{i}.json", f"rev{i}") for i in range(8)]
+    # Earlier downloads finish last
+    fetch = FakeDownloads({uri: 0.02 * (8 - i) for i, (uri, _) in enumerate(uris)})
+    monkeypatch.setattr(report, "_fetch", fetch)
+
+    rep = RecordingReport()
+    add_uris(rep, uris, 3)
+    assert rep.added == [(f"log-{i}.json", uri, rev) for i, (uri, rev) in enumerate(uris)]
+    assert 1 < fetch.max_active <= 3
+
+
+def test_failing_download(monkeypatch, capsys, threads_finished):
+    """A failed download gets reported and skipped"""
+
+    uris = [(f"http://example.com/log-{i}.json", None) for i in range(5)]
+    monkeypatch.setattr(report, "_fetch", FakeDownloads(failing=[uris[2][0]]))
+
+    rep = RecordingReport()
+    add_uris(rep, uris, 2)
+    assert [name for name, _, _ in rep.added] == [
+        "log-0.json",
+        "log-1.json",
+        "log-3.json",
+        "log-4.json",
+    ]
+    assert "Could not retrieve http://example.com/log-2.json" in capsys.readouterr().err
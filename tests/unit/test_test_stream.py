@@ -0,0 +1,74 @@
+"""Collecting tests while reading logs (TestStream in scripts/analysis/tests.py)."""
+
+from collections.abc import Mapping
+
+import pytest
+import synthetic_logs
+
+from analysis import classifiers, tests
+
+
+def normalise(test):
+    """Replaces views of lines in a test by lists of line identities"""
+
+    def ids(lines):
+        return [id(line) for line in lines]
+
+    return {
+        key: (
+            {title: ids(section) for title, section in value.items()}
+            if isinstance(value, Mapping)
+            else value
+            if isinstance(value, str)
+            else ids(value)
+        )
+        for key, value in test.items()
+    }
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("truncate", [False, True])
+def test_same_as_collect_tests(seed, truncate):
+    """Streamed tests end up the same as collected ones"""
+
+    lines = synthetic_logs.make_lines(10, seed, truncate)
+    expected = [normalise(test) for test in tests.collect_tests(lines)]
+    streamed = list(tests.iter_tests(lines))
+
+    # Every test gets returned once, in order
+    assert len({id(test) for test in streamed}) == len(streamed)
+    assert [normalise(test) for test in streamed] == expected
+
+
+def test_cases_covered():
+    """The logs above cover teardowns, teardown failures and reports"""
+
+    found = set()
+    for seed in range(30):
+        for test in tests.collect_tests(synthetic_logs.make_lines(10, seed)):
+            if "teardown" in test:
+                found.add("naked teardown" if len(test["teardown"]) == 1 else "teardown")
+            found.update(key for key in test if key.endswith("detail"))
+    assert found == {"teardown", "naked teardown", "detail", "teardown_detail"}
+
+
+def test_classify_while_reading():
+    """Tests get classified before all lines have been read"""
+
+    lines = synthetic_logs.make_lines(20, 1)
+    read = 0
+
+    def read_lines():
+        nonlocal read
+        for line in lines:
+            read += 1
+            yield line
+
+    read_at_trigger = [
+        read
+        for _ in classifiers.iter_classify_test_results(tests.iter_tests(read_lines()))
+    ]
+    failures_banner = synthetic_logs.banner("FAILURES", "=")
+    failures = next(i for i, line in enumerate(lines) if line["msg"] == failures_banner)
+    assert read_at_trigger and read_at_trigger[0] < failures
+    assert read == len(lines)